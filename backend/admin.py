@@ -30,6 +30,8 @@ from .models import *
 @admin.register(Activity)
 @admin.register(ActivityTemplate)
 @admin.register(RequestLog)
+@admin.register(Announcement)
+@admin.register(BackgroundTask)
 @admin.register(Recommender)
 @admin.register(SiddataUserRecommender)
 @admin.register(Institute)
@@ -7,17 +7,26 @@ import logging
 import datetime
 import json
 import hashlib
-import io
-
-from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse, HttpResponseServerError, HttpResponseNotFound, JsonResponse
-from django.core.files.images import ImageFile
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, HttpResponseServerError, \
+    HttpResponseNotFound, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.core.files.storage import default_storage
 from django.views.decorators.csrf import csrf_exempt
 
 from recommenders import recommender_functions
-from recommenders.RM_start import RM_start
+from backend import bulk
+from backend import fragment_cache
+from backend import images
 from backend import models
-import settings
+from backend import request_metrics
+from backend import streaming
+from backend import task_queue
 
 
 # Flag for debugging features, if true, origin will not be checked and siddata runs on localhost stud.ip versions
@@ -43,6 +52,92 @@ def preprocess(func):
     return function_wrapper
 
 
+def get_sparse_fieldsets(request):
+    """
+    Parses JSON:API sparse fieldsets, e.g. `fields[Goal]=title,order`, from the URL parameters.
+    :param request: Django request object
+    :return: dict mapping type names to sets of field names or None if no fieldsets are given.
+    """
+    fields = {}
+    for key, value in request.GET.items():
+        if key.startswith("fields[") and key.endswith("]"):
+            fields[key[len("fields["):-1]] = set(field for field in value.split(",") if field)
+    return fields or None
+
+
+def get_include_paths(request, default=True):
+    """
+    Parses the JSON:API include parameter, e.g. `include=activities,activities.resource`.
+    :param request: Django request object
+    :param default: Returned if the parameter is not given.
+    :return: set of include paths or default.
+    """
+    if "include" not in request.GET:
+        return default
+    return set(path for path in request.GET["include"].split(",") if path)
+
+
+def get_since_token(request):
+    """
+    Parses the delta sync parameter `since`, the token returned in meta of a previous response.
+    :param request: Django request object
+    :return: Transaction ID from which on changes are returned, or None if the parameter is not given.
+    """
+    if not request.GET.get("since"):
+        return None
+    since = request.GET["since"]
+    if not since.isdigit():
+        raise ValueError("since is no valid token.")
+    return int(since)
+
+
+def get_page_parameters(request):
+    """
+    Parses the JSON:API keyset pagination parameters `page[size]` and `page[after]`.
+    :param request: Django request object
+    :return: Tuple of the page size, or None if the parameter is not given, and the ID after which the page starts, or
+    None for the first page.
+    """
+    after = request.GET.get("page[after]") or None
+    if after is not None:
+        uuid.UUID(after)
+    if "page[size]" not in request.GET:
+        if after is not None:
+            raise ValueError("page[after] requires page[size].")
+        return None, None
+    size = int(request.GET["page[size]"])
+    if not 0 < size <= getattr(settings, "MAX_PAGE_SIZE", 1000):
+        raise ValueError("page[size] must be between 1 and {}.".format(getattr(settings, "MAX_PAGE_SIZE", 1000)))
+    return size, after
+
+
+def get_next_page_link(request, last_id):
+    """
+    Builds the link to the page following the current one.
+    :param request: Django request object
+    :param last_id: ID of the last object of the current page.
+    :return: Path with the URL parameters of the request and the page[after] parameter set to last_id.
+    """
+    parameters = request.GET.copy()
+    parameters["page[after]"] = str(last_id)
+    return "{}?{}".format(request.path, parameters.urlencode(safe="[]"))
+
+
+def stream_serialized(objects):
+    """
+    Serializes objects to a JSON:API document piece by piece, so that the document does not have to be held in memory.
+    :param objects: Iterable of model instances with a serialize method, e.g. a QuerySet iterator.
+    :return: Generator of strings forming the document {"data": [...]}.
+    """
+    yield '{"data": ['
+    separator = ""
+    for obj in objects:
+        for data in obj.serialize()["data"]:
+            yield separator + json.dumps(data, cls=DjangoJSONEncoder)
+            separator = ","
+    yield ']}'
+
+
 @csrf_exempt
 @preprocess
 def student(request):
@@ -65,10 +160,11 @@ def student(request):
         if created:
             recommender_functions.create_initial_data_for_user(user)
 
-        include_params = request.GET['include'].split(",")
-        data_response = user.serialize(include=include_params)
+        with request_metrics.measure_serialization():
+            include_params = request.GET['include'].split(",")
+            data_response = user.serialize(include=include_params, fields=get_sparse_fieldsets(request))
 
-        return JsonResponse(data_response, safe=False)
+            return JsonResponse(data_response, safe=False)
 
     if request.method == 'DELETE':
 
@@ -110,73 +206,32 @@ def student(request):
                 logging.log("Unknown attribute in student PATCH route: {}".format(attribute))
         user.save()
 
-        for institute_json in studi_json["relationships"]["institutes_brain"]["data"]:
-            institute = models.Institute.objects.get(institute_origin_id=institute_json["id"], origin=origin)
-            institutemembership = models.InstituteMembership.objects.get_or_create(
-                institute=institute,
-                user=user,
-            )[0]
-            institutemembership.share_brain = True
-            institutemembership.save()
-
-        for institute_json in studi_json["relationships"]["institutes_social"]["data"]:
-            institute = models.Institute.objects.get(institute_origin_id=institute_json["id"], origin=origin)
-            institutemembership = models.InstituteMembership.objects.get_or_create(
-                institute=institute,
-                user=user,
-            )[0]
-            institutemembership.share_social = True
-            institutemembership.save()
-
-        # respect rejected permissions
-        for im in models.InstituteMembership.objects.filter(user=user):
-            if im.institute.institute_origin_id not in [
-                institute_json.get('id') for institute_json in studi_json["relationships"]["institutes_brain"]["data"]
-            ]:
-                im.share_brain = False
-                im.save()
-            if im.institute.institute_origin_id not in [
-                institute_json.get('id') for institute_json in studi_json["relationships"]["institutes_social"]["data"]
-            ]:
-                im.share_social = False
-                im.save()
-            if not any([im.share_brain, im.share_social]):
-                # according to data privacy guidelines, if a membership is not shared at all, it should be deleted
-                im.delete()
-
-        for course_json in studi_json["relationships"]["courses_brain"]["data"]:
-            course = models.StudipCourse.objects.get(course_origin_id=course_json["id"], origin=origin)
-            coursemembership = models.CourseMembership.objects.get_or_create(
-                course=course,
-                user=user,
-            )[0]
-            coursemembership.share_brain = True
-            coursemembership.save()
+        relationships = studi_json["relationships"]
+        institute_ids_brain = {i["id"] for i in relationships["institutes_brain"]["data"]}
+        institute_ids_social = {i["id"] for i in relationships["institutes_social"]["data"]}
+        course_ids_brain = {c["id"] for c in relationships["courses_brain"]["data"]}
+        course_ids_social = {c["id"] for c in relationships["courses_social"]["data"]}
+
+        institutes = {
+            institute.institute_origin_id: institute.id for institute in models.Institute.objects.filter(
+                origin=origin, institute_origin_id__in=institute_ids_brain | institute_ids_social).only(
+                "id", "institute_origin_id")
+        }
+        # the submitted courses are looked up among all course types, but memberships refer to Stud.IP courses
+        courses = {}
+        for course_id, course_origin_id, studip_course_id in models.InheritingCourse.objects.filter(
+                origin=origin, course_origin_id__in=course_ids_brain | course_ids_social).values_list(
+                "id", "course_origin_id", "studipcourse"):
+            if studip_course_id is None:
+                logging.warning("Course {} in student PATCH route is no Stud.IP course".format(course_origin_id))
+                continue
+            courses[course_origin_id] = course_id
 
-        for course_json in studi_json["relationships"]["courses_social"]["data"]:
-            course = models.InheritingCourse.objects.get(course_origin_id=course_json["id"], origin=origin)
-            coursemembership = models.CourseMembership.objects.get_or_create(
-                course=course,
-                user=user,
-            )[0]
-            coursemembership.share_social = True
-            coursemembership.save()
-
-        # respect rejected permissions
-        for cm in models.CourseMembership.objects.filter(user=user):
-            if cm.course.course_origin_id not in [
-                course_json.get('id') for course_json in studi_json["relationships"]["courses_brain"]["data"]
-            ]:
-                cm.share_brain = False
-                cm.save()
-            if cm.course.course_origin_id not in [
-                course_json.get('id') for course_json in studi_json["relationships"]["courses_social"]["data"]
-            ]:
-                cm.share_social = False
-                cm.save()
-            if not any([cm.share_brain, cm.share_social]):
-                # according to data privacy guidelines, if a membership is not shared at all, it should be deleted
-                cm.delete()
+        with transaction.atomic():
+            sync_memberships(user, models.InstituteMembership, "institute", institutes,
+                             institute_ids_brain, institute_ids_social)
+            sync_memberships(user, models.CourseMembership, "course", courses,
+                             course_ids_brain, course_ids_social)
 
         return HttpResponse("Die Nutzendendaten wurden gespeichert.")
 
@@ -203,28 +258,33 @@ def recommender(request, recommender_id=None):
         if created:
             recommender_functions.create_initial_data_for_user(user)
 
-        data_response = {}
-        if recommender_id:
-            userrecommender = models.SiddataUserRecommender.objects.get(id=recommender_id)
-            data_response = userrecommender.serialize()
-        else:
-            data_response['data'] = []
-            data_response['included'] = []
-            recommenders = models.SiddataUserRecommender.objects.filter(user=user,
-                                                                        recommender__active=True, ).order_by("recommender__order")
-            for rec in recommenders:
-                r_ser = rec.serialize()
-                data_response['data'] += r_ser['data']
-                for i in r_ser['included']:
-                    if not i in data_response['included']:
-                        data_response['included'].append(i)
-        return JsonResponse(data_response, safe=False)
+        include = get_include_paths(request)
+        fields = get_sparse_fieldsets(request)
+
+        with request_metrics.measure_serialization():
+            data_response = {}
+            if recommender_id:
+                userrecommender = models.SiddataUserRecommender.objects.get(id=recommender_id)
+                data_response = userrecommender.serialize(include=include, fields=fields)
+            else:
+                data_response['data'] = []
+                data_response['included'] = []
+                recommenders = models.SiddataUserRecommender.objects.filter(user=user,
+                                                                            recommender__active=True, ).select_related(
+                    "recommender").order_by("recommender__order")
+                for rec in recommenders:
+                    r_ser = rec.serialize(include=include, fields=fields)
+                    data_response['data'] += r_ser['data']
+                    for i in r_ser.get('included', []):
+                        if not i in data_response['included']:
+                            data_response['included'].append(i)
+            return JsonResponse(data_response, safe=False)
 
     if request.method == 'PATCH':
 
         request_data = json.loads(request.body)
         recommenders = request_data["data"]
-        start_recommender = RM_start()
+        start_recommender = recommender_functions.get_recommender_by_classname("RM_start")
         for recommender in recommenders:
             if recommender["type"] != "Recommender":
                 return HttpResponseServerError("Recommender Object expected. Instead: {}".format(recommender))
@@ -236,7 +296,7 @@ def recommender(request, recommender_id=None):
             if SUR.enabled == False or models.Goal.objects.filter(userrecommender=SUR).exists():
                 continue
             else:
-                recommender_class_object = recommender_functions.create_recommender_by_classname(
+                recommender_class_object = recommender_functions.get_recommender_by_classname(
                     SUR.recommender.classname)
                 recommender_class_object.initialize(SUR.user)
                 # Set teaser activity as done
@@ -264,20 +324,36 @@ def goal(request, goal_id=None):
 
         user = models.SiddataUser.objects.get(origin=origin, user_origin_id=request.GET["user_origin_id"])
 
-        data_response = {}
-        if goal_id:
-            goal = models.Goal.objects.get(id=goal_id)
-            data_response = goal.serialize()
-        else:
-            data_response['data'] = []
-            data_response['included'] = []
-            goals = models.Goal.objects.filter(userrecommender__user=user).order_by("order")
-            for g in goals:
-                g_ser = g.serialize()
-                data_response['data'] += g_ser['data']
-                data_response['included'] += g_ser['included']
+        include = get_include_paths(request)
+        fields = get_sparse_fieldsets(request)
 
-        return JsonResponse(data_response, safe=False)
+        try:
+            since = get_since_token(request)
+        except ValueError as e:
+            return HttpResponseBadRequest(e)
+
+        with request_metrics.measure_serialization():
+            data_response = {}
+            if goal_id:
+                goal = models.Goal.objects.get(id=goal_id)
+                data_response = goal.serialize(include=include, fields=fields)
+            elif since is not None:
+                token = models.get_change_token()
+                data_response = get_goal_changes(user, since, include, fields)
+                data_response['meta']['token'] = token
+            else:
+                token = models.get_change_token()
+                data_response['data'] = []
+                data_response['included'] = []
+                goals = models.Goal.objects.filter(userrecommender__user=user).select_related(
+                    "userrecommender__recommender").order_by("order")
+                for g in goals:
+                    g_ser = g.serialize(include=include, fields=fields)
+                    data_response['data'] += g_ser['data']
+                    data_response['included'] += g_ser.get('included', [])
+                data_response['meta'] = {'token': token}
+
+            return JsonResponse(data_response, safe=False)
 
     elif request.method == 'PATCH':
         request_data = json.loads(request.body)
@@ -334,20 +410,56 @@ def activity(request, activity_id=None):
 
         user = models.SiddataUser.objects.get(origin=origin, user_origin_id=origin_id)
 
-        data_response = {}
-        if activity_id:
-            act_obj = models.Activity.objects.get(id=activity_id)
-            data_response = act_obj.serialize()
-        else:
-            data_response['data'] = []
-            data_response['included'] = []
-            act_objs = models.Activity.objects.filter(goal__user=user)
-            for act in act_objs:
-                a_ser = act.serialize()
-                data_response['data'] += a_ser['data']
-                data_response['included'] += a_ser['included']
+        include = get_include_paths(request)
+        fields = get_sparse_fieldsets(request)
 
-        return JsonResponse(data_response, safe=False)
+        try:
+            since = get_since_token(request)
+        except ValueError as e:
+            return HttpResponseBadRequest(e)
+
+        with request_metrics.measure_serialization():
+            data_response = {}
+            if activity_id:
+                act_obj = models.Activity.objects.select_related(
+                    "goal__userrecommender__recommender", "goal__userrecommender__user",
+                    *models.Activity.SERIALIZATION_RELATED).get(id=activity_id)
+                data_response = act_obj.serialize(include=include, fields=fields)
+            else:
+                token = models.get_change_token()
+                data_response['data'] = []
+                data_response['included'] = []
+                data_response['meta'] = {'token': token}
+                act_objs = models.Activity.objects.filter(goal__userrecommender__user=user).select_related(
+                    "goal__userrecommender__recommender", *models.Activity.SERIALIZATION_RELATED)
+                if since is not None:
+                    # delta sync, activities which are no longer displayed are reported as deleted
+                    act_objs = act_objs.filter(sequence__gte=since)
+                    data_response['meta']['deleted'] = [
+                        tombstone.serialize() for tombstone in
+                        models.Tombstone.objects.filter(user=user, type="Activity", sequence__gte=since)
+                    ]
+                # goals, recommenders and the student are shared by many activities, so they are serialized once
+                # below instead of once per activity
+                goals = {}
+                act_objs = list(act_objs)
+                serialized = models.Activity.serialize_many(act_objs, include=models.Activity.get_own_include(include),
+                                                            fields=fields)
+                for act, a_ser in zip(act_objs, serialized):
+                    if a_ser is None:
+                        if since is not None:
+                            data_response['meta']['deleted'].append({"type": "Activity", "id": act.id})
+                        continue
+                    data_response['data'] += a_ser['data']
+                    data_response['included'] += a_ser.get('included', [])
+                    goals[act.goal_id] = act.goal
+
+                shared = models.Activity.serialize_shared(list(goals.values()), include, fields)
+                for entry in shared:
+                    if entry not in data_response['included']:
+                        data_response['included'].append(entry)
+
+            return JsonResponse(data_response, safe=False)
 
     elif request.method == 'PATCH':
         request_data = json.loads(request.body)
@@ -448,15 +560,20 @@ def activity(request, activity_id=None):
             # Send response to frontend and thereby end function call.
             return HttpResponse("Feedback wurde gespeichert.")
 
-        rm_classname = activity.goal.userrecommender.recommender.classname
-        rm = recommender_functions.create_recommender_by_classname(rm_classname)
-
-        feedback = rm.process_activity(activity=activity)
-
-        recommender_functions.refresh_all_recommenders()
+        if request.GET.get("deferred", str(getattr(settings, "DEFER_ACTIVITY_PROCESSING", False))).lower() == "true":
+            # Changes are persisted, the side effects are executed by a worker. The client can poll the job route.
+            activity.save()
+            task = task_queue.enqueue(
+                "recommenders.recommender_functions.process_activity_task",
+                label=activity.goal.userrecommender.recommender.classname,
+                priority=task_queue.PRIORITY_HIGH,
+                # processing an answer creates goals and activities and sends mails, a retry would repeat them
+                max_attempts=1,
+                activity_id=str(activity.id),
+            )
+            return JsonResponse(task.serialize(), safe=False, status=202)
 
-        if feedback == None or feedback == True:
-            feedback = activity.respond()
+        feedback = recommender_functions.process_activity(activity)
 
         return HttpResponse(feedback)
 
@@ -472,6 +589,98 @@ def activity(request, activity_id=None):
         return HttpResponse("Empfehlung wurde gelöscht.")
 
 
+@csrf_exempt
+@preprocess
+def job(request, job_id=None):
+    """Route that returns the state of a deferred job, e.g. the processing of an activity.
+    """
+    if request.method == 'GET':
+        if job_id:
+            try:
+                task = models.BackgroundTask.objects.get(id=job_id)
+            except (models.BackgroundTask.DoesNotExist, ValidationError):
+                return HttpResponseNotFound("Job with this ID not known.")
+            return JsonResponse(task.serialize(), safe=False)
+
+        # without ID, queue metrics per recommender are returned
+        return JsonResponse({"data": [{
+            "type": "JobMetrics",
+            "id": label,
+            "attributes": metrics,
+        } for label, metrics in task_queue.get_task_metrics().items()]}, safe=False)
+
+
+@csrf_exempt
+@preprocess
+def provisioning(request):
+    """Route that creates users together with their initial data before their first request, e.g. for all students of
+    a semester. Users are created in batches by the workers of the task queue, the response lists the jobs.
+    """
+    logger = logging.getLogger("api_provisioning")
+
+    if request.method == 'POST':
+        try:
+            origin = models.Origin.objects.get_or_create(
+                api_endpoint=request.GET['origin'],
+            )[0]
+            jobs = []
+            batches = streaming.iter_chunks(streaming.iter_entities(request),
+                                            getattr(settings, "PROVISIONING_BATCH_SIZE", 100))
+            for batch in batches:
+                task = task_queue.enqueue(
+                    "recommenders.recommender_functions.provision_users",
+                    label="provision_users",
+                    origin_id=str(origin.id),
+                    user_origin_ids=[entity["id"] for entity in batch if entity["type"] == "SiddataUser"],
+                )
+                jobs += task.serialize()["data"]
+        except Exception as e:
+            logger.error(e)
+            return HttpResponseServerError(e)
+
+        return JsonResponse({"data": jobs}, safe=False, status=202)
+
+
+def metrics(request):
+    """Route that returns request metrics of the answering process in the Prometheus text format. If METRICS_TOKEN is
+    set, it has to be sent as bearer token, e.g. by setting `bearer_token` in the Prometheus scrape config.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token and request.headers.get("Authorization") != "Bearer {}".format(token):
+        return HttpResponse("Invalid token", status=401)
+    return HttpResponse(request_metrics.render_prometheus(), content_type="text/plain; version=0.0.4")
+
+
+@csrf_exempt
+@preprocess
+def cache(request):
+    """Route that returns hit and miss counts of the fragment cache of the answering process.
+    """
+    if request.method == 'GET':
+        return JsonResponse({"data": [{
+            "type": "CacheMetrics",
+            "id": type_name,
+            "attributes": metrics,
+        } for type_name, metrics in fragment_cache.get_metrics().items()]}, safe=False)
+
+
+def person_image(request, image_hash):
+    """Route that returns the thumbnail of a content-addressed person image. As the content of an image never changes,
+    the response may be cached by clients forever. No API key is required, as images are embedded in the plugin.
+    """
+    person = models.Person.objects.filter(image_hash=image_hash).exclude(image=None).only("image").first()
+    if person is None:
+        return HttpResponseNotFound("Bild existiert nicht.")
+    if request.headers.get("If-None-Match") == '"{}"'.format(image_hash):
+        response = HttpResponseNotModified()
+    else:
+        thumbnail = images.get_thumbnail(image_hash, person.image.name)
+        response = FileResponse(default_storage.open(thumbnail), content_type="image/jpeg")
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    response["ETag"] = '"{}"'.format(image_hash)
+    return response
+
+
 @csrf_exempt
 @preprocess
 def coursemembership(request):
@@ -532,78 +741,94 @@ def studycourse(request):
         # handle empty requests
         if not request_data["data"]:
             # according to data privacy guidelines, if a studycourse is not shared at all, it should be deleted
-            for sc in users_scs:
-                sc.delete()
+            users_scs.delete()
             return HttpResponse("Studieninformationen wurden gespeichert.")
 
-        # now handle existing studycourses, which are missing in the submitted data
-        submitted_ids = [entry.get('attributes')['studip_id'] for entry in request_data["data"]]
-        for sc in users_scs:
-            if sc.studycourse_origin_id not in submitted_ids:
-                # according to data privacy guidelines, if a studycourse is not shared at all, it should be deleted
-                sc.delete()
+        share_fields = [
+            "share_subject_brain",
+            "share_subject_social",
+            "share_degree_brain",
+            "share_degree_social",
+            "share_semester_brain",
+            "share_semester_social",
+        ]
+        submitted = {entry["attributes"]["studip_id"]: entry for entry in request_data["data"]}
+
+        # preload all referenced objects with one query per model
+        degrees = {
+            degree.degree_origin_id: degree for degree in models.Degree.objects.filter(
+                origin=origin,
+                degree_origin_id__in=get_relationship_ids(submitted.values(), "degree"))
+        }
+        subjects = {
+            subject.subject_origin_id: subject for subject in models.Subject.objects.filter(
+                origin=origin,
+                subject_origin_id__in=get_relationship_ids(submitted.values(), "subject"))
+        }
+        users = {
+            user.user_origin_id: user for user in models.SiddataUser.objects.filter(
+                origin=origin,
+                user_origin_id__in=get_relationship_ids(submitted.values(), "user"))
+        }
+        existing_scs = {}
+        for sc in models.SiddataUserStudy.objects.filter(studycourse_origin_id__in=submitted.keys()):
+            existing_scs.setdefault(sc.studycourse_origin_id, []).append(sc)
+
+        to_create = []
+        to_update = []
+        to_delete = []
+        for studip_id, entry in submitted.items():
+            attributes = entry["attributes"]
 
-        for entry in request_data["data"]:
+            # handle existing studycourses, which do occur in the submitted data
+            if studip_id in existing_scs:
+                for sc in existing_scs[studip_id]:
+                    for share_field in share_fields:
+                        setattr(sc, share_field, attributes[share_field])
+                    if any(getattr(sc, share_field) for share_field in share_fields):
+                        to_update.append(sc)
+                    else:
+                        # according to data privacy guidelines, if a studycourse is not shared at all, it should be deleted
+                        to_delete.append(sc.id)
+                continue
+
+            # studycourse is new
+            user = users.get(entry["relationships"]["user"]["data"][0]["id"])
+            if user is None:
+                logging.warning("Unknown user in studycourse route: {}".format(entry["relationships"]["user"]))
+                continue
 
-            if entry["attributes"]["share_semester_brain"] == True or entry["attributes"]["share_semester_social"]:
-                semester = entry["attributes"]["semester"]
+            if attributes["share_semester_brain"] or attributes["share_semester_social"]:
+                semester = attributes["semester"]
             else:
                 semester = None
 
-            if entry["attributes"]["share_degree_brain"] or entry["attributes"]["share_degree_social"]:
-                degree = models.Degree.objects.get(degree_origin_id=entry["relationships"]["degree"]["data"][0]["id"],
-                                                   origin=origin)
+            if attributes["share_degree_brain"] or attributes["share_degree_social"]:
+                degree = degrees.get(entry["relationships"]["degree"]["data"][0]["id"])
             else:
                 degree = None
 
-            if entry["attributes"]["share_subject_brain"] == True or entry["attributes"]["share_subject_social"]:
-                subject = models.Subject.objects.get(
-                    subject_origin_id=entry["relationships"]["subject"]["data"][0]["id"], origin=origin)
+            if attributes["share_subject_brain"] or attributes["share_subject_social"]:
+                subject = subjects.get(entry["relationships"]["subject"]["data"][0]["id"])
             else:
                 subject = None
 
-            user = models.SiddataUser.objects.get(user_origin_id=entry["relationships"]["user"]["data"][0]["id"],
-                                                  origin=origin)
-
-            # handle existing studycourses, which do occur in the submitted data
-            existing_scs = models.SiddataUserStudy.objects.filter(
-                studycourse_origin_id=entry["attributes"]["studip_id"])
-            if existing_scs:
-                for sc in existing_scs:
-                    sc.share_subject_brain = entry["attributes"]["share_subject_brain"]
-                    sc.share_subject_social = entry["attributes"]["share_subject_social"]
-                    sc.share_degree_brain = entry["attributes"]["share_degree_brain"]
-                    sc.share_degree_social = entry["attributes"]["share_degree_social"]
-                    sc.share_semester_brain = entry["attributes"]["share_semester_brain"]
-                    sc.share_semester_social = entry["attributes"]["share_semester_social"]
-                    sc.save()
-
-                    if not any([
-                        sc.share_subject_brain,
-                        sc.share_subject_social,
-                        sc.share_degree_brain,
-                        sc.share_degree_social,
-                        sc.share_semester_brain,
-                        sc.share_semester_social
-                    ]):
-                        # according to data privacy guidelines, if a studycourse is not shared at all, it should be deleted
-                        sc.delete()
-            else:
-                # studycourse is new
-                studycourse = models.SiddataUserStudy.objects.get_or_create(
-                    user=user,
-                    degree=degree,
-                    subject=subject,
-                    semester=semester,
-                    studycourse_origin_id=entry["attributes"]["studip_id"],
-                    share_subject_brain=entry["attributes"]["share_subject_brain"],
-                    share_subject_social=entry["attributes"]["share_subject_social"],
-                    share_degree_brain=entry["attributes"]["share_degree_brain"],
-                    share_degree_social=entry["attributes"]["share_degree_social"],
-                    share_semester_brain=entry["attributes"]["share_semester_brain"],
-                    share_semester_social=entry["attributes"]["share_semester_social"],
-                )[0]
-                studycourse.save()
+            to_create.append(models.SiddataUserStudy(
+                user=user,
+                degree=degree,
+                subject=subject,
+                semester=semester,
+                studycourse_origin_id=studip_id,
+                **{share_field: attributes[share_field] for share_field in share_fields},
+            ))
+
+        with transaction.atomic():
+            # existing studycourses, which are missing in the submitted data, are not shared anymore
+            users_scs.exclude(studycourse_origin_id__in=submitted.keys()).delete()
+            models.SiddataUserStudy.objects.bulk_create(to_create)
+            models.SiddataUserStudy.objects.bulk_update(to_update, share_fields)
+            if to_delete:
+                models.SiddataUserStudy.objects.filter(id__in=to_delete).delete()
 
         return HttpResponse("Studieninformationen wurden gespeichert.")
 
@@ -627,26 +852,34 @@ def subject(request):
 
     if request.method == "POST":
         try:
-            request_data = json.loads(request.body)
-            for entity in request_data["data"]:
-                if entity["type"] == "Subject":
+            counts = {"created": 0, "updated": 0, "skipped": 0}
+            for chunk in ingestion_chunks(request):
+                entities = [entity for entity in chunk if entity["type"] == "Subject"]
+                content_hashes = [bulk.get_content_hash(entity) for entity in entities]
+                known_hashes = bulk.get_known_hashes(models.Subject.objects.filter(origin=origin), content_hashes)
+                for entity, content_hash in zip(entities, content_hashes):
                     if models.Subject.is_valid_data(entity):
-                        subject_object = models.Subject.objects.update_or_create(
-                            name=entity["attributes"]["name"],
-                            description=entity["attributes"]["description"],
-                            keywords=entity["attributes"]["keywords"],
+                        if content_hash in known_hashes:
+                            counts["skipped"] += 1
+                            continue
+                        created = models.Subject.objects.update_or_create(
                             origin=origin,
                             subject_origin_id=entity["attributes"]["studip_id"],
-                        )[0]
-                        subject_object.save()
+                            defaults={
+                                "name": entity["attributes"]["name"],
+                                "description": entity["attributes"]["description"],
+                                "keywords": entity["attributes"]["keywords"],
+                                "content_hash": content_hash,
+                            },
+                        )[1]
+                        counts["created" if created else "updated"] += 1
                     else:
                         logger.error("Subject JSON formatting error: {}".format(entity))
-
         except Exception as e:
             logger.error(e)
             return HttpResponseServerError(e)
 
-        return HttpResponse("Studiengang wurde gespeichert.")
+        return ingestion_response("Studiengang wurde gespeichert.", counts)
 
 
 @csrf_exempt
@@ -668,88 +901,17 @@ def course(request, course_origin_id=None):
 
     if request.method == "POST":
         try:
-            request_data = json.loads(request.body)
-            for entity in request_data["data"]:
-                if entity["type"] == "Course":
-                    if not models.StudipCourse.is_valid_data(entity):
-                        logger.error("Invalid Course JSON. {}".format(entity))
-                    else:
-                        date_str = datetime.datetime.fromtimestamp(
-                            entity["attributes"]["start_time"],
-                            datetime.timezone.utc
-                        ).strftime("%a %d.%m%y")
-                        if date_str is None:
-                            date_str = ""
-
-                        place_str = entity["attributes"]["place"] \
-                            if "place" in entity["attributes"].keys() and entity["attributes"][
-                            "place"] is not None else ""
-
-                        rel_inst = None
-                        if 'relationships' in entity.keys() \
-                                and 'institute' in entity['relationships'].keys() \
-                                and entity['relationships']['institute']['data'][0]['id']:
-                            try: rel_inst = models.Institute.objects.get(
-                                    institute_origin_id=entity['relationships']['institute']['data'][0]['id'],
-                                    origin=origin
-                                )
-                            except models.Institute.DoesNotExist as e:
-                                logger.error(e)
-
-                        course_object, created = models.StudipCourse.objects.update_or_create(
-                            identifier=hashlib.sha256(
-                                (str(origin.id) + entity["attributes"]["studip_id"]).encode('utf-8')
-                            ).hexdigest(),
-                            origin=origin,
-                            course_origin_id=entity["attributes"]["studip_id"],
-                            defaults={
-                                "contributor": [],
-                                "coverage": date_str + " " + place_str,
-                                "creator": {},
-                                "date": datetime.datetime.fromtimestamp(entity["attributes"]["start_time"],
-                                                                        datetime.timezone.utc),
-                                "description": entity["attributes"]["description"],
-                                "format": ['CRS'],
-                                "language": "",
-                                "place": entity["attributes"]["place"],
-                                "publisher": origin.name,
-                                "relation": None,
-                                "rights": None,
-                                "start_time": datetime.datetime.fromtimestamp(entity["attributes"]["start_time"],
-                                                                              datetime.timezone.utc),
-                                "end_time": datetime.datetime.fromtimestamp(entity["attributes"]["end_time"],
-                                                                            datetime.timezone.utc),
-                                "start_semester": entity["attributes"]["start_semester"],
-                                "end_semester": entity["attributes"]["end_semester"],
-                                "source": entity["attributes"]["url"],
-                                "subject": [],  # TODO
-                                "title": entity["attributes"]["name"],
-                                "type": ['SIP'],
-                                "institute": rel_inst
-                            },
-                        )
-
-                        if 'relationships' in entity.keys() \
-                                and 'lecturers' in entity['relationships'].keys() \
-                                and entity['relationships']['lecturers']['data']:
-                            for lecturer in entity['relationships']['lecturers']['data']:
-                                try:
-                                    lecturer_object = models.Lecturer.objects.get(origin=origin,
-                                                                                  person_origin_id=lecturer['id'])
-                                    cl, created = models.CourseLecturer.objects.update_or_create(
-                                        course=course_object,
-                                        lecturer=lecturer_object
-                                    )
-                                    cl.save()
-                                except models.Lecturer.DoesNotExist:
-                                    logger.error(
-                                        f"Lecturer from origin {origin.name} with id {lecturer['id']} not found!")
+            counts = {"created": 0, "updated": 0, "skipped": 0}
+            for chunk in ingestion_chunks(request):
+                with transaction.atomic():
+                    for key, value in upsert_studip_courses(origin, chunk, logger).items():
+                        counts[key] += value
 
         except Exception as e:
             logger.error(e)
             return HttpResponseServerError(e)
 
-        return HttpResponse("Kurs wurde gespeichert")
+        return ingestion_response("Kurs wurde gespeichert", counts)
 
     elif request.method == "GET":
         logger.debug("GET course")
@@ -762,7 +924,30 @@ def course(request, course_origin_id=None):
                 return HttpResponseNotFound(e)
         else:
             logger.debug("Only origin course query")
-            courses = models.InheritingCourse.objects.filter(origin=origin)
+            # keyset pagination by id, the origin is joined as it is part of the serialization
+            courses = models.InheritingCourse.objects.filter(origin=origin).select_related("origin").order_by("id")
+            try:
+                page_size, page_after = get_page_parameters(request)
+            except ValueError as e:
+                return HttpResponseBadRequest(e)
+
+            if page_size is None:
+                if request.GET.get("stream", "false").lower() == "true":
+                    return StreamingHttpResponse(
+                        stream_serialized(courses.iterator(chunk_size=getattr(settings, "STREAM_CHUNK_SIZE", 500))),
+                        content_type="application/json",
+                    )
+            else:
+                if page_after:
+                    courses = courses.filter(id__gt=page_after)
+                courses = list(courses[:page_size + 1])
+                response_data = {"data": [], "links": {"next": None}}
+                if len(courses) > page_size:
+                    courses = courses[:page_size]
+                    response_data["links"]["next"] = get_next_page_link(request, courses[-1].id)
+                for c in courses:
+                    response_data["data"] += c.serialize()["data"]
+                return JsonResponse(response_data, safe=False)
 
         response_data = {"data": []}
 
@@ -791,24 +976,33 @@ def degree(request):
 
     if request.method == "POST":
         try:
-            request_data = json.loads(request.body)
-            for entity in request_data["data"]:
-                if entity["type"] == "Degree":
+            counts = {"created": 0, "updated": 0, "skipped": 0}
+            for chunk in ingestion_chunks(request):
+                entities = [entity for entity in chunk if entity["type"] == "Degree"]
+                content_hashes = [bulk.get_content_hash(entity) for entity in entities]
+                known_hashes = bulk.get_known_hashes(models.Degree.objects.filter(origin=origin), content_hashes)
+                for entity, content_hash in zip(entities, content_hashes):
                     if not models.Degree.is_valid_data(entity):
                         logger.error("Invalid Degree JSON. {}".format(entity))
                     else:
-                        degree_object = models.Degree.objects.update_or_create(
-                            name=entity["attributes"]["name"],
-                            description="{}".format(entity["attributes"]["description"]),
+                        if content_hash in known_hashes:
+                            counts["skipped"] += 1
+                            continue
+                        created = models.Degree.objects.update_or_create(
                             origin=origin,
                             degree_origin_id=entity["attributes"]["studip_id"],
-                        )[0]
-                        degree_object.save()
+                            defaults={
+                                "name": entity["attributes"]["name"],
+                                "description": "{}".format(entity["attributes"]["description"]),
+                                "content_hash": content_hash,
+                            },
+                        )[1]
+                        counts["created" if created else "updated"] += 1
         except Exception as e:
             logger.error(e)
             return HttpResponseServerError(e)
 
-        return HttpResponse("Abschluss wurde gespeichert.")
+        return ingestion_response("Abschluss wurde gespeichert.", counts)
 
 
 @csrf_exempt
@@ -834,79 +1028,84 @@ def event(request):
         logger.debug("New event POST request received")
         try:
             logger.debug("Attempting to load body")
-            request_data = json.loads(request.body)
-            for entity in request_data["data"]:
-                if entity["type"] == "Event":
-                    if not models.StudipEvent.is_valid_data(entity):
-                        logger.error("Invalid Event JSON. {}".format(entity))
-                    else:
-                        try:
-                            course_obj = models.StudipCourse.objects.get(
-                                course_origin_id=entity["relationships"]["course"]["data"][0]["id"], origin=origin)
-                        except models.StudipCourse.DoesNotExist:
-                            logger.debug(
-                                "Course not found for ID: " + "\n" + entity['relationships']['course']['data'][0][
-                                    'id'] + " !")
-                            continue
+            counts = {"created": 0, "updated": 0, "skipped": 0}
+            for chunk in ingestion_chunks(request):
+                content_hashes = [bulk.get_content_hash(entity) for entity in chunk]
+                known_hashes = bulk.get_known_hashes(models.StudipEvent.objects.filter(origin=origin), content_hashes)
+                for entity, content_hash in zip(chunk, content_hashes):
+                    if entity["type"] == "Event":
+                        if not models.StudipEvent.is_valid_data(entity):
+                            logger.error("Invalid Event JSON. {}".format(entity))
+                        elif content_hash in known_hashes:
+                            counts["skipped"] += 1
+                        else:
+                            try:
+                                course_obj = models.StudipCourse.objects.get(
+                                    course_origin_id=entity["relationships"]["course"]["data"][0]["id"], origin=origin)
+                            except models.StudipCourse.DoesNotExist:
+                                logger.debug(
+                                    "Course not found for ID: " + "\n" + entity['relationships']['course']['data'][0][
+                                        'id'] + " !")
+                                continue
 
-                        date_str = datetime.datetime.fromtimestamp(
-                            entity["attributes"]["start_time"],
-                            datetime.timezone.utc
-                        ).strftime("%a %d.%m%y")
-                        if date_str is None:
-                            date_str = ""
+                            date_str = datetime.datetime.fromtimestamp(
+                                entity["attributes"]["start_time"],
+                                datetime.timezone.utc
+                            ).strftime("%a %d.%m%y")
+                            if date_str is None:
+                                date_str = ""
 
-                        attr_keys = entity["attributes"].keys()
+                            attr_keys = entity["attributes"].keys()
 
-                        place_str = entity["attributes"]["place"] \
-                            if "place" in attr_keys and entity["attributes"][
-                            "place"] is not None else ""
+                            place_str = entity["attributes"]["place"] \
+                                if "place" in attr_keys and entity["attributes"][
+                                "place"] is not None else ""
 
-                        if "topic_title" in attr_keys and entity["attributes"]["topic_title"] is not None:
-                            title = entity["attributes"]["topic_title"]
-                            if title == 'Ohne Titel':
+                            if "topic_title" in attr_keys and entity["attributes"]["topic_title"] is not None:
+                                title = entity["attributes"]["topic_title"]
+                                if title == 'Ohne Titel':
+                                    continue
+                            else:
                                 continue
-                        else:
-                            continue
-
-                        event_object, created = models.StudipEvent.objects.update_or_create(
-                            identifier=entity["attributes"]["studip_id"],
-                            event_origin_id=entity["attributes"]["studip_id"],
-                            origin=origin,
-                            course=course_obj,
-                            defaults={
-                                "contributor": [],
-                                "coverage": date_str + " " + place_str,
-                                "creator": {},
-                                "date": datetime.datetime.fromtimestamp(entity["attributes"]["start_time"],
-                                                                        datetime.timezone.utc) if "start_time" in attr_keys else None,
-                                "description": entity["attributes"][
-                                    "topic_description"] if "topic_description" in attr_keys else None,
-                                "format": ['CRS'],
-                                "language": "",
-                                "publisher": origin.name,
-                                "relation": None,
-                                "rights": None,
-                                "start_time": datetime.datetime.fromtimestamp(entity["attributes"]["start_time"],
-                                                                              datetime.timezone.utc),
-                                "end_time": datetime.datetime.fromtimestamp(entity["attributes"]["end_time"],
-                                                                            datetime.timezone.utc),
-                                "source": entity["attributes"]["url"] if "url" in attr_keys else None,
-                                "subject": [],  # TODO
-                                "title": title,
-                                "type": ['SIP']
-                            }
-                        )
-                        event_object.save()
-                else:
-                    logger.error("Type error!")
-                    raise TypeError("This data type is not supported: %s" % entity["type"])
 
+                            event_object, created = models.StudipEvent.objects.update_or_create(
+                                identifier=entity["attributes"]["studip_id"],
+                                event_origin_id=entity["attributes"]["studip_id"],
+                                origin=origin,
+                                course=course_obj,
+                                defaults={
+                                    "contributor": [],
+                                    "coverage": date_str + " " + place_str,
+                                    "creator": {},
+                                    "date": datetime.datetime.fromtimestamp(entity["attributes"]["start_time"],
+                                                                            datetime.timezone.utc) if "start_time" in attr_keys else None,
+                                    "description": entity["attributes"][
+                                        "topic_description"] if "topic_description" in attr_keys else None,
+                                    "format": ['CRS'],
+                                    "language": "",
+                                    "publisher": origin.name,
+                                    "relation": None,
+                                    "rights": None,
+                                    "start_time": datetime.datetime.fromtimestamp(entity["attributes"]["start_time"],
+                                                                                  datetime.timezone.utc),
+                                    "end_time": datetime.datetime.fromtimestamp(entity["attributes"]["end_time"],
+                                                                                datetime.timezone.utc),
+                                    "source": entity["attributes"]["url"] if "url" in attr_keys else None,
+                                    "subject": [],  # TODO
+                                    "title": title,
+                                    "type": ['SIP'],
+                                    "content_hash": content_hash,
+                                }
+                            )
+                            counts["created" if created else "updated"] += 1
+                    else:
+                        logger.error("Type error!")
+                        raise TypeError("This data type is not supported: %s" % entity["type"])
         except Exception as e:
             logger.error(e)
             return HttpResponseServerError(e)
 
-        return HttpResponse("Veranstaltung wurde gespeichert.")
+        return ingestion_response("Veranstaltung wurde gespeichert.", counts)
 
 
 @csrf_exempt
@@ -928,30 +1127,41 @@ def institute(request):
 
     if request.method == "POST":
         try:
-            request_data = json.loads(request.body)
-            for entity in request_data["data"]:
-                if entity["type"] == "Institute":
-                    if not models.Institute.is_valid_data(entity):
-                        logger.error("Invalid Institute JSON. {}".format(entity))
+            counts = {"created": 0, "updated": 0, "skipped": 0}
+            n_entities = 0
+            for chunk in ingestion_chunks(request):
+                n_entities += len(chunk)
+                content_hashes = [bulk.get_content_hash(entity) for entity in chunk]
+                known_hashes = bulk.get_known_hashes(models.Institute.objects.filter(origin=origin), content_hashes)
+                for entity, content_hash in zip(chunk, content_hashes):
+                    if entity["type"] == "Institute":
+                        if not models.Institute.is_valid_data(entity):
+                            logger.error("Invalid Institute JSON. {}".format(entity))
+                        else:
+                            if content_hash in known_hashes:
+                                counts["skipped"] += 1
+                                continue
+                            created = models.Institute.objects.update_or_create(
+                                origin=origin,
+                                institute_origin_id=entity["attributes"]["studip_id"],
+                                defaults={
+                                    "name": entity["attributes"]["name"],
+                                    "url": entity["attributes"]["url"],
+                                    "content_hash": content_hash,
+                                },
+                            )[1]
+                            counts["created" if created else "updated"] += 1
                     else:
-                        institute_object = models.Institute.objects.update_or_create(
-                            name=entity["attributes"]["name"],
-                            url=entity["attributes"]["url"],
-                            origin=origin,
-                            institute_origin_id=entity["attributes"]["studip_id"],
-                        )[0]
-                        institute_object.save()
-                else:
-                    logger.error("Type error!")
-                    raise TypeError("This data type is not supported: %s" % entity["type"])
-
-            if len(request_data["data"]) == 0:
+                        logger.error("Type error!")
+                        raise TypeError("This data type is not supported: %s" % entity["type"])
+
+            if n_entities == 0:
                 return HttpResponse("Keine Einrichtung wurde gespeichert.")
         except Exception as e:
             logger.error(e)
             return HttpResponseServerError(e)
 
-        return HttpResponse("Einrichtung wurde gespeichert.")
+        return ingestion_response("Einrichtung wurde gespeichert.", counts)
 
 
 @csrf_exempt
@@ -973,19 +1183,47 @@ def person(request):
 
     if request.method == "POST":
         try:
-            request_data = json.loads(request.body)
-            activity = None
-            if "relationships" in request_data.keys() and "activity" in request_data["relationships"].keys():
-                activity_id = request_data["relationships"]["activity"]["data"][0]["id"]
-                try:
-                    activity = models.Activity.objects.get(id=activity_id)
-                except models.Activity.DoesNotExist:
-                    pass
-            for entity in request_data["data"]:
-                if entity['type'] == 'Person' or entity['type'] == 'Lecturer':
+            counts = {"created": 0, "updated": 0, "skipped": 0}
+            n_entities = 0
+            top_level = {}
+            # the relationships of a document apply to all of its persons, so they have to precede data. A document
+            # with relationships after data is rejected once they are parsed, i.e. before its first chunk is written
+            # if its data fits into one chunk, like every document relating persons to an activity.
+            for chunk in ingestion_chunks(request, top_level):
+                n_entities += len(chunk)
+                activity = None
+                if "relationships" in top_level.keys() and "activity" in top_level["relationships"].keys():
+                    activity_id = top_level["relationships"]["activity"]["data"][0]["id"]
+                    try:
+                        activity = models.Activity.objects.get(id=activity_id)
+                    except models.Activity.DoesNotExist:
+                        pass
+                content_hashes = [bulk.get_content_hash(entity) for entity in chunk]
+                known_hashes = bulk.get_known_hashes(
+                    models.Person.objects.filter(Q(lecturer__origin=origin) | Q(lecturer__isnull=True)), content_hashes)
+                changed = []
+                for entity, content_hash in zip(chunk, content_hashes):
+                    if entity['type'] != 'Person' and entity['type'] != 'Lecturer':
+                        logger.error("Type error!")
+                        raise TypeError("This data type is not supported: %s" % entity["type"])
                     if not models.Person.is_valid_data(entity):
                         logger.error("Invalid Person JSON. {}".format(entity))
+                    elif content_hash in known_hashes and not (entity['type'] == 'Person' and activity is not None):
+                        # persons related to an activity are always updated, as they are not identified by content
+                        counts["skipped"] += 1
                     else:
+                        changed.append((entity, content_hash))
+
+                # images are decoded and validated before anything of the chunk is written, so a rejected image
+                # leaves no image files of the chunk behind
+                image_data = {}
+                for entity, _ in changed:
+                    if entity['attributes'].get('image') is not None:
+                        data = base64.decodebytes(bytes(entity['attributes']['image'], 'utf-8'))
+                        image_data[id(entity)] = (data, images.validate_image(data))
+
+                with transaction.atomic():
+                    for entity, content_hash in changed:
                         attr_keys = entity['attributes'].keys()
 
                         user = None
@@ -1004,26 +1242,19 @@ def person(request):
                             'title': entity['attributes']['title'] if 'title' in attr_keys else None,
                             'url': entity['attributes']['url'] if 'url' in attr_keys else None,
                             'role_description': entity['attributes']['description'] if 'description' in attr_keys else None,
-                            'user': user
+                            'user': user,
+                            'content_hash': content_hash,
                         }
 
                         if 'image' in attr_keys:
-                            person_image = None
-                            if entity['attributes']['image'] is not None:
-                                person_image = ImageFile(
-                                    io.BytesIO(
-                                        base64.decodebytes(
-                                            bytes(
-                                                entity['attributes']['image'],
-                                                'utf-8'
-                                            )
-                                        )
-                                    ),
-                                    name=entity['attributes']['image_name'] if 'image_name' in attr_keys else None
-                                )
-                            defaults['image'] = person_image
+                            # images are stored by content hash, identical images are written only once
+                            defaults['image'] = None
+                            defaults['image_hash'] = None
+                            if id(entity) in image_data:
+                                defaults['image'], defaults['image_hash'] = images.store_image(*image_data[id(entity)])
 
                         person_object = None
+                        created = False
                         if entity['type'] == 'Lecturer' and 'person_origin_id' in attr_keys and entity['attributes']['person_origin_id']:
                             defaults['email'] = entity['attributes']['email'] if 'email' in attr_keys else None
                             person_object, created = models.Lecturer.objects.update_or_create(
@@ -1044,6 +1275,7 @@ def person(request):
                                 )
                         if person_object is not None:
                             person_object.save()
+                            counts["created" if created else "updated"] += 1
 
                             if 'relationships' in entity.keys() \
                                     and entity['type'] == 'Lecturer' \
@@ -1062,16 +1294,289 @@ def person(request):
                                         logger.error(
                                             f"Institute from origin {origin.name} with id {institute['id']} not found!")
 
-                else:
-                    logger.error("Type error!")
-                    raise TypeError("This data type is not supported: %s" % entity["type"])
-            if len(request_data["data"]) == 0:
+            if n_entities == 0:
                 return HttpResponse("Keine Einrichtung wurde gespeichert.")
+        except (streaming.MemberOrderError, images.InvalidImageError) as e:
+            logger.error(e)
+            return HttpResponseBadRequest(e)
         except Exception as e:
             logger.error(e)
             return HttpResponseServerError(e)
 
-        return HttpResponse("Einrichtung wurde gespeichert.")
+        return ingestion_response("Einrichtung wurde gespeichert.", counts)
+
+
+def get_goal_changes(user, since, include, fields):
+    """ Helper function that serializes the goals, activities and goal properties of a user which were changed or
+    deleted after a change token. Unchanged activities and properties of changed goals are not included.
+    @:param user SiddataUser whose objects are returned.
+    @:param since Change token sent by the client.
+    @:param include Include paths of the request, see get_include_paths.
+    @:param fields Sparse fieldsets of the request, see get_sparse_fieldsets.
+    @:return dict with data, included and the resource identifiers of deleted objects in meta.
+    """
+    response_data = {"data": [], "included": [], "meta": {"deleted": []}}
+    deleted = response_data["meta"]["deleted"]
+
+    goal_include = {"recommender"} if models.is_included(include, "recommender") else False
+    goals = models.Goal.objects.filter(userrecommender__user=user, sequence__gte=since).select_related(
+        "userrecommender__recommender").order_by("order")
+    for goal in goals:
+        g_ser = goal.serialize(include=goal_include, fields=fields)
+        response_data["data"] += g_ser["data"]
+        for entry in g_ser.get("included", []):
+            if entry not in response_data["included"]:
+                response_data["included"].append(entry)
+
+    if models.is_included(include, "activities"):
+        activity_include = models.get_sub_include(include, "activities")
+        activities = models.Activity.objects.filter(goal__userrecommender__user=user, sequence__gte=since).select_related(
+            "goal__userrecommender__recommender", *models.Activity.SERIALIZATION_RELATED)
+        goals = {}
+        # hidden activities are not part of their goal anymore
+        visible = [activity for activity in activities if activity.visible]
+        serialized = dict(zip(visible, models.Activity.serialize_many(
+            visible, include=models.Activity.get_own_include(activity_include), fields=fields)))
+        for activity in activities:
+            a_ser = serialized.get(activity)
+            if a_ser is None:
+                deleted.append({"type": "Activity", "id": activity.id})
+                continue
+            goals[activity.goal_id] = activity.goal
+            for entry in a_ser["data"] + a_ser.get("included", []):
+                if entry not in response_data["included"]:
+                    response_data["included"].append(entry)
+        for entry in models.Activity.serialize_shared(list(goals.values()), activity_include, fields):
+            if entry not in response_data["included"]:
+                response_data["included"].append(entry)
+
+    if models.is_included(include, "goalproperties"):
+        for goalproperty in models.GoalProperty.objects.filter(goal__userrecommender__user=user, sequence__gte=since):
+            response_data["included"] += goalproperty.serialize(fields=fields)["data"]
+
+    deleted += [tombstone.serialize() for tombstone in models.Tombstone.objects.filter(user=user, sequence__gte=since)]
+    return response_data
+
+
+def get_course_defaults(entity, origin, institute):
+    """ Helper function that maps a Course JSON object to the field values of a StudipCourse.
+    @:param entity Course JSON object.
+    @:param origin Origin of the course.
+    @:param institute Related Institute object or None.
+    @:return dict mapping field names to values.
+    """
+    start_time = datetime.datetime.fromtimestamp(entity["attributes"]["start_time"], datetime.timezone.utc)
+    date_str = start_time.strftime("%a %d.%m%y")
+    place_str = entity["attributes"]["place"] \
+        if "place" in entity["attributes"].keys() and entity["attributes"]["place"] is not None else ""
+
+    return {
+        "contributor": [],
+        "coverage": date_str + " " + place_str,
+        "creator": {},
+        "date": start_time,
+        "description": entity["attributes"]["description"],
+        "format": ['CRS'],
+        "language": "",
+        "place": entity["attributes"]["place"],
+        "publisher": origin.name,
+        "relation": None,
+        "rights": None,
+        "start_time": start_time,
+        "end_time": datetime.datetime.fromtimestamp(entity["attributes"]["end_time"], datetime.timezone.utc),
+        "start_semester": entity["attributes"]["start_semester"],
+        "end_semester": entity["attributes"]["end_semester"],
+        "source": entity["attributes"]["url"],
+        "subject": [],  # TODO
+        "title": entity["attributes"]["name"],
+        "type": ['SIP'],
+        "institute": institute,
+    }
+
+
+def upsert_studip_courses(origin, entities, logger):
+    """ Helper function that creates or updates StudipCourse objects and their lecturers from a batch of Course JSON
+    objects. Courses whose content hash is already stored are skipped. Institutes, lecturers and existing courses are
+    preloaded with one query each and all changes are written in bulk, table by table of the inheritance chain.
+    Should be called inside a transaction.
+    @:param origin Origin the courses belong to.
+    @:param entities List of JSON objects, objects of other types than "Course" are ignored.
+    @:param logger Logger for invalid entities.
+    @:return dict with the numbers of created, updated and skipped courses.
+    """
+    courses_json = {}
+    content_hashes = {}
+    for entity in entities:
+        if entity["type"] != "Course":
+            continue
+        if not models.StudipCourse.is_valid_data(entity):
+            logger.error("Invalid Course JSON. {}".format(entity))
+            continue
+        identifier = hashlib.sha256((str(origin.id) + entity["attributes"]["studip_id"]).encode('utf-8')).hexdigest()
+        courses_json[identifier] = entity
+        content_hashes[identifier] = bulk.get_content_hash(entity)
+
+    # skip courses which did not change since they were sent the last time
+    known_hashes = bulk.get_known_hashes(models.StudipCourse.objects.filter(origin=origin), content_hashes.values())
+    courses_json = {
+        identifier: entity for identifier, entity in courses_json.items() if content_hashes[identifier] not in known_hashes
+    }
+    skipped = len(content_hashes) - len(courses_json)
+
+    institutes = {
+        institute.institute_origin_id: institute for institute in models.Institute.objects.filter(
+            origin=origin, institute_origin_id__in=get_relationship_ids(courses_json.values(), "institute"))
+    }
+    lecturer_ids = {
+        identifier: [lecturer["id"] for lecturer in entity.get("relationships", {}).get("lecturers", {}).get("data") or []]
+        for identifier, entity in courses_json.items()
+    }
+    lecturers = {
+        lecturer.person_origin_id: lecturer.pk for lecturer in models.Lecturer.objects.filter(
+            origin=origin, person_origin_id__in={i for ids in lecturer_ids.values() for i in ids}).only(
+            "pk", "person_origin_id")
+    }
+    existing_courses = {
+        course.identifier: course for course in models.StudipCourse.objects.filter(identifier__in=courses_json.keys())
+    }
+
+    to_create = []
+    to_update = []
+    for identifier, entity in courses_json.items():
+        # the content hash is only stored if all related objects are known, otherwise the course is processed again
+        # the next time it is sent
+        content_hash = content_hashes[identifier]
+
+        institute = None
+        institute_ids = get_relationship_ids([entity], "institute")
+        if institute_ids:
+            institute_origin_id = institute_ids.pop()
+            institute = institutes.get(institute_origin_id)
+            if institute is None:
+                logger.error("Institute from origin {} with id {} not found!".format(origin.name, institute_origin_id))
+                content_hash = None
+
+        for person_origin_id in lecturer_ids[identifier]:
+            if person_origin_id not in lecturers:
+                logger.error(f"Lecturer from origin {origin.name} with id {person_origin_id} not found!")
+                content_hash = None
+
+        defaults = get_course_defaults(entity, origin, institute)
+        defaults["content_hash"] = content_hash
+        course_object = existing_courses.get(identifier)
+        if course_object is None:
+            course_object = models.StudipCourse(
+                identifier=identifier,
+                origin=origin,
+                course_origin_id=entity["attributes"]["studip_id"],
+                **defaults,
+            )
+            to_create.append(course_object)
+        else:
+            for field, value in defaults.items():
+                setattr(course_object, field, value)
+            to_update.append(course_object)
+        existing_courses[identifier] = course_object
+
+    bulk.bulk_create_inherited(to_create)
+    if to_update:
+        bulk.bulk_update_inherited(to_update, list(defaults.keys()))
+
+    existing_pairs = set(models.CourseLecturer.objects.filter(
+        course_id__in=[existing_courses[identifier].pk for identifier in lecturer_ids if lecturer_ids[identifier]]
+    ).values_list("course_id", "lecturer_id"))
+
+    new_course_lecturers = []
+    for identifier, person_origin_ids in lecturer_ids.items():
+        course_pk = existing_courses[identifier].pk
+        for person_origin_id in person_origin_ids:
+            if person_origin_id in lecturers and (course_pk, lecturers[person_origin_id]) not in existing_pairs:
+                existing_pairs.add((course_pk, lecturers[person_origin_id]))
+                new_course_lecturers.append(models.CourseLecturer(course_id=course_pk,
+                                                                  lecturer_id=lecturers[person_origin_id]))
+    models.CourseLecturer.objects.bulk_create(new_course_lecturers, batch_size=1000)
+
+    return {"created": len(to_create), "updated": len(to_update), "skipped": skipped}
+
+
+def ingestion_chunks(request, top_level=None):
+    """ Helper function that parses the body of an ingestion request incrementally.
+    @:param request Django request object, containing a JSON:API document or NDJSON.
+    @:param top_level Optional dict, which is filled with the top-level members of a JSON:API document.
+    @:return Generator of lists of at most INGESTION_CHUNK_SIZE JSON objects.
+    """
+    return streaming.iter_chunks(streaming.iter_entities(request, top_level),
+                                 getattr(settings, "INGESTION_CHUNK_SIZE", 500))
+
+
+def ingestion_response(message, counts):
+    """ Helper function that builds the response of the ingestion routes.
+    @:param message Human readable message.
+    @:param counts dict with the numbers of created, updated and skipped objects.
+    @:return JsonResponse object
+    """
+    return JsonResponse({"meta": dict(message=message, **counts)})
+
+
+def get_relationship_ids(entries, relationship):
+    """ Helper function that collects the IDs of the first related object of a relationship in several entries.
+    @:param entries Iterable of JSON:API resource objects.
+    @:param relationship Name of the relationship.
+    @:return Set of IDs.
+    """
+    ids = set()
+    for entry in entries:
+        data = entry.get("relationships", {}).get(relationship, {}).get("data")
+        if data and data[0]["id"]:
+            ids.add(data[0]["id"])
+    return ids
+
+
+def sync_memberships(user, membership_model, target_field, target_ids, brain_ids, social_ids):
+    """ Helper function that synchronizes the course or institute memberships of a user with the submitted sharing
+    permissions. Memberships are created, updated and deleted in bulk.
+    According to data privacy guidelines, a membership which is not shared at all is deleted.
+    @:param user SiddataUser whose memberships are synchronized.
+    @:param membership_model CourseMembership or InstituteMembership.
+    @:param target_field Name of the foreign key of the membership model, i.e. "course" or "institute".
+    @:param target_ids dict mapping origin IDs to primary keys of the courses or institutes.
+    @:param brain_ids Set of origin IDs which the user shares for analysis purposes.
+    @:param social_ids Set of origin IDs which the user shares with other users.
+    """
+    target_id_field = "{}_id".format(target_field)
+
+    shares = {}
+    for origin_id in brain_ids | social_ids:
+        if origin_id not in target_ids:
+            logging.warning("Unknown {} in student PATCH route: {}".format(target_field, origin_id))
+            continue
+        shares[target_ids[origin_id]] = (origin_id in brain_ids, origin_id in social_ids)
+
+    to_update = []
+    to_delete = []
+    existing = set()
+    for membership in membership_model.objects.filter(user=user):
+        target_id = getattr(membership, target_id_field)
+        if target_id not in shares or target_id in existing:
+            # not shared anymore or duplicate
+            to_delete.append(membership.id)
+            continue
+        existing.add(target_id)
+        share_brain, share_social = shares[target_id]
+        if membership.share_brain != share_brain or membership.share_social != share_social:
+            membership.share_brain = share_brain
+            membership.share_social = share_social
+            to_update.append(membership)
+
+    to_create = [
+        membership_model(user=user, share_brain=share_brain, share_social=share_social, **{target_id_field: target_id})
+        for target_id, (share_brain, share_social) in shares.items() if target_id not in existing
+    ]
+
+    membership_model.objects.bulk_create(to_create)
+    membership_model.objects.bulk_update(to_update, ["share_brain", "share_social"])
+    if to_delete:
+        membership_model.objects.filter(id__in=to_delete).delete()
 
 
 @preprocess
@@ -0,0 +1,92 @@
+"""
+Helpers for the bulk ingestion of data sent by clients.
+
+Django's `bulk_create` refuses multi-table inherited models, e.g. StudipCourse -> InheritingCourse ->
+EducationalResource, and `bulk_update` only writes the table of the model it is called on. `bulk_create_inherited`
+and `bulk_update_inherited` write each table of the inheritance chain with one statement per batch instead.
+
+Content hashes of the ingested JSON objects are stored with the rows, so that clients re-sending unchanged objects
+only cost one hash lookup per batch.
+"""
+import hashlib
+import json
+
+from django.db import router
+
+
+def get_inheritance_chain(model):
+    """
+    Returns the concrete models of an inheritance chain, starting with the root model.
+    :param model: Model class.
+    :return: List of model classes, e.g. [EducationalResource, InheritingCourse, StudipCourse].
+    """
+    chain = [model]
+    while chain[0]._meta.parents:
+        chain.insert(0, next(iter(chain[0]._meta.parents)))
+    return chain
+
+
+def bulk_create_inherited(objs, batch_size=1000):
+    """
+    Inserts instances of a multi-table inherited model with one INSERT per table and batch.
+    The primary keys have to be set before, which is the case for the UUID primary keys used in this project.
+    :param objs: List of unsaved instances of the same model.
+    :param batch_size: Number of rows per INSERT statement.
+    :return: objs
+    """
+    if not objs:
+        return objs
+
+    chain = get_inheritance_chain(type(objs[0]))
+    for obj in objs:
+        # point the parent links to the root primary key, as Model._save_parents would do
+        for child in chain[1:]:
+            for parent_link in child._meta.parents.values():
+                setattr(obj, parent_link.attname, getattr(obj, chain[0]._meta.pk.attname))
+        obj._state.adding = False
+
+    using = router.db_for_write(chain[-1])
+    for model in chain:
+        fields = [field for field in model._meta.local_concrete_fields]
+        for start in range(0, len(objs), batch_size):
+            model._base_manager.using(using)._insert(objs[start:start + batch_size], fields=fields, using=using)
+        for obj in objs:
+            obj._state.db = using
+
+    return objs
+
+
+def bulk_update_inherited(objs, fields, batch_size=1000):
+    """
+    Updates fields of instances of a multi-table inherited model with one UPDATE per table and batch.
+    :param objs: List of saved instances of the same model.
+    :param fields: Names of the fields to update, may belong to any table of the inheritance chain.
+    :param batch_size: Number of rows per UPDATE statement.
+    """
+    if not objs:
+        return
+
+    for model in get_inheritance_chain(type(objs[0])):
+        local_fields = [field.name for field in model._meta.local_concrete_fields if field.name in fields]
+        if local_fields:
+            model._base_manager.bulk_update(objs, local_fields, batch_size=batch_size)
+
+
+def get_content_hash(entity):
+    """
+    Computes a hash of a JSON object that does not depend on the order of keys or on whitespace.
+    :param entity: JSON-ready dict, e.g. a JSON:API resource object sent by a client.
+    :return: Hex digest string of length 64.
+    """
+    canonical = json.dumps(entity, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def get_known_hashes(queryset, hashes):
+    """
+    Looks up which of the given content hashes are already stored, with one query.
+    :param queryset: QuerySet of a model with a content_hash field, e.g. restricted to an origin.
+    :param hashes: Iterable of content hashes.
+    :return: Set of the content hashes which are stored.
+    """
+    return set(queryset.filter(content_hash__in=set(hashes)).values_list("content_hash", flat=True))
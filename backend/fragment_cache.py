@@ -0,0 +1,132 @@
+"""
+Cache for serialized JSON:API fragments of goals and activities.
+
+A fragment is the serialized form of a single object. Its cache key contains the object ID and the object's `version`,
+which is incremented on every save. A changed object is therefore looked up under a new key and recomputed, while the
+fragments of all unchanged objects are reused when a compound response is assembled.
+
+Fragments are stored in the Django cache named by `settings.FRAGMENT_CACHE` (default "fragments"), falling back to the
+default cache if no such cache is configured. A response reads the fragments it needs with one `get_many()` per goal
+and writes the missing ones with one `set_many()`, see `get_or_build_many()`. The backend must not cost a round trip per
+key, so the default is an in-process memory cache; a memcached or Redis cache may be configured to share fragments
+between processes. A database cache would add several queries per request. Hits and misses are counted per process and
+can be read with `get_metrics()`.
+"""
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the cache used to store fragments.
+    :return: Django cache instance.
+    """
+    try:
+        return caches[getattr(settings, "FRAGMENT_CACHE", "fragments")]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+def get_signature(*args):
+    """
+    Computes a short, order-independent signature of serialization options, e.g. sparse fieldsets or include flags.
+    :param args: JSON-serializable values, sets are sorted before hashing.
+    :return: Hex digest string.
+    """
+    def normalize(value):
+        if isinstance(value, (set, frozenset, list, tuple)):
+            return sorted(normalize(v) for v in value)
+        if isinstance(value, dict):
+            return {str(k): normalize(v) for k, v in value.items()}
+        return value
+
+    encoded = json.dumps([normalize(arg) for arg in args], sort_keys=True, default=str)
+    return hashlib.md5(encoded.encode("utf-8")).hexdigest()
+
+
+def get_key(type_name, object_id, version, signature):
+    """
+    Builds the cache key of a fragment.
+    :param type_name: JSON:API type of the object, e.g. "Activity".
+    :param object_id: ID of the object.
+    :param version: Version of the object, or a tuple of versions if the fragment depends on several objects.
+    :param signature: Signature of the serialization options.
+    :return: Cache key string.
+    """
+    if isinstance(version, (tuple, list)):
+        version = ".".join(str(v) for v in version)
+    return "fragment:{}:{}:{}:{}".format(type_name, object_id, version, signature)
+
+
+def get_or_build(type_name, object_id, version, signature, build):
+    """
+    Returns a cached fragment or builds and stores it on a miss.
+    :param type_name: JSON:API type of the object.
+    :param object_id: ID of the object.
+    :param version: Version of the object (see get_key).
+    :param signature: Signature of the serialization options.
+    :param build: Callable without arguments which computes the fragment.
+    :return: The fragment.
+    """
+    return get_or_build_many([(type_name, object_id, version, signature, build)])[0]
+
+
+def get_or_build_many(requests):
+    """
+    Returns several fragments, which are read from the cache with one lookup. The missing fragments are built and stored
+    with one write.
+    :param requests: List of (type_name, object_id, version, signature, build) tuples, see get_or_build.
+    :return: List of the fragments in the order of the requests.
+    """
+    if not requests:
+        return []
+    cache = get_cache()
+    keys = [get_key(type_name, object_id, version, signature)
+            for type_name, object_id, version, signature, _ in requests]
+    cached = cache.get_many(keys)
+    fragments = []
+    missing = {}
+    for key, (type_name, _, _, _, build) in zip(keys, requests):
+        fragment = cached.get(key, missing.get(key))
+        record(type_name, hit=fragment is not None)
+        if fragment is None:
+            fragment = missing[key] = build()
+        fragments.append(fragment)
+    if missing:
+        cache.set_many(missing, getattr(settings, "FRAGMENT_CACHE_TIMEOUT", 3600))
+    return fragments
+
+
+def record(type_name, hit):
+    """
+    Counts a cache hit or miss for a fragment type.
+    :param type_name: JSON:API type of the object.
+    :param hit: True for a hit, False for a miss.
+    """
+    with _metrics_lock:
+        counts = _metrics.setdefault(type_name, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+
+def get_metrics():
+    """
+    Returns hit and miss counts of the current process.
+    :return: dict mapping fragment types to dicts with hits, misses and hit_rate.
+    """
+    with _metrics_lock:
+        metrics = {}
+        for type_name, counts in _metrics.items():
+            total = counts["hits"] + counts["misses"]
+            metrics[type_name] = {
+                "hits": counts["hits"],
+                "misses": counts["misses"],
+                "hit_rate": counts["hits"] / total if total else None,
+            }
+        return metrics
@@ -0,0 +1,110 @@
+"""
+Content-addressed storage of person images.
+
+Images are stored under the SHA-256 hash of their content, so an image uploaded several times, e.g. the photo of a
+lecturer on every sync, is written only once. For every image a thumbnail sized for the activity cards of the Stud.IP
+plugin is generated once. As the content behind a hash never changes, thumbnails can be cached by clients forever.
+"""
+import hashlib
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+IMAGE_DIR = "images"
+THUMBNAIL_DIR = "images/thumbnails"
+IMAGE_FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+
+
+class InvalidImageError(ValueError):
+    """Raised if uploaded data is no image of a supported format or exceeds the configured size."""
+
+
+def get_image_name(image_hash, extension):
+    """
+    Returns the storage name of an image.
+    :param image_hash: SHA-256 hex digest of the image content.
+    :param extension: File extension including the dot, e.g. ".jpg".
+    :return: Name relative to MEDIA_ROOT.
+    """
+    return "{}/{}{}".format(IMAGE_DIR, image_hash, extension)
+
+
+def get_thumbnail_name(image_hash):
+    """
+    Returns the storage name of the thumbnail of an image.
+    :param image_hash: SHA-256 hex digest of the image content.
+    :return: Name relative to MEDIA_ROOT.
+    """
+    return "{}/{}.jpg".format(THUMBNAIL_DIR, image_hash)
+
+
+def store_image(data, image_format=None):
+    """
+    Stores an image under the hash of its content and generates its thumbnail, unless both already exist.
+    :param data: Image file content as bytes.
+    :param image_format: Format returned by validate_image, if data was already validated.
+    :return: Tuple of the storage name of the image and its hash.
+    :raises InvalidImageError: if data is no valid image or it is too large.
+    """
+    if image_format is None:
+        image_format = validate_image(data)
+    image_hash = hashlib.sha256(data).hexdigest()
+    extension = ".jpg" if image_format == "JPEG" else ".{}".format(image_format.lower())
+    name = get_image_name(image_hash, extension)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    get_thumbnail(image_hash, name)
+    return name, image_hash
+
+
+def validate_image(data):
+    """
+    Checks that data is a complete image of a supported format within the configured file size and pixel count. The
+    pixel count is checked before the image is decoded, so decompression bombs are rejected without being loaded.
+    :param data: Image file content as bytes.
+    :return: Format of the image as named by Pillow, e.g. "JPEG".
+    :raises InvalidImageError: if data is no valid image or it is too large.
+    """
+    max_bytes = getattr(settings, "PERSON_IMAGE_MAX_BYTES", 5 * 1024 * 1024)
+    if len(data) > max_bytes:
+        raise InvalidImageError("Image has {} bytes, at most {} are allowed.".format(len(data), max_bytes))
+    max_pixels = getattr(settings, "PERSON_IMAGE_MAX_PIXELS", 4096 * 4096)
+    try:
+        image = Image.open(io.BytesIO(data), formats=IMAGE_FORMATS)
+        width, height = image.size
+        if width * height > max_pixels:
+            raise InvalidImageError("Image has {}x{} pixels, at most {} are allowed.".format(width, height, max_pixels))
+        image.load()
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise InvalidImageError("Invalid image: {}".format(e)) from e
+    return image.format
+
+
+def get_thumbnail(image_hash, image_name):
+    """
+    Returns the thumbnail of an image, it is generated if it does not exist yet.
+    :param image_hash: SHA-256 hex digest of the image content.
+    :param image_name: Storage name of the full-size image.
+    :return: Storage name of the thumbnail.
+    """
+    name = get_thumbnail_name(image_hash)
+    if default_storage.exists(name):
+        return name
+
+    with default_storage.open(image_name) as image_file:
+        image = Image.open(image_file)
+        image.thumbnail(getattr(settings, "PERSON_THUMBNAIL_SIZE", (240, 240)))
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha channel, transparent areas become white
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=85, optimize=True)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
@@ -0,0 +1,128 @@
+"""
+Benchmarks the parsing of OAI-PMH ListRecords pages with LOM metadata, comparing the streaming ListRecordsParser
+with the previous path of parsing each page into a tree and mapping each record with map_lom_to_dc.
+
+The pages are read from a directory of recorded pages, which can be filled from a repository with --record, or
+generated synthetically (see backend.synthetic.get_lom_page).
+"""
+
+import glob
+import os
+import random
+import time
+import xml.etree.ElementTree as ET
+
+from django.core.management.base import BaseCommand, CommandError
+from sickle import Sickle
+from sickle.iterator import OAIResponseIterator
+
+from backend import synthetic
+from scheduled_tasks import educational_resource_functions as erf
+
+
+def parse_tree(raw):
+    """
+    Parses a page like the harvester did before the streaming parser.
+    :param raw: XML of the page.
+    :return: List of tuples of OAI identifier, datestamp, whether the record is deleted and the Dublin Core dict.
+    """
+    records = []
+    root = ET.fromstring(raw)
+    for record in root.findall("oai:ListRecords/oai:record", erf.OAI_NAMESPACES):
+        header = record.find("oai:header", erf.OAI_NAMESPACES)
+        deleted = header.get("status") == "deleted"
+        records.append((
+            header.findtext("oai:identifier", namespaces=erf.OAI_NAMESPACES),
+            header.findtext("oai:datestamp", namespaces=erf.OAI_NAMESPACES),
+            deleted,
+            None if deleted else erf.map_lom_to_dc(record.find(".//lom:lom", erf.OAI_NAMESPACES), erf.OAI_NAMESPACES),
+        ))
+    return records
+
+
+def parse_stream(raw):
+    """
+    Parses a page with the streaming parser.
+    :param raw: XML of the page.
+    :return: List of tuples like parse_tree.
+    """
+    return list(erf.ListRecordsParser(raw))
+
+
+def record_pages(url, directory, max_pages):
+    """
+    Stores the ListRecords pages of a repository as files page-00000.xml, page-00001.xml, ...
+    :param url: URL of the OAI-PMH endpoint.
+    :param directory: Target directory.
+    :param max_pages: Maximal number of pages.
+    :return: Number of stored pages.
+    """
+    os.makedirs(directory, exist_ok=True)
+    n_pages = 0
+    for response in Sickle(url, iterator=OAIResponseIterator).ListRecords(metadataPrefix="lom"):
+        with open(os.path.join(directory, "page-{:05d}.xml".format(n_pages)), "w", encoding="utf-8") as page_file:
+            page_file.write(response.raw)
+        n_pages += 1
+        if n_pages >= max_pages:
+            break
+    return n_pages
+
+
+class Command(BaseCommand):
+    help = "Compares the streaming LOM parser with tree parsing on a recorded or synthetic harvest."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", help="Directory of recorded ListRecords pages. Without it, pages are generated.")
+        parser.add_argument("--record", metavar="URL",
+                            help="Records the pages of this OAI-PMH endpoint into the --pages directory first.")
+        parser.add_argument("--max-pages", type=int, default=100, help="Maximal number of recorded pages.")
+        parser.add_argument("--records", type=int, default=10000, help="Number of generated records.")
+        parser.add_argument("--page-size", type=int, default=100, help="Number of generated records per page.")
+        parser.add_argument("--creators", type=int, default=200,
+                            help="Number of distinct creators of the generated records.")
+        parser.add_argument("--repeat", type=int, default=3, help="Number of runs, the fastest one is reported.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random choices.")
+
+    def handle(self, *args, **options):
+        if options["record"]:
+            if not options["pages"]:
+                raise CommandError("--record requires --pages.")
+            n_pages = record_pages(options["record"], options["pages"], options["max_pages"])
+            self.stdout.write("Recorded {} pages.".format(n_pages))
+
+        if options["pages"]:
+            pages = []
+            for path in sorted(glob.glob(os.path.join(options["pages"], "*.xml"))):
+                with open(path, encoding="utf-8") as page_file:
+                    pages.append(page_file.read())
+            if not pages:
+                raise CommandError("No pages found in {}.".format(options["pages"]))
+        else:
+            rng = random.Random(options["seed"])
+            page_size = options["page_size"]
+            pages = [synthetic.get_lom_page(rng, start, min(page_size, options["records"] - start), options["creators"],
+                                            resumption_token="page{}".format(start))
+                     for start in range(0, options["records"], page_size)]
+
+        timings = {}
+        results = {}
+        for name, parse in [("tree", parse_tree), ("stream", parse_stream)]:
+            durations = []
+            for _ in range(max(1, options["repeat"])):
+                # every run starts with a cold vCard cache
+                erf.get_name_from_vcard.cache_clear()
+                start = time.perf_counter()
+                results[name] = [record for raw in pages for record in parse(raw)]
+                durations.append(time.perf_counter() - start)
+            timings[name] = min(durations)
+
+        n_records = len(results["tree"])
+        mismatches = sum(1 for tree, stream in zip(results["tree"], results["stream"]) if tree != stream)
+        mismatches += abs(n_records - len(results["stream"]))
+        for name, duration in timings.items():
+            self.stdout.write("{:<7} {:>8.3f}s {:>10.0f} records/s".format(
+                name, duration, n_records / duration if duration else 0.0))
+        self.stdout.write("{} pages, {} records, speedup {:.1f}x, {} mismatching records".format(
+            len(pages), n_records, timings["tree"] / timings["stream"] if timings["stream"] else 0.0, mismatches))
+        info = erf.get_name_from_vcard.cache_info()
+        self.stdout.write("vCard cache: {} hits, {} misses".format(info.hits, info.misses))
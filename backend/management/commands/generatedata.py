@@ -0,0 +1,55 @@
+"""
+Fills the database with a synthetic population for load tests and benchmarks (see backend.synthetic and the loadtest
+command). Running the command again with the same options only adds what is missing.
+"""
+
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend import synthetic
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Generates origins with synthetic users, courses, events and OERs labeled by a fake SidBERT."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--origins", type=int, default=1, help="Number of origins.")
+        parser.add_argument("--users", type=int, default=1000, help="Number of users per origin.")
+        parser.add_argument("--courses", type=int, default=2000, help="Number of Stud.IP courses per origin.")
+        parser.add_argument("--events", type=int, default=5000, help="Number of Stud.IP events per origin.")
+        parser.add_argument("--oers", type=int, default=2000, help="Number of OERs per origin.")
+        parser.add_argument("--institutes", type=int, default=20, help="Number of institutes per origin.")
+        parser.add_argument("--memberships", type=int, default=8, help="Number of course memberships per user.")
+        parser.add_argument("--recommender-share", type=float, default=0.3,
+                            help="Probability of a user having enabled a recommender besides the start recommender.")
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "PROVISIONING_BATCH_SIZE", 100),
+                            help="Number of users created in one transaction.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random choices.")
+
+    def handle(self, *args, **options):
+        start_time = time.perf_counter()
+        for index in range(options["origins"]):
+            # one generator per origin, so the population of an origin does not depend on the number of origins
+            rng = random.Random("{}-{}".format(options["seed"], index))
+            origin = synthetic.get_origin(index)
+
+            institute_origin_ids = synthetic.create_institutes(origin, options["institutes"])
+            counts = {
+                "courses": synthetic.create_courses(origin, rng, options["courses"], institute_origin_ids),
+                "events": synthetic.create_events(origin, rng, options["events"]),
+                "oers": synthetic.create_oers(origin, rng, options["oers"]),
+                "labels": synthetic.label_resources(origin),
+                "users": synthetic.create_users(origin, options["users"], options["batch_size"]),
+                "memberships": synthetic.create_memberships(origin, rng, options["memberships"]),
+                "recommenders": synthetic.enable_recommenders(origin, rng, options["recommender_share"]),
+            }
+            self.stdout.write("Origin {} (api_key {}): {}".format(origin.api_endpoint, origin.api_key, ", ".join(
+                "{} {}".format(count, name) for name, count in counts.items())))
+
+        self.stdout.write("Generated data in {:.1f}s.".format(time.perf_counter() - start_time))
@@ -0,0 +1,212 @@
+"""
+Load driver for a running backend. Replays a mix of the calls the Stud.IP plugin makes for the synthetic users of an
+origin (see the generatedata command) at a fixed concurrency and reports throughput and latency percentiles per route.
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from backend import models
+from backend import synthetic
+
+logger = logging.getLogger(__name__)
+
+#: Default share of the routes in the mix, roughly as observed at semester start.
+DEFAULT_MIX = "student=40,recommender=30,activity=25,course=5"
+
+
+def parse_mix(mix):
+    """
+    Parses a mix of routes, e.g. "student=40,recommender=30".
+    :param mix: Comma-separated route=weight pairs.
+    :return: dict mapping route names to weights.
+    """
+    weights = {}
+    for pair in mix.split(","):
+        route, _, weight = pair.partition("=")
+        if route.strip() not in LoadDriver.ROUTES:
+            raise CommandError("Unknown route {} in mix, known routes: {}".format(
+                route, ", ".join(LoadDriver.ROUTES)))
+        weights[route.strip()] = float(weight)
+    return weights
+
+
+class LoadDriver:
+    """
+    Sends requests from several threads until a number of requests or a time limit is reached.
+    """
+
+    ROUTES = ["student", "recommender", "activity", "course"]
+
+    def __init__(self, url, origin, activities, weights, course_count, course_batch_size, seed):
+        """
+        :param url: Base URL of the backend, e.g. http://localhost:8000.
+        :param origin: Origin of the synthetic users.
+        :param activities: dict mapping user_origin_ids to lists of activity IDs of the user.
+        :param weights: dict mapping route names to weights, see parse_mix.
+        :param course_count: Number of courses of the origin, course POSTs resend some of them.
+        :param course_batch_size: Number of courses per course POST.
+        :param seed: Seed of the random choices.
+        """
+        self.url = url.rstrip("/")
+        self.origin = origin
+        self.activities = activities
+        self.user_origin_ids = sorted(activities)
+        self.routes = list(weights)
+        self.weights = [weights[route] for route in self.routes]
+        self.course_count = course_count
+        self.course_batch_size = course_batch_size
+        self.seed = seed
+        self.results = []
+        self.lock = threading.Lock()
+        self.sent = 0
+
+    def get_params(self, **params):
+        params.update(origin=self.origin.api_endpoint, api_key=self.origin.api_key)
+        return params
+
+    def send(self, session, rng, route):
+        """
+        Sends one request of a route for a random user.
+        :return: HTTP status code.
+        """
+        user_origin_id = rng.choice(self.user_origin_ids)
+        if route == "student":
+            response = session.get(self.url + "/api/student", params=self.get_params(
+                user_origin_id=user_origin_id, include="recommenders"))
+        elif route == "recommender":
+            response = session.get(self.url + "/api/recommender", params=self.get_params(
+                user_origin_id=user_origin_id))
+        elif route == "activity":
+            activity_id = rng.choice(self.activities[user_origin_id])
+            payload = {"data": {"type": "Activity", "id": activity_id,
+                                "attributes": {"feedback_value": rng.randint(1, 5)}}}
+            response = session.patch(self.url + "/api/activity/{}".format(activity_id), params=self.get_params(),
+                                     data=json.dumps(payload), headers={"Content-Type": "application/json"})
+        else:
+            # the course cronjob resends a window of the catalogue with a few changed titles
+            start = rng.randrange(max(1, self.course_count - self.course_batch_size + 1))
+            payload = {"data": synthetic.get_course_entities(rng, start, self.course_batch_size, [])}
+            response = session.post(self.url + "/api/course", params=self.get_params(), data=json.dumps(payload),
+                                     headers={"Content-Type": "application/json"})
+        return response.status_code
+
+    def run_worker(self, index, n_requests, deadline):
+        rng = random.Random("{}-{}".format(self.seed, index))
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                with self.lock:
+                    if self.sent >= n_requests:
+                        return
+                    self.sent += 1
+                route = rng.choices(self.routes, self.weights)[0]
+                start = time.perf_counter()
+                try:
+                    status = self.send(session, rng, route)
+                except requests.RequestException as e:
+                    logger.warning("{} request failed: {}".format(route, e))
+                    status = None
+                duration = time.perf_counter() - start
+                with self.lock:
+                    self.results.append((route, status, duration))
+
+    def run(self, concurrency, n_requests, duration):
+        """
+        Runs the load test.
+        :param concurrency: Number of threads sending requests.
+        :param n_requests: Total number of requests.
+        :param duration: Time limit in seconds.
+        :return: Elapsed time in seconds.
+        """
+        deadline = time.monotonic() + duration
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for future in [executor.submit(self.run_worker, i, n_requests, deadline) for i in range(concurrency)]:
+                future.result()
+        return time.perf_counter() - start
+
+    def get_report(self, elapsed):
+        """
+        Aggregates the results per route.
+        :param elapsed: Elapsed time of the run in seconds.
+        :return: dict mapping route names (and "all") to dicts of count, errors, throughput and percentiles in ms.
+        """
+        report = {}
+        for route in self.routes + ["all"]:
+            results = [result for result in self.results if route in ("all", result[0])]
+            durations = sorted(duration * 1000 for _, _, duration in results)
+            report[route] = {
+                "count": len(results),
+                "errors": len([status for _, status, _ in results if status is None or status >= 400]),
+                "throughput": len(results) / elapsed if elapsed else 0.0,
+                "p50": synthetic.percentile(durations, 50),
+                "p95": synthetic.percentile(durations, 95),
+                "p99": synthetic.percentile(durations, 99),
+            }
+        return report
+
+
+class Command(BaseCommand):
+    help = "Sends a mix of plugin requests to a running backend and reports throughput and latency per route."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the backend.")
+        parser.add_argument("--origin", default=synthetic.ORIGIN_PREFIX + "0",
+                            help="api_endpoint of the origin whose synthetic users are simulated.")
+        parser.add_argument("--concurrency", type=int, default=16, help="Number of concurrent clients.")
+        parser.add_argument("--requests", type=int, default=2000, help="Total number of requests.")
+        parser.add_argument("--duration", type=float, default=600, help="Time limit in seconds.")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help="Weights of the routes, e.g. " + DEFAULT_MIX)
+        parser.add_argument("--users", type=int, default=500, help="Number of distinct users sending requests.")
+        parser.add_argument("--course-batch-size", type=int, default=100, help="Number of courses per course POST.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random choices.")
+        parser.add_argument("--output", help="Optional file the report is written to as JSON.")
+
+    def handle(self, *args, **options):
+        try:
+            origin = models.Origin.objects.get(api_endpoint=options["origin"])
+        except models.Origin.DoesNotExist:
+            raise CommandError("Origin {} not known, run generatedata first.".format(options["origin"]))
+
+        user_origin_ids = list(models.SiddataUser.objects.filter(origin=origin).order_by(
+            "user_origin_id").values_list("user_origin_id", flat=True)[:options["users"]])
+        activities = {user_origin_id: [] for user_origin_id in user_origin_ids}
+        for user_origin_id, activity_id in models.Activity.objects.filter(
+                goal__userrecommender__user__origin=origin, goal__userrecommender__user__user_origin_id__in=user_origin_ids,
+                visible=True).values_list("goal__userrecommender__user__user_origin_id", "id"):
+            activities[user_origin_id].append(str(activity_id))
+        activities = {user_origin_id: ids for user_origin_id, ids in activities.items() if ids}
+        if not activities:
+            raise CommandError("Origin {} has no users with activities.".format(options["origin"]))
+
+        driver = LoadDriver(
+            url=options["url"],
+            origin=origin,
+            activities=activities,
+            weights=parse_mix(options["mix"]),
+            course_count=models.StudipCourse.objects.filter(origin=origin).count(),
+            course_batch_size=options["course_batch_size"],
+            seed=options["seed"],
+        )
+        elapsed = driver.run(options["concurrency"], options["requests"], options["duration"])
+        report = driver.get_report(elapsed)
+
+        self.stdout.write("{:<12} {:>7} {:>7} {:>9} {:>9} {:>9} {:>9}".format(
+            "route", "count", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+        for route, row in report.items():
+            self.stdout.write("{:<12} {:>7} {:>7} {:>9.1f} {:>9} {:>9} {:>9}".format(
+                route, row["count"], row["errors"], row["throughput"],
+                *("-" if row[p] is None else "{:.1f}".format(row[p]) for p in ["p50", "p95", "p99"])))
+
+        if options["output"]:
+            with open(options["output"], "w") as output_file:
+                json.dump({"options": {key: options[key] for key in [
+                    "url", "origin", "concurrency", "requests", "duration", "mix", "users", "seed"]},
+                    "elapsed": elapsed, "routes": report}, output_file, indent=2)
@@ -0,0 +1,73 @@
+"""
+Creates users together with their initial data before their first request, e.g. for all students of a semester.
+The users are created in batches, each in one transaction, by several processes in parallel.
+"""
+
+import logging
+import multiprocessing
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from backend import models
+from recommenders import recommender_functions
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+def provision_batch(args):
+    """
+    Creates the users of one batch in a worker process.
+    :param args: Tuple of the origin ID and the list of user_origin_ids.
+    :return: Number of created users
+    """
+    origin_id, user_origin_ids = args
+    return recommender_functions.provision_users(origin_id, user_origin_ids)
+
+
+def close_connections():
+    """Closes the database connections inherited from the parent process, every worker opens its own."""
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Creates missing users of an origin together with their initial data, e.g. at semester start."
+
+    def add_arguments(self, parser):
+        parser.add_argument("origin", help="api_endpoint of the origin of the users.")
+        parser.add_argument("file", nargs="?", default="-",
+                            help="File with one user_origin_id per line, - reads from standard input.")
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "PROVISIONING_BATCH_SIZE", 100),
+                            help="Number of users created in one transaction.")
+        parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                            help="Number of parallel worker processes.")
+
+    def handle(self, *args, **options):
+        try:
+            origin = models.Origin.objects.get(api_endpoint=options["origin"])
+        except models.Origin.DoesNotExist:
+            raise CommandError("Origin {} not known.".format(options["origin"]))
+
+        stream = sys.stdin if options["file"] == "-" else open(options["file"])
+        with stream:
+            user_origin_ids = list(dict.fromkeys(line.strip() for line in stream if line.strip()))
+
+        batch_size = options["batch_size"]
+        batches = [(str(origin.id), user_origin_ids[start:start + batch_size])
+                   for start in range(0, len(user_origin_ids), batch_size)]
+
+        start_time = time.perf_counter()
+        created = 0
+        # the workers are forked, they inherit the recommender registry but must not share the database connection
+        recommender_functions.get_active_recommenders()
+        close_connections()
+        with multiprocessing.Pool(processes=max(1, options["processes"]), initializer=close_connections) as pool:
+            for n_created in pool.imap_unordered(provision_batch, batches):
+                created += n_created
+                logger.info("{} users created".format(created))
+
+        self.stdout.write("Created {} of {} users in {:.1f}s.".format(
+            created, len(user_origin_ids), time.perf_counter() - start_time))
@@ -23,7 +23,10 @@ class Command(BaseCommand):
                 for query_set in update_list:
                     for query_object in query_set:
                         query_object.ddc_code = None
+                        query_object.ddc_labeled = None
                         query_object.save()
+                # the interests of RM_professions are classified again by its cron function
+                models.InterestState.objects.update(ddc_label=None)
                 self.stdout.write('Successfully deleted DDC codes from all backend resources :)')
             except CommandError:
                 raise CommandError('Error deleting DDC codes.')
@@ -2,34 +2,42 @@
 Using this command, you can manually run the scheduler, as specified in https://github.com/jcass77/django-apscheduler#quick-start.
 Note that when running the Siddata-Backend either productivly or using manage.py, you DONT NEED TO RUN THIS, as the `backend.apps.BackendConfig`
 (backend.apps.BackendConfig) ensures that a Background-Scheduler is run whenever the main backend is run.
+Like the scheduler of the backend processes, the jobs only run while this process holds the scheduler lease (see
+scheduled_tasks.leader), so several instances of this command or the backend processes never run the jobs in parallel.
 """
 
 import logging
 
 from django.conf import settings
 
-from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.schedulers.background import BackgroundScheduler
 from django.core.management.base import BaseCommand
 from django_apscheduler.jobstores import DjangoJobStore
 
+from scheduled_tasks import leader
+
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
     help = "Runs apscheduler per command (also gets auto-started thanks to the backend-app-config!)"
 
     def handle(self, *args, **options):
-        scheduler = BlockingScheduler(settings.SCHEDULER_CONFIG, timezone=settings.TIME_ZONE)
+        scheduler = BackgroundScheduler(settings.SCHEDULER_CONFIG, timezone=settings.TIME_ZONE)
         try:
             scheduler.add_jobstore(DjangoJobStore(), "default")
         except ValueError:
             pass
-        from scheduled_tasks.db_tasks import add_jobs
-        add_jobs(scheduler)
+        from scheduled_tasks.scheduler import pause_jobs, run_jobs
 
+        election = leader.LeaderElection(leader.SCHEDULER_LEASE, on_elected=lambda: run_jobs(scheduler),
+                                         on_deposed=lambda: pause_jobs(scheduler))
         try:
-            logger.info("Starting scheduler...")
-            scheduler.start()
+            logger.info("Waiting for the scheduler lease...")
+            # the election loop runs in the main thread, the jobs in the threads of the scheduler
+            election.run()
         except KeyboardInterrupt:
             logger.info("Stopping scheduler...")
-            scheduler.shutdown()
-            logger.info("Scheduler shut down successfully!")
\ No newline at end of file
+            election.stop()
+            if scheduler.running:
+                scheduler.shutdown()
+            logger.info("Scheduler shut down successfully!")
@@ -0,0 +1,152 @@
+"""
+Runs a worker which executes the tasks of the database-backed task queue (see backend.task_queue).
+The worker claims tasks and executes them in a pool of processes, so CPU-bound tasks do not compete for the GIL.
+Several workers may run in parallel, e.g. on different hosts, each task is only executed once.
+"""
+
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, connections
+
+from backend import models
+from backend import task_queue
+from recommenders import recommender_functions
+
+logger = logging.getLogger(__name__)
+
+# Queue on which the processes of the pool report which task they started, set by init_process
+_started = None
+
+
+def execute_task(task_id):
+    """
+    Executes a claimed task in a worker process.
+    :param task_id: ID of the BackgroundTask.
+    :return: True if the task succeeded, else False.
+    """
+    if _started is not None:
+        _started.put((task_id, os.getpid()))
+    return task_queue.run_task(models.BackgroundTask.objects.get(id=task_id))
+
+
+def close_connections():
+    """Closes the database connections inherited from the parent process, every worker opens its own."""
+    connections.close_all()
+
+
+def init_process(started):
+    """
+    Initializes a process of the pool.
+    :param started: multiprocessing.Queue on which the process reports the IDs of the tasks it starts with its PID.
+    """
+    global _started
+    _started = started
+    close_connections()
+
+
+def is_process_alive(pid):
+    """
+    Checks if a process exists.
+    :param pid: Process ID.
+    :return: False if there is no process with the ID.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Command(BaseCommand):
+    help = "Executes queued background tasks, e.g. deferred side effects of activity PATCH requests and scheduled jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sleep", type=float, default=1.0,
+                            help="Seconds to wait before polling again if the queue is empty.")
+        parser.add_argument("--once", action="store_true",
+                            help="Exit as soon as the queue is empty.")
+        parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(),
+                            help="Number of tasks executed in parallel. With 0, tasks are executed one after another "
+                                 "in the worker process itself.")
+
+    def handle(self, *args, **options):
+        logger.info("Starting worker...")
+        try:
+            if options["processes"] > 0:
+                self.run_pool(options["processes"], options["sleep"], options["once"])
+            else:
+                self.run_inline(options["sleep"], options["once"])
+        except KeyboardInterrupt:
+            logger.info("Worker stopped.")
+
+    def run_inline(self, sleep, once):
+        """Executes the tasks in this process. The visibility timeout has to exceed the longest task then."""
+        while True:
+            task = task_queue.claim_next_task()
+            if task is None:
+                if once:
+                    break
+                time.sleep(sleep)
+                continue
+            logger.debug("Running task {} ({})".format(task.id, task.function))
+            task_queue.run_task(task)
+
+    def run_pool(self, processes, sleep, once):
+        """
+        Claims tasks as long as a process of the pool is idle and extends the claims of the running tasks about three
+        times per visibility timeout. The pool replaces a process which dies, e.g. killed for using too much memory,
+        but the result of its task never becomes ready. Such a task is given up, so its claim expires and it is
+        started again or marked as failed by claim_next_task.
+        """
+        heartbeat_interval = task_queue.get_visibility_timeout().total_seconds() / 3
+        # the workers are forked, they inherit the recommender registry but must not share the database connection
+        recommender_functions.get_active_recommenders()
+        close_connections()
+        running = {}
+        pids = {}
+        started = multiprocessing.Queue()
+        last_heartbeat = time.monotonic()
+        with multiprocessing.Pool(processes=processes, initializer=init_process, initargs=(started,)) as pool:
+            while True:
+                try:
+                    while True:
+                        try:
+                            task_id, pid = started.get_nowait()
+                        except queue.Empty:
+                            break
+                        if task_id in running:
+                            pids[task_id] = pid
+                    for task_id in [task_id for task_id, result in running.items() if result.ready()]:
+                        pids.pop(task_id, None)
+                        if not running.pop(task_id).successful():
+                            logger.error("Worker process of task {} failed".format(task_id))
+                    for task_id in [task_id for task_id, pid in pids.items() if not is_process_alive(pid)]:
+                        logger.error("Worker process of task {} died, the task is started again once its claim "
+                                     "expired".format(task_id))
+                        running.pop(task_id)
+                        pids.pop(task_id)
+
+                    if running and time.monotonic() - last_heartbeat >= heartbeat_interval:
+                        task_queue.extend_visibility(list(running))
+                        last_heartbeat = time.monotonic()
+
+                    task = task_queue.claim_next_task() if len(running) < processes else None
+                except DatabaseError:
+                    logger.exception("Could not reach the database")
+                    connection.close()
+                    task = None
+
+                if task is not None:
+                    logger.debug("Running task {} ({})".format(task.id, task.function))
+                    running[task.id] = pool.apply_async(execute_task, (task.id,))
+                    continue
+                if once and not running:
+                    break
+                time.sleep(sleep if len(running) < processes else min(sleep, 0.1))
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_alter_educationalresource_language'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Announcement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=256)),
+                ('description', models.TextField(null=True)),
+                ('type', models.CharField(default='todo', max_length=64)),
+                ('color_theme', models.CharField(default='green', max_length=64, null=True)),
+                ('image', models.CharField(default='sid.png', max_length=256, null=True)),
+                ('feedback_size', models.IntegerField(default=0)),
+                ('active', models.BooleanField(default=True)),
+                ('mkdate', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
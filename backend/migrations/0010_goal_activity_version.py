@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_backgroundtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='goal',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
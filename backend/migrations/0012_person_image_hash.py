@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='image_hash',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+    ]
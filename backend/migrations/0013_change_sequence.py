@@ -0,0 +1,79 @@
+import backend.models
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_person_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goal',
+            name='sequence',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='goalproperty',
+            name='sequence',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='sequence',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            [
+                "UPDATE backend_goal SET sequence = txid_current()",
+                "UPDATE backend_goalproperty SET sequence = txid_current()",
+                "UPDATE backend_activity SET sequence = txid_current()",
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='goal',
+            name='sequence',
+            field=models.BigIntegerField(default=backend.models.NextChange, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='goalproperty',
+            name='sequence',
+            field=models.BigIntegerField(default=backend.models.NextChange, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='sequence',
+            field=models.BigIntegerField(default=backend.models.NextChange, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(fields=['userrecommender', 'sequence'], name='goal_changes'),
+        ),
+        migrations.AddIndex(
+            model_name='goalproperty',
+            index=models.Index(fields=['goal', 'sequence'], name='goalproperty_changes'),
+        ),
+        migrations.AddIndex(
+            model_name='activity',
+            index=models.Index(fields=['goal', 'sequence'], name='activity_changes'),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('type', models.CharField(max_length=64)),
+                ('object_id', models.UUIDField()),
+                ('sequence', models.BigIntegerField(default=backend.models.NextChange, editable=False)),
+                ('makedate', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='backend.siddatauser')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'sequence'], name='tombstone_changes'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_change_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestlog',
+            name='method',
+            field=models.CharField(max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='origin',
+            field=models.CharField(max_length=256, null=True),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='status',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='duration',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='query_count',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='db_time',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='requestlog',
+            name='serialization_time',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_requestlog_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lease',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('holder', models.CharField(default='', max_length=256)),
+                ('acquired', models.DateTimeField(null=True)),
+                ('renewed', models.DateTimeField(null=True)),
+                ('expires', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_backgroundtask_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='educationalresource',
+            name='oai_identifier',
+            field=models.CharField(db_index=True, max_length=1024, null=True),
+        ),
+        migrations.CreateModel(
+            name='HarvestState',
+            fields=[
+                ('origin', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='backend.origin')),
+                ('datestamp', models.CharField(max_length=32, null=True)),
+                ('resumption_token', models.TextField(null=True)),
+                ('harvest_from', models.CharField(max_length=32, null=True)),
+                ('harvest_datestamp', models.CharField(max_length=32, null=True)),
+                ('completed', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_harveststate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='educationalresource',
+            name='ddc_labeled',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='InterestState',
+            fields=[
+                ('goal', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='interest_state', serialize=False, to='backend.goal')),
+                ('interest', models.TextField()),
+                ('ddc_label', models.CharField(db_index=True, max_length=32, null=True)),
+                ('filter_tags', models.JSONField(default=list)),
+                ('watermark', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
@@ -3,14 +3,162 @@ import logging
 import uuid
 
 from django.contrib.postgres.fields import ArrayField
-from django.db import models
+from django.db import connection, models, transaction
 from django.core.mail import send_mail
 from django.db.models import JSONField
 from languages.fields import LanguageField
 from model_utils import Choices
 
 import settings
-import recommenders
+from backend import fragment_cache
+
+
+def is_included(include, path):
+    """
+    Checks if the related objects of a relationship are requested by a JSON:API include parameter.
+    :param include: True or False to include all or no related objects, or a set of include paths, e.g.
+    {"activities", "activities.resource"}.
+    :param path: Name of the relationship.
+    :return: Boolean
+    """
+    if include is True:
+        return True
+    if not include:
+        return False
+    return any(p == path or p.startswith(path + ".") for p in include)
+
+
+def get_sub_include(include, path):
+    """
+    Returns the include parameter for the objects of a relationship, e.g. {"resource"} for the path "activities" and
+    the include paths {"activities.resource"}.
+    :param include: True, False or a set of include paths.
+    :param path: Name of the relationship.
+    :return: True, False or a set of include paths.
+    """
+    if include is True or not include:
+        return include
+    prefix = path + "."
+    return {p[len(prefix):] for p in include if p.startswith(prefix)}
+
+
+def is_field_requested(fields, type_name, field):
+    """
+    Checks if an attribute or relationship is requested by JSON:API sparse fieldsets.
+    :param fields: dict mapping type names to sets of field names, e.g. {"Goal": {"title"}}. None requests all fields.
+    :param type_name: JSON:API type of the serialized object.
+    :param field: Name of the attribute or relationship.
+    :return: Boolean
+    """
+    return not fields or type_name not in fields or field in fields[type_name]
+
+
+def get_requested_attributes(fields, type_name, attribute_getters):
+    """
+    Evaluates only the attribute getters which are requested by JSON:API sparse fieldsets.
+    :param fields: dict mapping type names to sets of field names or None.
+    :param type_name: JSON:API type of the serialized object.
+    :param attribute_getters: dict mapping attribute names to functions returning the attribute value.
+    :return: dict with attribute values.
+    """
+    return {
+        name: getter() for name, getter in attribute_getters.items() if is_field_requested(fields, type_name, name)
+    }
+
+
+def increment_version(instance, save_kwargs):
+    """
+    Increments the version field of a model instance that is about to be saved. Versions of existing rows are
+    incremented in the database, so that a stale instance never writes a version that was already used.
+    :param instance: Goal or Activity instance.
+    :param save_kwargs: The keyword arguments passed to save(), update_fields is extended by the version field.
+    """
+    if instance._state.adding:
+        instance.version += 1
+    else:
+        instance.version = models.F("version") + 1
+    if save_kwargs.get("update_fields") is not None:
+        save_kwargs["update_fields"] = set(save_kwargs["update_fields"]) | {"version"}
+
+
+class NextChange(models.Func):
+    """
+    Database expression numbering a change by the ID of the writing transaction. Used as default and on every save of
+    models with a sequence field. Unlike a sequence, transaction IDs allow to tell which changes may still be uncommitted,
+    see get_change_token.
+    """
+    template = "txid_current()"
+    output_field = models.BigIntegerField()
+
+
+def get_change_token():
+    """
+    Returns a token of the oldest transaction ID whose changes may not be visible yet. All changes with a lower number
+    are committed, changes with this number or higher may still be committed later, so clients passing the token as
+    `since` receive every change numbered with it or higher. Changes committed before the token was read may thus be
+    sent twice, but none is lost.
+    :return: str, the transaction ID.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return str(cursor.fetchone()[0])
+
+
+def assign_sequence(instance, save_kwargs):
+    """
+    Numbers the change of a model instance that is about to be saved by the current transaction.
+    :param instance: Goal, Activity or GoalProperty instance.
+    :param save_kwargs: The keyword arguments passed to save(), update_fields is extended by the sequence field.
+    """
+    instance.sequence = NextChange()
+    if save_kwargs.get("update_fields") is not None:
+        save_kwargs["update_fields"] = set(save_kwargs["update_fields"]) | {"sequence"}
+
+
+def defer_expressions(instance, field_names):
+    """
+    Defers fields which were saved as database expressions, e.g. F("version") + 1 or NextChange(), so that their values
+    are only loaded from the database when they are accessed.
+    :param instance: Saved model instance.
+    :param field_names: Names of the fields which may hold expressions.
+    """
+    for name in field_names:
+        if hasattr(instance.__dict__.get(name), "resolve_expression"):
+            del instance.__dict__[name]
+
+
+class ChangeQuerySet(models.QuerySet):
+    """
+    QuerySet of goals, activities or goal properties whose bulk changes are recorded like those made by save() and
+    delete(). Updates increment the versions and number the change, deletions leave tombstones for clients syncing
+    changes, see Tombstone.record. Both increment the versions of the goals of changed activities and properties, which
+    invalidates their cached fragments.
+    """
+
+    def bump_goal_versions(self):
+        """Increments the versions of the goals of the objects in this QuerySet, with one UPDATE."""
+        if self.model in (Activity, GoalProperty):
+            Goal.objects.filter(id__in=self.values("goal_id")).update(version=models.F("version") + 1,
+                                                                      sequence=NextChange())
+
+    def update(self, **kwargs):
+        """Increments the versions and numbers the change in the same UPDATE."""
+        field_names = {field.name for field in self.model._meta.concrete_fields}
+        if "version" in field_names:
+            kwargs.setdefault("version", models.F("version") + 1)
+        if "sequence" in field_names:
+            kwargs.setdefault("sequence", NextChange())
+        with transaction.atomic():
+            # before the update, which may change whether the objects match the filters of this QuerySet
+            self.bump_goal_versions()
+            return super().update(**kwargs)
+
+    def delete(self):
+        """Records the tombstones and deletes the objects in one transaction."""
+        with transaction.atomic():
+            Tombstone.record(self)
+            self.bump_goal_versions()
+            return super().delete()
 
 
 class Origin(models.Model):
@@ -49,6 +197,8 @@ class Degree(models.Model):
     origin = models.ForeignKey(Origin, on_delete=models.CASCADE)
     #: The ID of the degree in the origin's database.
     degree_origin_id = models.CharField(max_length=256)
+    #: SHA-256 hash of the last ingested JSON representation, used to skip unchanged entities.
+    content_hash = models.CharField(max_length=64, null=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -120,6 +270,8 @@ class Subject(models.Model):
     subject_origin_id = models.CharField(max_length=128)
     #: Subject ID from the German Federal Office of Statistics (Statistisches Bundesamt).
     destatis_subject_id = models.IntegerField(default=0)
+    #: SHA-256 hash of the last ingested JSON representation, used to skip unchanged entities.
+    content_hash = models.CharField(max_length=64, null=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -177,49 +329,59 @@ class SiddataUser(models.Model):
         """String representation of a SiddataUser object."""
         return "SiddataUser {} {}".format(self.id, self.origin.name)
 
-    def serialize(self, include=[]):
+    def serialize(self, include=[], fields=None):
         """
         Converts SiddataUser instance to nested structure that can be transformed to JSON. Follows REST API standards at
         https://jsonapi.org.
-        :param include: List of fields to include in the response.
+        :param include: List of fields to include in the response. "recommenders" includes the recommenders with all
+        related objects, include paths like "recommenders.goals" restrict the included objects.
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
         :return: data Dictionary with nested data.
         """
 
         recommenders = []
         included = []
-        userrecommenders = SiddataUserRecommender.objects.filter(user=self,
-                                                                 recommender__active=True).order_by("recommender__order")
-        for userrecommender in userrecommenders:
-            recommenders.append({"id": userrecommender.id, "type": "Recommender"})
-            if 'recommenders' in include:
-                r_ser = userrecommender.serialize()
-                for entry in r_ser["data"] + r_ser["included"]:
-                    if entry not in included:
-                        included.append(entry)
+        include_recommenders = is_included(set(include), "recommenders")
+        if include_recommenders or is_field_requested(fields, "SiddataUser", "recommenders"):
+            # a plain "recommenders" includes everything related to the recommenders
+            recommender_include = get_sub_include(set(include), "recommenders") or True
+            userrecommenders = SiddataUserRecommender.objects.filter(
+                user=self,
+                recommender__active=True,
+            ).select_related("recommender").order_by("recommender__order")
+            for userrecommender in userrecommenders:
+                recommenders.append({"id": userrecommender.id, "type": "Recommender"})
+                if include_recommenders:
+                    r_ser = userrecommender.serialize(include=recommender_include, fields=fields)
+                    for entry in r_ser["data"] + r_ser["included"]:
+                        if entry not in included:
+                            included.append(entry)
+
+        relationships = {}
+        if is_field_requested(fields, "SiddataUser", "recommenders"):
+            relationships["recommenders"] = {
+                "data": recommenders
+            }
 
         response_data = {
             "data": [{
                 "type": "SiddataUser",
                 "id": self.id,
-                "attributes": {
-                    "origin": self.origin.name,
-                    "user_origin_id": self.user_origin_id,
-                    "data_donation": self.data_donation,
-                    "gender_brain": self.gender_brain,
-                    "gender_social": self.gender_social,
-                },
-                "relationships": {
-                    "recommenders": {
-                        "data": recommenders
-                    }
-                }
+                "attributes": get_requested_attributes(fields, "SiddataUser", {
+                    "origin": lambda: self.origin.name,
+                    "user_origin_id": lambda: self.user_origin_id,
+                    "data_donation": lambda: self.data_donation,
+                    "gender_brain": lambda: self.gender_brain,
+                    "gender_social": lambda: self.gender_social,
+                }),
+                "relationships": relationships,
             }],
         }
 
         courses_brain = 'courses_brain' in include
         courses_social = 'courses_social' in include
         if courses_brain or courses_social:
-            cms = CourseMembership.objects.filter(user=self)
+            cms = CourseMembership.objects.filter(user=self).select_related("course")
             if courses_brain:
                 response_data['data'][0]['relationships']['courses_brain'] = {
                     "data": []
@@ -246,7 +408,7 @@ class SiddataUser(models.Model):
         institutes_brain = 'institutes_brain' in include
         institutes_social = 'institutes_social' in include
         if institutes_brain or institutes_social:
-            ims = InstituteMembership.objects.filter(user=self)
+            ims = InstituteMembership.objects.filter(user=self).select_related("institute")
             if institutes_brain:
                 response_data['data'][0]['relationships']['institutes_brain'] = {
                     "data": []
@@ -422,6 +584,8 @@ class SiddataUserRecommender(models.Model):
     #: If true, the user has enabled the recommender and wants to use it.
     enabled = models.BooleanField(default=False)
 
+    objects = ChangeQuerySet.as_manager()
+
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["user", "recommender"], name="unique_user_recommender"),
@@ -431,6 +595,12 @@ class SiddataUserRecommender(models.Model):
         """String representation of a Category object."""
         return "User {} uses recommender {}".format(self.user.id, self.recommender.name)
 
+    def delete(self, *args, **kwargs):
+        """Leaves tombstones of the goals of the user recommender, their activities and their properties."""
+        with transaction.atomic():
+            Tombstone.record(SiddataUserRecommender.objects.filter(id=self.id))
+            return super().delete(*args, **kwargs)
+
     def get_max_order(self):
         """returns maximum order value og goals"""
         goals = Goal.objects.filter(userrecommender=self).order_by('-order')
@@ -439,65 +609,72 @@ class SiddataUserRecommender(models.Model):
         else:
             return goals[0].order
 
-    def serialize(self, include=True):
+    def serialize(self, include=True, fields=None):
         """
         Converts a Recommender instance related to a certain user to nested structure that can be transformed to JSON.
         Follows REST API standards at
         https://jsonapi.org.
-        :param include: If true, related objects are included in the response.
+        :param include: If true, related objects are included in the response. Alternatively a set of include paths,
+        e.g. {"goals", "goals.activities"}.
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
         :return: data Dictionary with nested data.
         """
 
-        # Create announcements
-        if self.recommender.name == "Startseite":
-            rm_start = recommenders.RM_start.RM_start()
-            rm_start.get_or_create_announcements(self.user)
-
         goal_dicts = []
         included = []
-        goals = Goal.objects.filter(userrecommender=self).order_by("order")
-        for goal in goals:
-            goal_dicts.append({"id": goal.id, "type": "Goal"})
-            if include:
-                g_ser = goal.serialize(include=True)
-                for entry in g_ser["data"] + g_ser["included"]:
-                    if entry not in included:
-                        included.append(entry)
+        include_goals = is_included(include, "goals")
+        if include_goals or is_field_requested(fields, "Recommender", "goals"):
+            goal_include = get_sub_include(include, "goals")
+            goals = Goal.objects.filter(userrecommender=self).select_related(
+                "userrecommender__recommender").order_by("order")
+            for goal in goals:
+                goal_dicts.append({"id": goal.id, "type": "Goal"})
+                if include_goals:
+                    g_ser = goal.serialize(include=goal_include, fields=fields)
+                    for entry in g_ser["data"] + g_ser.get("included", []):
+                        if entry not in included:
+                            included.append(entry)
+
+        relationships = {
+            "goals": {
+                "data": goal_dicts
+            },
+            "activities": {
+                "data": []
+            },
+            "students": {
+                "data": [{
+                    "type": "SiddataUser",
+                    "id": self.user_id
+                }]
+            }
+        }
 
         response_data = {
             "data": [{
                 "type": "Recommender",
                 "id": self.id,
-                "attributes": {
-                    "name": self.recommender.name,
-                    "classname": self.recommender.classname,
-                    "description": self.recommender.description,
-                    "image": "{}{}".format(settings.IMAGE_URL, self.recommender.image),
-                    "order": self.recommender.order,
-                    "enabled": self.enabled,
-                    "data_info": self.recommender.data_info,
-                },
+                "attributes": get_requested_attributes(fields, "Recommender", {
+                    "name": lambda: self.recommender.name,
+                    "classname": lambda: self.recommender.classname,
+                    "description": lambda: self.recommender.description,
+                    "image": lambda: "{}{}".format(settings.IMAGE_URL, self.recommender.image),
+                    "order": lambda: self.recommender.order,
+                    "enabled": lambda: self.enabled,
+                    "data_info": lambda: self.recommender.data_info,
+                }),
                 "relationships": {
-                    "goals": {
-                        "data": goal_dicts
-                    },
-                    "activities": {
-                        "data": []
-                    },
-                    "students": {
-                        "data": [{
-                            "type": "SiddataUser",
-                            "id": self.user.id
-                        }]
-                    }
+                    name: relationship for name, relationship in relationships.items()
+                    if is_field_requested(fields, "Recommender", name)
                 }
             }],
         }
 
-        if include:
-            u_ser = self.user.serialize(include=[])["data"][0]
-            if u_ser not in included:
-                included.append(u_ser)
+        if include is not False and include is not None:
+            if is_included(include, "students"):
+                u_ser = self.user.serialize(include=[], fields=fields)["data"][0]
+                if u_ser not in included:
+                    included.append(u_ser)
             response_data['included'] = included
 
         return response_data
@@ -525,87 +702,161 @@ class Goal(models.Model):
     #: If true, the goal will be displayed, else it will be hidden, and its activities will be displayed without a
     #: goal wrapped around them.
     visible = models.BooleanField(default=True)
+    #: Incremented on every change of the goal, its activities or its properties. Part of the fragment cache key.
+    version = models.PositiveIntegerField(default=0)
+    #: Transaction ID of the latest change of the goal, its activities or its properties.
+    sequence = models.BigIntegerField(default=NextChange, null=True, editable=False)
+
+    objects = ChangeQuerySet.as_manager()
 
     class Meta:
          constraints = [
              models.UniqueConstraint(fields=["userrecommender", "order"], name="unique_goal_in_recommender"),
          ]
+         indexes = [
+             models.Index(fields=["userrecommender", "sequence"], name="goal_changes"),
+         ]
 
     def __str__(self):
         """String representation of a Goal object."""
         return self.title
 
-    def serialize(self, include=True):
+    def save(self, *args, **kwargs):
+        """Increments the version, which invalidates cached fragments of this goal, and records the change."""
+        increment_version(self, kwargs)
+        assign_sequence(self, kwargs)
+        super().save(*args, **kwargs)
+        defer_expressions(self, ["version", "sequence"])
+
+    def delete(self, *args, **kwargs):
+        """Leaves tombstones of the goal, its activities and its properties."""
+        with transaction.atomic():
+            Tombstone.record(Goal.objects.filter(id=self.id))
+            return super().delete(*args, **kwargs)
+
+    @staticmethod
+    def bump_versions(goal_ids):
+        """
+        Increments the version of goals whose activities or properties were changed without calling save(), e.g.
+        by bulk_create.
+        :param goal_ids: Iterable of goal IDs.
+        """
+        goal_ids = {goal_id for goal_id in goal_ids if goal_id is not None}
+        if goal_ids:
+            Goal.objects.filter(id__in=goal_ids).update(version=models.F("version") + 1, sequence=NextChange())
+
+    def serialize(self, include=True, fields=None):
         """
         Converts Goal instance to nested structure that can be transformed to JSON. Follows REST API standards at
         https://jsonapi.org.
-        :param include: If true, related objects are included in the response.
+        :param include: If true, related objects are included in the response. Alternatively a set of include paths,
+        e.g. {"activities", "activities.resource", "goalproperties", "recommender"}.
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
         :return: data Dictionary with nested data.
         """
 
         included = []
 
-        activity_dicts = []
-        activityset = Activity.objects.filter(goal=self,visible=True).order_by("order")
-
-        for activity in activityset:
-            activity_dicts.append({"id": activity.id, "type": "Activity"})
-            if include:
-                a_ser = activity.serialize()
-                for entry in a_ser["data"] + a_ser["included"]:
-                    if entry not in included:
-                        included.append(entry)
+        # the goal's own entry only changes if the goal, its activities or its properties change, so it is cached
+        # under the goal's version
+        requests = [("Goal", self.id, self.version, fragment_cache.get_signature(fields),
+                     lambda: self._serialize_data(fields))]
+        activities = []
+        if is_included(include, "activities"):
+            activity_include = get_sub_include(include, "activities")
+            own_include = Activity.get_own_include(activity_include)
+            activities = [activity for activity in Activity.objects.filter(goal=self, visible=True).select_related(
+                *Activity.SERIALIZATION_RELATED).order_by("order") if activity.is_active()]
+            requests += [activity.get_fragment_request(own_include, fields) for activity in activities]
+        # the fragments of the goal and its activities are read with one cache lookup
+        data_entry, *fragments = fragment_cache.get_or_build_many(requests)
+
+        if is_included(include, "activities"):
+            serialized = []
+            for activity, fragment in zip(activities, fragments):
+                a_ser = activity.serialize(include=own_include, fields=fields, fragment=fragment)
+                serialized += a_ser["data"] + a_ser.get("included", [])
+            if serialized and activity_include:
+                # this goal, its recommender and its student are shared by all activities
+                serialized += Activity.serialize_shared([self], activity_include, fields)
+            for entry in serialized:
+                if entry not in included:
+                    included.append(entry)
 
-        goalproperty_dicts = []
-        goalpropertyset = GoalProperty.objects.filter(goal=self)
-        for goalproperty in goalpropertyset:
-            goalproperty_dicts.append({"id": goalproperty.id, "type": "GoalProperty"})
-            gp_ser = goalproperty.serialize()
-            if include:
+        if is_included(include, "goalproperties"):
+            for goalproperty in GoalProperty.objects.filter(goal=self):
+                gp_ser = goalproperty.serialize(fields=fields)
                 for entry in gp_ser["data"] + gp_ser["included"]:
                     if entry not in included:
                         included.append(entry)
 
         response_data = {
-            "data": [{
-                "type": "Goal",
-                "id": self.id,
-                "attributes": {
-                    "title": self.title,
-                    "description": self.description,
-                    "makedate": self.makedate,
-                    "user": self.userrecommender.user.pk,
-                    "recommender": self.userrecommender.recommender.name,
-                    "order": self.order,
-                    "type": self.type,
-                    "visible": self.visible,
-
-                },
-                "relationships": {
-                    "activities": {
-                        "data": activity_dicts
-                    },
-                    "goalproperties": {
-                        "data": goalproperty_dicts
-                    },
-                    "students": {
-                        "data": [{
-                            "id": self.userrecommender.user.id,
-                            "type": "SiddataUser"
-                        }]
-                    }
-                }
-            }],
+            "data": [data_entry],
         }
 
-        if include:
-            userrec_ser = self.userrecommender.serialize(include=False)["data"][0]
-            if userrec_ser not in included:
-                included.append(userrec_ser)
+        if include is not False and include is not None:
+            if is_included(include, "recommender"):
+                userrec_ser = self.userrecommender.serialize(include=False, fields=fields)["data"][0]
+                if userrec_ser not in included:
+                    included.append(userrec_ser)
             response_data['included'] = included
 
         return response_data
 
+    def _serialize_data(self, fields=None):
+        """
+        Builds the JSON:API resource object of the goal without included objects.
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
+        :return: Resource object dictionary.
+        """
+        activity_dicts = []
+        if is_field_requested(fields, "Goal", "activities"):
+            activity_dicts = [
+                {"id": activity_id, "type": "Activity"} for activity_id in
+                Activity.objects.filter(goal=self, visible=True).order_by("order").values_list("id", flat=True)
+            ]
+
+        goalproperty_dicts = []
+        if is_field_requested(fields, "Goal", "goalproperties"):
+            goalproperty_dicts = [
+                {"id": goalproperty_id, "type": "GoalProperty"} for goalproperty_id in
+                GoalProperty.objects.filter(goal=self).values_list("id", flat=True)
+            ]
+
+        relationships = {
+            "activities": {
+                "data": activity_dicts
+            },
+            "goalproperties": {
+                "data": goalproperty_dicts
+            },
+            "students": {
+                "data": [{
+                    "id": self.userrecommender.user_id,
+                    "type": "SiddataUser"
+                }]
+            }
+        }
+
+        return {
+            "type": "Goal",
+            "id": self.id,
+            "attributes": get_requested_attributes(fields, "Goal", {
+                "title": lambda: self.title,
+                "description": lambda: self.description,
+                "makedate": lambda: self.makedate,
+                "user": lambda: self.userrecommender.user_id,
+                "recommender": lambda: self.userrecommender.recommender.name,
+                "order": lambda: self.order,
+                "type": lambda: self.type,
+                "visible": lambda: self.visible,
+            }),
+            "relationships": {
+                name: relationship for name, relationship in relationships.items()
+                if is_field_requested(fields, "Goal", name)
+            }
+        }
+
     def get_property(self, key):
         """Get a goal's property identified by key.
 
@@ -658,31 +909,117 @@ class GoalProperty(models.Model):
     key = models.CharField(max_length=128)
     #: The value of the property.
     value = JSONField(null=True)
+    #: Transaction ID of the latest change of the property.
+    sequence = models.BigIntegerField(default=NextChange, null=True, editable=False)
+
+    objects = ChangeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["goal", "sequence"], name="goalproperty_changes"),
+        ]
 
     def __str__(self):
         """String representation of a GoalProperty object."""
         return "GoalProperty {}".format(self.key)
 
-    def serialize(self):
+    def save(self, *args, **kwargs):
+        """Increments the version of the goal, which invalidates its cached fragments, and records the change."""
+        assign_sequence(self, kwargs)
+        super().save(*args, **kwargs)
+        defer_expressions(self, ["sequence"])
+        Goal.bump_versions([self.goal_id])
+
+    def delete(self, *args, **kwargs):
+        """
+        Leaves a tombstone and increments the version of the goal, which invalidates its cached fragments.
+        """
+        goal_id = self.goal_id
+        with transaction.atomic():
+            Tombstone.record(type(self).objects.filter(id=self.id))
+            result = super().delete(*args, **kwargs)
+        Goal.bump_versions([goal_id])
+        return result
+
+    def serialize(self, fields=None):
         """
         Converts GoalProperty instance to nested structure that can be transformed to JSON. Follows REST API standards at
         https://jsonapi.org.
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
         :return: data Dictionary with nested data.
         """
         response_data = {
             "data": [{
                 "type": "GoalProperty",
                 "id": self.id,
-                "attributes": {
-                    "key": self.key,
-                    "value": self.value,
-                },
+                "attributes": get_requested_attributes(fields, "GoalProperty", {
+                    "key": lambda: self.key,
+                    "value": lambda: self.value,
+                }),
             }],
             "included": [],
         }
         return response_data
 
 
+class Tombstone(models.Model):
+    """
+    Records the deletion of a goal, activity or goal property, so that clients syncing changes with a `since` token
+    learn about it.
+    """
+
+    #: Unique ID.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    #: The user the deleted object belonged to.
+    user = models.ForeignKey("SiddataUser", on_delete=models.CASCADE)
+    #: JSON:API type of the deleted object, i.e. Goal, Activity or GoalProperty.
+    type = models.CharField(max_length=64)
+    #: ID of the deleted object.
+    object_id = models.UUIDField()
+    #: Transaction ID of the deletion.
+    sequence = models.BigIntegerField(default=NextChange, editable=False)
+    #: Date of the deletion.
+    makedate = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "sequence"], name="tombstone_changes"),
+        ]
+
+    def __str__(self):
+        """String representation of a Tombstone object."""
+        return "Tombstone {} {}".format(self.type, self.object_id)
+
+    @staticmethod
+    def record(objects):
+        """
+        Stores the tombstones of objects which are about to be deleted with one query per type and a single insert.
+        Deleted user recommenders and goals leave the tombstones of the goals, activities and properties they contain.
+        Objects deleted by cascade from other models, e.g. with their user, leave no tombstones.
+        :param objects: QuerySet of SiddataUserRecommender, Goal, Activity or GoalProperty objects.
+        """
+        if objects.model is SiddataUserRecommender:
+            objects = Goal.objects.filter(userrecommender__in=objects)
+        if objects.model is Goal:
+            querysets = [objects, Activity.objects.filter(goal__in=objects),
+                         GoalProperty.objects.filter(goal__in=objects)]
+        else:
+            querysets = [objects]
+        tombstones = []
+        for queryset in querysets:
+            user_field = "userrecommender__user_id" if queryset.model is Goal else "goal__userrecommender__user_id"
+            tombstones += [Tombstone(user_id=user_id, type=queryset.model.__name__, object_id=object_id)
+                           for object_id, user_id in queryset.values_list("id", user_field) if user_id is not None]
+        Tombstone.objects.bulk_create(tombstones)
+
+    def serialize(self):
+        """
+        Converts Tombstone instance to a JSON:API resource identifier of the deleted object.
+        :return: Resource identifier dictionary.
+        """
+        return {"type": self.type, "id": self.object_id}
+
+
 class Category(models.Model):
     """
     A category of goals, for instance DDC-codes but also the categories from our goal tagset.
@@ -734,10 +1071,14 @@ class EducationalResource(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     #: Dewey decimal classification number assigned by SidBERT.
     ddc_code = models.JSONField(null=True)
+    #: Time when SidBERT assigned the ddc_code, RM_professions matches the resources labeled since its last run.
+    ddc_labeled = models.DateTimeField(null=True, db_index=True)
     #: The origin providing the resource.
     origin = models.ForeignKey(Origin, on_delete=models.CASCADE, related_name="educational_resource_origin", null=True)
     #: The resource's ID in its origin system.
     identifier = models.CharField(max_length=1024, unique=True, null=True)
+    #: Identifier of the OAI-PMH record the resource was harvested from, used to apply deletions.
+    oai_identifier = models.CharField(max_length=1024, null=True, db_index=True)
     #: Contributor after dublin core scheme.
     contributor = models.JSONField(null=True)
     #: Time and place string, if present, after dublin core scheme.
@@ -766,6 +1107,8 @@ class EducationalResource(models.Model):
     title = models.CharField(max_length=1024)
     #: List of type-related keywords.
     type = models.JSONField(max_length=1024, null=True, choices=TYPE_CHOICES)
+    #: SHA-256 hash of the last ingested JSON representation, used to skip unchanged entities.
+    content_hash = models.CharField(max_length=64, null=True, db_index=True)
 
     def serialize(self):
         """
@@ -871,6 +1214,8 @@ class Institute(models.Model):
     origin = models.ForeignKey(Origin, on_delete=models.CASCADE)
     #: ID of the institute in its origin system.
     institute_origin_id = models.CharField(max_length=512)
+    #: SHA-256 hash of the last ingested JSON representation, used to skip unchanged entities.
+    content_hash = models.CharField(max_length=64, null=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -1159,6 +1504,8 @@ class Person(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     #: The image the person wants to appear with.
     image = models.ImageField(upload_to='images/', default="images/default.png", null=True)
+    #: SHA-256 hash of the image content. Images with a hash are stored content-addressed and have a thumbnail.
+    image_hash = models.CharField(max_length=64, null=True, db_index=True)
     #: The first name of the person.
     first_name = models.CharField(max_length=256, null=True)
     #: The last name of the person.
@@ -1175,6 +1522,8 @@ class Person(models.Model):
     editable = models.BooleanField(default=False)
     #: The user which created this person object.
     user = models.ForeignKey(SiddataUser, null=True, on_delete=models.CASCADE)
+    #: SHA-256 hash of the last ingested JSON representation, used to skip unchanged entities.
+    content_hash = models.CharField(max_length=64, null=True, db_index=True)
 
     def __str__(self):
         """String representation of an Question object."""
@@ -1186,11 +1535,15 @@ class Person(models.Model):
         https://jsonapi.org.
         :return: data Dictionary with nested data.
         """
-        try:
-            image = self.image.url
-        except Exception as e:
-            logging.error(e)
-            image = None
+        if self.image_hash:
+            # thumbnails of content-addressed images are served by the image route with long-lived cache headers
+            image = "{}/api/image/{}".format(settings.BASE_URL.rstrip("/"), self.image_hash)
+        else:
+            try:
+                image = "{}{}".format(settings.BASE_URL, self.image.url)
+            except Exception as e:
+                logging.error(e)
+                image = None
 
         response_data = {
             "data": [{
@@ -1203,7 +1556,7 @@ class Person(models.Model):
                     "email": self.email,
                     "role_description": self.role_description,
                     "url": self.url,
-                    "image": "{}{}".format(settings.BASE_URL, image),
+                    "image": image,
                     "editable": self.editable
                 }
             }],
@@ -1352,16 +1705,54 @@ class Activity(models.Model):
     template_ref = models.ForeignKey("ActivityTemplate", on_delete=models.CASCADE, null=True)
     #: If true, the activity is displayed to the user.
     visible = models.BooleanField(default=True, null=False)
+    #: Incremented on every save. Part of the fragment cache key.
+    version = models.PositiveIntegerField(default=0)
+    #: Transaction ID of the latest change of the activity.
+    sequence = models.BigIntegerField(default=NextChange, null=True, editable=False)
+
+    objects = ChangeQuerySet.as_manager()
+
+    #: Relations read by serialize(), to be passed to select_related() when serializing many activities. Dynamic
+    #: attributes are read from the template first, so the template's relations are needed as well.
+    SERIALIZATION_RELATED = [
+        "template_ref__resource__origin", "template_ref__question", "template_ref__person",
+        "resource__origin", "question", "person",
+    ]
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=["goal", "order"], name="unique_order_in_goal"),
         ]
+        indexes = [
+            models.Index(fields=["goal", "sequence"], name="activity_changes"),
+        ]
 
     def __str__(self):
         """String representation of an Activity object."""
         return "Activity {} {}".format(self.title, self.description)
 
+    def save(self, *args, **kwargs):
+        """
+        Increments the version of the activity and its goal, which invalidates their cached fragments, and records the
+        change.
+        """
+        increment_version(self, kwargs)
+        assign_sequence(self, kwargs)
+        super().save(*args, **kwargs)
+        defer_expressions(self, ["version", "sequence"])
+        Goal.bump_versions([self.goal_id])
+
+    def delete(self, *args, **kwargs):
+        """
+        Leaves a tombstone and increments the version of the goal, which invalidates its cached fragments.
+        """
+        goal_id = self.goal_id
+        with transaction.atomic():
+            Tombstone.record(type(self).objects.filter(id=self.id))
+            result = super().delete(*args, **kwargs)
+        Goal.bump_versions([goal_id])
+        return result
+
     def respond(self):
         """
         Generates String that is displayed in Frontend when activity is finalized.
@@ -1464,6 +1855,20 @@ class Activity(models.Model):
 
         return activity
 
+    @staticmethod
+    def build_activity_from_template(template, goal, status="new", **kwargs):
+        """
+        Builds an unsaved activity from a template, e.g. to create the activities of many users with bulk_create.
+        :param template: ActivityTemplate instance.
+        :param goal: The related goal of the activity.
+        :param status: The status the activity will be initialized with.
+        :param kwargs: Additional attributes which will be set on the activity.
+        :return: Activity instance, not yet saved.
+        """
+        attributes = {attribute: getattr(template, attribute) for attribute in template.get_dynamic_attributes()}
+        attributes.update(kwargs)
+        return Activity(goal=goal, status=status, template_ref=template, **attributes)
+
     def has_template(self, template_id):
         """
         Returns true if the passed template_id matches the containing template reference.
@@ -1471,100 +1876,196 @@ class Activity(models.Model):
         """
         return self.template_ref_id == template_id
 
-    def serialize(self, include=True):
+    def serialize(self, include=True, fields=None, fragment=None):
         """
         Converts an Activity instance to nested structure that can be transformed to JSON. Follows REST API standards at
         https://jsonapi.org.
-        :param include: If true, related objects will be included.
+        :param include: If true, related objects will be included. Alternatively a set of include paths, e.g.
+        {"resource", "question", "person", "goal", "recommender", "student"}.
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
+        :param fragment: The cached fragment of the activity if it was already read, see serialize_many().
         :return: data Dictionary with nested data.
         """
 
         # Do not return Activity if it is not active yet or not active anymore
+        if not self.is_active():
+            return None
+
+        if fragment is None:
+            fragment = fragment_cache.get_or_build(*self.get_fragment_request(include, fields))
+
+        response_data = {
+            "data": [fragment["data"]],
+        }
+
+        if include is not False and include is not None:
+            included = list(fragment["included"])
+            # the goal is only loaded if it or its related objects are requested
+            if any(is_included(include, name) for name in ["goal", "recommender", "student"]):
+                for entry in Activity.serialize_shared([self.goal], include, fields):
+                    if entry not in included:
+                        included.append(entry)
+            response_data['included'] = included
+        return response_data
+
+    def is_active(self):
+        """
+        Checks whether the activity is displayed at the current time, i.e. it has no activation period or the current
+        time lies within it.
+        :return: Boolean
+        """
         now = datetime.datetime.now()
         start = datetime.datetime.timestamp(self.activation_time) if self.activation_time else None
         end = datetime.datetime.timestamp(self.deactivation_time) if self.deactivation_time else None
-        if start and end and (now < start or now > end):
-            return None
+        return not (start and end and (now < start or now > end))
 
-        response_data = {
-            "data": [{
-                "type": "Activity",
-                "id": self.id,
-                "attributes": {
-                    "description": self.description,
-                    "type": self.type,
-                    "goal_id": self.goal.pk,
-                    "title": self.title,
-                    "status": self.status, #"active" if self.status == "immortal" else self.status,
-                    "answers": self.answers,
-                    "feedback_size": self.feedback_size,
-                    "feedback_value": self.feedback_value,
-                    "feedback_text": self.feedback_text,
-                    "feedback_chdate": self.feedback_chdate,
-                    "notes": self.notes,
-                    "duedate": self.duedate,
-                    "order": self.order,
-                    "form": self.form,
-                    "chdate": self.chdate,
-                    "mkdate": self.mkdate,
-                    "activation_time": self.activation_time,
-                    "deactivation_time": self.deactivation_time,
-                    "image": self.image if (self.image == None) else (self.image if (self.image[:4] == "http") else "{}{}".format(
-                        settings.IMAGE_URL, self.image)),
-                    "color_theme": self.color_theme,
-                    "button_text": self.button_text,
-                    "interactions": self.interactions,
-                    "rebirth":self.rebirth,
-                },
-                "relationships": {
-                    "course": {
-                        "data": [{"id": self.resource.id, "type": "Course"}] if self.resource else []
-                    },
-                    "resource": {
-                        "data": [{"id": self.resource.id, "type": "Resource"}] if self.resource else []
-                    },
-                    "question": {
-                        "data": [{"id": self.question.id, "type": "Question"}] if self.question else []
-                    },
-                    "event": {
-                        "data": [{"id": self.resource.id, "type": "Event"}] if self.resource else []
-                    },
-                    "person": {
-                        "data": [{"id": self.person.id, "type": "Person"}] if self.person else []
-                    },
-                },
-            }],
+    def get_fragment_request(self, include, fields):
+        """
+        Describes the cached fragment of the activity for fragment_cache.get_or_build and get_or_build_many.
+        :param include: Include parameter, see serialize().
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
+        :return: Tuple of type name, ID, version, signature and build function.
+        """
+        include_related = {name: is_included(include, name) for name in ["resource", "question", "person"]}
+        # the template is part of the version as dynamic attributes are read from it
+        version = (self.version, self.template_ref.version if self.template_ref_id else 0)
+        return ("Activity", self.id, version, fragment_cache.get_signature(fields, include_related),
+                lambda: self._serialize_fragment(include_related, fields))
+
+    @staticmethod
+    def serialize_many(activities, include=True, fields=None):
+        """
+        Serializes several activities, whose fragments are read from the fragment cache with one lookup.
+        :param activities: List of Activity instances.
+        :param include: Include parameter, see serialize().
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
+        :return: List of the serialized activities in the same order, None for activities which are not active.
+        """
+        active = [activity for activity in activities if activity.is_active()]
+        fragments = dict(zip((activity.id for activity in active), fragment_cache.get_or_build_many(
+            [activity.get_fragment_request(include, fields) for activity in active])))
+        return [activity.serialize(include=include, fields=fields, fragment=fragments[activity.id])
+                if activity.id in fragments else None for activity in activities]
+
+    @staticmethod
+    def serialize_shared(goals, include, fields=None):
+        """
+        Serializes the goals of activities together with their recommenders and student, as far as they are included.
+        When many activities are serialized, these objects are shared, so they should be serialized only once by
+        passing the distinct goals and excluding "goal", "recommender" and "student" from the activities' include.
+        :param goals: List of distinct Goal instances.
+        :param include: Include parameter of the activities, see serialize().
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
+        :return: List of resource objects.
+        """
+        entries = []
+        if is_included(include, "recommender"):
+            userrecommenders = {goal.userrecommender_id: goal.userrecommender for goal in goals}
+            for userrecommender in userrecommenders.values():
+                entries += userrecommender.serialize(include=False, fields=fields)["data"]
+        if is_included(include, "goal"):
+            for goal in goals:
+                entries += goal.serialize(include=False, fields=fields)["data"]
+        if is_included(include, "student") and goals:
+            entries += goals[0].userrecommender.user.serialize(include=[], fields=fields)["data"]
+        return entries
+
+    @staticmethod
+    def get_own_include(include):
+        """
+        Restricts the include parameter of activities to the objects which are not shared with other activities, see
+        serialize_shared().
+        :param include: True, False or a set of include paths.
+        :return: False or a set of include paths.
+        """
+        if not include:
+            return False
+        return {name for name in ["resource", "question", "person"] if is_included(include, name)}
+
+    def _serialize_fragment(self, include_related, fields=None):
+        """
+        Builds the JSON:API resource object of the activity together with its included resource, question and person.
+        :param include_related: dict mapping "resource", "question" and "person" to True if they are to be included.
+        :param fields: JSON:API sparse fieldsets, dict mapping type names to sets of requested field names.
+        :return: dict with the keys "data" (resource object) and "included" (list of resource objects).
+        """
+        # related objects are only loaded if they are requested
+        resource = self.resource if include_related["resource"] or any(
+            is_field_requested(fields, "Activity", name) for name in ["course", "resource", "event"]) else None
+        question = self.question if include_related["question"] or is_field_requested(
+            fields, "Activity", "question") else None
+        person = self.person if include_related["person"] or is_field_requested(
+            fields, "Activity", "person") else None
+        relationships = {
+            "course": {
+                "data": [{"id": resource.id, "type": "Course"}] if resource else []
+            },
+            "resource": {
+                "data": [{"id": resource.id, "type": "Resource"}] if resource else []
+            },
+            "question": {
+                "data": [{"id": question.id, "type": "Question"}] if question else []
+            },
+            "event": {
+                "data": [{"id": resource.id, "type": "Event"}] if resource else []
+            },
+            "person": {
+                "data": [{"id": person.id, "type": "Person"}] if person else []
+            },
         }
 
-        if include:
-            included = []
-            serialized = []
-            if self.resource:
-                rs = self.resource.serialize()
-                serialized += rs["data"] + rs["included"]
-            if self.question:
-                qs = self.question.serialize()
-                serialized += qs["data"] + qs["included"]
-            if self.person:
-                ps = self.person.serialize()
-                serialized += ps["data"] + ps["included"]
+        data = {
+            "type": "Activity",
+            "id": self.id,
+            "attributes": get_requested_attributes(fields, "Activity", {
+                "description": lambda: self.description,
+                "type": lambda: self.type,
+                "goal_id": lambda: self.goal_id,
+                "title": lambda: self.title,
+                "status": lambda: self.status, #"active" if self.status == "immortal" else self.status,
+                "answers": lambda: self.answers,
+                "feedback_size": lambda: self.feedback_size,
+                "feedback_value": lambda: self.feedback_value,
+                "feedback_text": lambda: self.feedback_text,
+                "feedback_chdate": lambda: self.feedback_chdate,
+                "notes": lambda: self.notes,
+                "duedate": lambda: self.duedate,
+                "order": lambda: self.order,
+                "form": lambda: self.form,
+                "chdate": lambda: self.chdate,
+                "mkdate": lambda: self.mkdate,
+                "activation_time": lambda: self.activation_time,
+                "deactivation_time": lambda: self.deactivation_time,
+                "image": lambda: self.image if (self.image == None) else (self.image if (self.image[:4] == "http") else "{}{}".format(
+                    settings.IMAGE_URL, self.image)),
+                "color_theme": lambda: self.color_theme,
+                "button_text": lambda: self.button_text,
+                "interactions": lambda: self.interactions,
+                "rebirth": lambda: self.rebirth,
+            }),
+            "relationships": {
+                name: relationship for name, relationship in relationships.items()
+                if is_field_requested(fields, "Activity", name)
+            },
+        }
 
-            for entry in serialized:
-                if entry not in included:
-                    included.append(entry)
+        included = []
+        serialized = []
+        if resource and include_related["resource"]:
+            rs = resource.serialize()
+            serialized += rs["data"] + rs["included"]
+        if question and include_related["question"]:
+            qs = question.serialize()
+            serialized += qs["data"] + qs["included"]
+        if person and include_related["person"]:
+            ps = person.serialize()
+            serialized += ps["data"] + ps["included"]
 
-            userrec_ser = self.goal.userrecommender.serialize(include=False)["data"][0]
-            if userrec_ser not in included:
-                included.append(userrec_ser)
-            goal_ser = self.goal.serialize(include=False)["data"][0]
-            if goal_ser not in included:
-                included.append(goal_ser)
-            user_ser = self.goal.userrecommender.user.serialize(include=[])["data"][0]
-            if user_ser not in included:
-                included.append(user_ser)
+        for entry in serialized:
+            if entry not in included:
+                included.append(entry)
 
-            response_data['included'] = included
-        return response_data
+        return {"data": data, "included": included}
 
 
 class ActivityTemplate(Activity):
@@ -1648,8 +2149,202 @@ class ActivityTemplate(Activity):
     )
 
 
+class Announcement(models.Model):
+    """
+    An announcement which is pushed as an activity to the start page of all users.
+    Announcements are delivered by the start recommender on first login and by a scheduled task, never on read requests.
+    """
+
+    #: Unique ID.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    #: Title of the announcement. Used to detect if a user already received the announcement.
+    title = models.CharField(max_length=256)
+    #: Textual content of the announcement.
+    description = models.TextField(null=True)
+    #: Type of the created activities.
+    type = models.CharField(max_length=64, default="todo")
+    #: Color theme of the created activities.
+    color_theme = models.CharField(max_length=64, null=True, default="green")
+    #: Iconic image of the created activities.
+    image = models.CharField(max_length=256, null=True, default="sid.png")
+    #: Defines the size of the feedback scale for the created activities.
+    feedback_size = models.IntegerField(default=0)
+    #: If true, the announcement is pushed to users.
+    active = models.BooleanField(default=True)
+    #: Creation date of the announcement.
+    mkdate = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """String representation of an Announcement object."""
+        return "Announcement {}".format(self.title)
+
+    def build_activity(self, goal, order):
+        """
+        Builds an unsaved activity that delivers this announcement.
+        :param goal: The goal the activity is placed in.
+        :param order: The display order of the activity within the goal.
+        :return: Activity instance, not yet saved.
+        """
+        return Activity(
+            goal=goal,
+            title=self.title,
+            description=self.description,
+            type=self.type,
+            color_theme=self.color_theme,
+            image=self.image,
+            feedback_size=self.feedback_size,
+            order=order,
+        )
+
+
+class BackgroundTask(models.Model):
+    """
+    A unit of deferred work, e.g. the side effects of an activity PATCH request.
+    Tasks are persisted in the database and executed by a worker process, see backend.task_queue and the
+    `runworker` management command.
+    """
+
+    STATUSES = Choices("queued", "running", "done", "failed")
+
+    #: Unique ID. Returned to clients as job reference.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    #: Dotted path of the function which is executed.
+    function = models.CharField(max_length=256)
+    #: Keyword arguments the function is called with.
+    kwargs = JSONField(default=dict)
+    #: Label used to aggregate metrics, e.g. the class name of the recommender.
+    label = models.CharField(max_length=128, null=True)
+    #: Status of the task. Options are: queued, running, done, failed
+    status = models.CharField(max_length=16, choices=STATUSES, default=STATUSES.queued, db_index=True)
+    #: Return value of the function.
+    result = JSONField(null=True)
+    #: Error message if the task failed.
+    error = models.TextField(null=True)
+    #: Time when the task was enqueued.
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    #: Time when a worker started the task.
+    started = models.DateTimeField(null=True)
+    #: Time when the task was finished.
+    finished = models.DateTimeField(null=True)
+    #: Tasks with higher priority are executed first, tasks of equal priority in the order they were enqueued.
+    priority = models.SmallIntegerField(default=0)
+    #: Number of times a worker started the task.
+    attempts = models.PositiveSmallIntegerField(default=0)
+    #: Number of times the task is started before it is marked as failed.
+    max_attempts = models.PositiveSmallIntegerField(default=1)
+    #: The task is not started before this time, e.g. after a failed attempt.
+    run_after = models.DateTimeField(null=True)
+    #: A running task whose worker does not extend this time is assumed to be lost and is started again.
+    visible_until = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "-priority", "created"], name="backgroundtask_queue"),
+        ]
+
+    def __str__(self):
+        """String representation of a BackgroundTask object."""
+        return "BackgroundTask {} {}".format(self.function, self.status)
+
+    def serialize(self):
+        """
+        Converts BackgroundTask instance to nested structure that can be transformed to JSON. Follows REST API
+        standards at https://jsonapi.org.
+        :return: data Dictionary with nested data.
+        """
+        response_data = {
+            "data": [{
+                "type": "Job",
+                "id": self.id,
+                "attributes": {
+                    "status": self.status,
+                    "label": self.label,
+                    "priority": self.priority,
+                    "attempts": self.attempts,
+                    "result": self.result,
+                    "error": self.error,
+                    "created": self.created,
+                    "started": self.started,
+                    "finished": self.finished,
+                }
+            }],
+            "included": []
+        }
+        return response_data
+
+
+class HarvestState(models.Model):
+    """
+    Progress of the OAI-PMH harvesting of an origin, see
+    scheduled_tasks.educational_resource_functions.collect_edu_sharing_resources. A harvest only requests the records
+    changed since the last completed one and continues with the stored resumption token if it was interrupted.
+    """
+
+    #: The harvested origin.
+    origin = models.OneToOneField(Origin, on_delete=models.CASCADE, primary_key=True)
+    #: Latest datestamp of the records of the last completed harvest, sent as `from` by the next harvest.
+    datestamp = models.CharField(max_length=32, null=True)
+    #: Resumption token of the next page of an interrupted harvest.
+    resumption_token = models.TextField(null=True)
+    #: The `from` argument of the running harvest, it is restarted with it if the resumption token expired.
+    harvest_from = models.CharField(max_length=32, null=True)
+    #: Latest datestamp of the records of the running harvest so far.
+    harvest_datestamp = models.CharField(max_length=32, null=True)
+    #: Time when the last harvest was completed.
+    completed = models.DateTimeField(null=True)
+
+    def __str__(self):
+        """String representation of a HarvestState object."""
+        return "HarvestState {} {}".format(self.origin_id, self.datestamp)
+
+
+class InterestState(models.Model):
+    """
+    DDC label of a professional interest of RM_professions and the newest resource considered for it. The cron
+    function of RM_professions only matches resources labeled later than the watermark against the interest, see
+    RM_professions.recommend_new_resources.
+    """
+
+    #: The goal representing the interest.
+    goal = models.OneToOneField(Goal, on_delete=models.CASCADE, primary_key=True, related_name="interest_state")
+    #: The interest as entered by the user.
+    interest = models.TextField()
+    #: DDC label SidBERT assigned to the interest, None if it has to be classified again, e.g. after a model update.
+    ddc_label = models.CharField(max_length=32, null=True, db_index=True)
+    #: Resource types the user chose, see RM_professions.RESOURCE_TYPES.
+    filter_tags = models.JSONField(default=list)
+    #: ddc_labeled up to which all resources were considered for the interest.
+    watermark = models.DateTimeField(null=True)
+
+    def __str__(self):
+        """String representation of an InterestState object."""
+        return "InterestState {} {}".format(self.goal_id, self.ddc_label)
+
+
+class Lease(models.Model):
+    """
+    A lease which is held by at most one process at a time, e.g. to elect the process running the scheduled tasks, see
+    scheduled_tasks.leader. The holder has to renew the lease before it expires, otherwise another process takes over.
+    """
+
+    #: Name of the lease, e.g. "scheduler".
+    name = models.CharField(max_length=64, primary_key=True)
+    #: Identifier of the holding process, empty if the lease was released.
+    holder = models.CharField(max_length=256, default="")
+    #: Time when the current holder acquired the lease.
+    acquired = models.DateTimeField(null=True)
+    #: Time of the last renewal by the holder.
+    renewed = models.DateTimeField(null=True)
+    #: Time after which the lease may be taken over by another process.
+    expires = models.DateTimeField(null=True)
+
+    def __str__(self):
+        """String representation of a Lease object."""
+        return "Lease {} held by {} until {}".format(self.name, self.holder or "nobody", self.expires)
+
+
 class RequestLog(models.Model):
-    """Represents a Request. For evaluation purposes"""
+    """Represents a Request. For evaluation purposes, written by backend.request_metrics.RequestMetricsMiddleware."""
 
     #: Unique ID.
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -1661,6 +2356,20 @@ class RequestLog(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     #: Route of the request.
     route = models.CharField(max_length=1024)
+    #: HTTP method of the request.
+    method = models.CharField(max_length=16, null=True)
+    #: api_endpoint of the origin sending the request.
+    origin = models.CharField(max_length=256, null=True)
+    #: HTTP status code of the response.
+    status = models.PositiveSmallIntegerField(null=True)
+    #: Wall time of the request in seconds.
+    duration = models.FloatField(null=True)
+    #: Number of database queries issued by the request.
+    query_count = models.PositiveIntegerField(null=True)
+    #: Time spent in database queries in seconds.
+    db_time = models.FloatField(null=True)
+    #: Time spent serializing the response in seconds, excluding database queries.
+    serialization_time = models.FloatField(null=True)
 
 
 class CourseMembership(models.Model):
@@ -0,0 +1,225 @@
+"""
+Instrumentation of requests.
+
+`RequestMetricsMiddleware` measures the wall time, the number and duration of database queries and the time spent in
+serialization (see `measure_serialization()`) of a sampled share of requests, set by `REQUEST_METRICS_SAMPLE_RATE`.
+Unsampled requests are not instrumented at all. The measurements are
+
+1. aggregated into histograms per route, method and status, which are rendered in the Prometheus text format by
+   `render_prometheus()` and served by the route `metrics`, and
+2. buffered in memory and written to `RequestLog` with one bulk insert per `REQUEST_LOG_BUFFER_SIZE` requests or
+   `REQUEST_LOG_FLUSH_INTERVAL` seconds. The buffer is written when a request has finished, i.e. after its response was
+   sent, so a killed process loses at most the requests of the last interval.
+
+Histograms are kept per process, like the hit counts of the fragment cache.
+"""
+import contextlib
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection
+from django.dispatch import receiver
+
+from backend import models
+
+#: Upper bounds of the histogram buckets of durations in seconds.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+#: Upper bounds of the histogram buckets of query counts.
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+#: Histograms in the order they are rendered, with their help text and buckets.
+HISTOGRAMS = (
+    ("siddata_request_duration_seconds", "Wall time of requests.", DURATION_BUCKETS),
+    ("siddata_request_queries", "Number of database queries per request.", QUERY_BUCKETS),
+    ("siddata_request_db_seconds", "Time spent in database queries per request.", DURATION_BUCKETS),
+    ("siddata_request_serialization_seconds", "Time spent in serialization per request.", DURATION_BUCKETS),
+)
+
+_local = threading.local()
+_lock = threading.Lock()
+_histograms = {}
+_buffer = []
+_last_flush = time.monotonic()
+
+
+class Histogram:
+    """Cumulative histogram in the sense of Prometheus, i.e. each bucket counts all values up to its bound."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Adds a value to the histogram.
+        :param value: Observed number.
+        """
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RequestMeasurement:
+    """Measurements of a single request. Used as database execute wrapper to count and time the queries."""
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            self.db_time += time.perf_counter() - start
+
+
+class RequestMetricsMiddleware:
+    """Measures sampled requests, see the module documentation."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 1.0):
+            return self.get_response(request)
+
+        measurement = RequestMeasurement()
+        _local.measurement = measurement
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(measurement):
+                response = self.get_response(request)
+        finally:
+            _local.measurement = None
+        record(request, response, measurement, time.perf_counter() - start)
+        return response
+
+
+@contextlib.contextmanager
+def measure_serialization():
+    """
+    Context manager which adds the time spent in its block to the serialization time of the current request.
+    Database queries issued by lazy serialization are not counted as serialization time.
+    """
+    measurement = getattr(_local, "measurement", None)
+    if measurement is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    db_time = measurement.db_time
+    try:
+        yield
+    finally:
+        measurement.serialization_time += time.perf_counter() - start - (measurement.db_time - db_time)
+
+
+def record(request, response, measurement, duration):
+    """
+    Adds the measurements of a request to the histograms and the buffer of RequestLog rows.
+    :param request: Django request object.
+    :param response: Django response object.
+    :param measurement: RequestMeasurement of the request.
+    :param duration: Wall time of the request in seconds.
+    """
+    # the route pattern, e.g. api/goal/<str:goal_id>, keeps the number of label values bounded
+    route = request.resolver_match.route if request.resolver_match is not None else "unresolved"
+    values = (duration, measurement.query_count, measurement.db_time, measurement.serialization_time)
+    with _lock:
+        key = (route, request.method, response.status_code)
+        histograms = _histograms.get(key)
+        if histograms is None:
+            histograms = _histograms[key] = [Histogram(buckets) for _, _, buckets in HISTOGRAMS]
+        for histogram, value in zip(histograms, values):
+            histogram.observe(value)
+
+        _buffer.append(models.RequestLog(
+            route=route,
+            method=request.method,
+            origin=request.GET.get("origin"),
+            status=response.status_code,
+            duration=duration,
+            query_count=measurement.query_count,
+            db_time=measurement.db_time,
+            serialization_time=measurement.serialization_time,
+        ))
+
+
+@receiver(request_finished)
+def flush_if_due(**kwargs):
+    """
+    Writes the buffered RequestLog rows once REQUEST_LOG_BUFFER_SIZE rows are buffered or REQUEST_LOG_FLUSH_INTERVAL
+    seconds have passed since the last write. Called after every request, measured or not.
+    """
+    with _lock:
+        if len(_buffer) < getattr(settings, "REQUEST_LOG_BUFFER_SIZE", 100) and \
+                time.monotonic() - _last_flush < getattr(settings, "REQUEST_LOG_FLUSH_INTERVAL", 60):
+            return
+    flush()
+
+
+def flush():
+    """Writes all buffered RequestLog rows."""
+    global _last_flush
+
+    with _lock:
+        rows = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if rows:
+        write(rows)
+
+
+def write(rows):
+    """
+    Stores RequestLog rows with one bulk insert. Failures are logged, as instrumentation must not break requests.
+    :param rows: List of unsaved RequestLog instances.
+    """
+    try:
+        models.RequestLog.objects.bulk_create(rows)
+    except Exception:
+        logging.exception("Error in request_metrics.write()")
+
+
+def render_prometheus():
+    """
+    Renders the histograms of the current process in the Prometheus text exposition format.
+    :return: str
+    """
+    def format_labels(key, le=None):
+        route, method, status = key
+        labels = 'route="{}",method="{}",status="{}"'.format(route.replace('"', '\\"'), method, status)
+        if le is not None:
+            labels += ',le="{}"'.format(le)
+        return "{" + labels + "}"
+
+    with _lock:
+        snapshot = {key: [(h.counts[:], h.count, h.sum) for h in histograms] for key, histograms in _histograms.items()}
+
+    lines = [
+        "# HELP siddata_request_metrics_sample_rate Share of requests which are measured.",
+        "# TYPE siddata_request_metrics_sample_rate gauge",
+        "siddata_request_metrics_sample_rate {}".format(getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 1.0)),
+    ]
+    for index, (name, help_text, buckets) in enumerate(HISTOGRAMS):
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} histogram".format(name))
+        for key in sorted(snapshot):
+            counts, count, total = snapshot[key][index]
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append("{}_bucket{} {}".format(name, format_labels(key, bound), bucket_count))
+            lines.append("{}_bucket{} {}".format(name, format_labels(key, "+Inf"), count))
+            lines.append("{}_sum{} {}".format(name, format_labels(key), total))
+            lines.append("{}_count{} {}".format(name, format_labels(key), count))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+"""
+Incremental parsing of large request bodies sent to the ingestion routes.
+
+Clients may either send a JSON:API document, i.e. {"data": [...]}, or NDJSON with one resource object per line
+(content type application/x-ndjson). In both cases the resource objects are parsed one after another from the request
+stream and handed out in chunks of bounded size, so the memory used by a request no longer depends on the size of the
+upload.
+"""
+import itertools
+import json
+
+import ijson
+from ijson.common import ObjectBuilder
+
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonlines", "application/jsonl"}
+
+
+def iter_entities(request, top_level=None):
+    """
+    Yields the resource objects of a request body.
+    :param request: Django request object. Its body must not have been accessed before.
+    :param top_level: Optional dict, which is filled with the top-level members of a JSON:API document other than
+    data, e.g. relationships. Members are available as soon as they are parsed, so they have to precede data.
+    :return: Generator of resource object dicts.
+    :raises MemberOrderError: if top_level is given and a member follows data.
+    """
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        return iter_ndjson(request)
+    return iter_json_document(request, top_level)
+
+
+class MemberOrderError(ValueError):
+    """Raised if a top-level member of a document follows data, so it cannot apply to the items already yielded."""
+
+
+def iter_ndjson(stream):
+    """
+    Yields the objects of an NDJSON stream, empty lines are ignored.
+    :param stream: File-like object which can be iterated line by line.
+    :return: Generator of dicts.
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_document(stream, top_level):
+    """
+    Yields the items of the top-level data member of a JSON document, which may be an array or a single object.
+    :param stream: File-like object.
+    :param top_level: dict, which is filled with all other top-level members, or None if they are ignored.
+    :return: Generator of dicts.
+    :raises MemberOrderError: if top_level is given and a member follows data.
+    """
+    builder = None
+    building = None
+    data_seen = False
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if not prefix and event == "map_key":
+            if value == "data":
+                data_seen = True
+            elif data_seen and top_level is not None:
+                raise MemberOrderError("The top-level member {} has to precede data.".format(value))
+            continue
+        if building is None:
+            if not prefix or (prefix == "data" and event != "start_map") or "." in prefix and prefix != "data.item":
+                continue
+            if event in ("start_map", "start_array"):
+                builder = ObjectBuilder()
+                building = prefix
+            elif event not in ("map_key", "end_map", "end_array"):
+                # scalar top-level member
+                if top_level is not None:
+                    top_level[prefix] = value
+                continue
+            else:
+                continue
+
+        builder.event(event, value)
+        if prefix == building and event in ("end_map", "end_array"):
+            if building in ("data", "data.item"):
+                yield builder.value
+            elif top_level is not None:
+                top_level[building] = builder.value
+            builder = None
+            building = None
+
+
+def iter_chunks(iterable, size):
+    """
+    Splits an iterable into lists of at most size elements.
+    :param iterable: Iterable, e.g. a generator returned by iter_entities.
+    :param size: Maximal number of elements per chunk.
+    :return: Generator of lists.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
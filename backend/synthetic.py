@@ -0,0 +1,376 @@
+"""
+Synthetic data for load tests and benchmarks, see the management commands generatedata and loadtest.
+
+A population consists of origins, each with users, institutes, Stud.IP courses and events, and OERs. Users are created
+like by the provisioning route and additionally enable a share of the recommenders, as they would in the plugin.
+Courses are ingested through the same code as the course route, so the load driver can send the same payloads again.
+Resources are labeled with DDC codes by the fake SidBERT predictor, so recommenders which match resources by DDC code
+find candidates. All random choices are drawn from a seeded generator, the same options generate the same population.
+"""
+import datetime
+import json
+import logging
+import random
+from xml.sax.saxutils import escape
+
+from django.db import transaction
+from django.utils import timezone
+
+from backend import api_views
+from backend import bulk
+from backend import models
+from bert_app.fake_predictor import FakeSidBERT
+from recommenders import recommender_functions
+
+logger = logging.getLogger(__name__)
+
+#: Words the titles of synthetic resources are composed of.
+TOPICS = ["Einführung in die", "Grundlagen der", "Seminar zur", "Vorlesung", "Übung zur", "Kolloquium"]
+SUBJECTS = ["Informatik", "Psychologie", "Biologie", "Geschichte", "Mathematik", "Philosophie", "Chemie", "Physik",
+            "Linguistik", "Soziologie", "Kunstgeschichte", "Volkswirtschaftslehre", "Rechtswissenschaft", "Musik"]
+ASPECTS = ["", " des Mittelalters", " für Lehramt", " im Wandel", " und Gesellschaft", " in der Praxis"]
+
+#: Name prefix of origins and their api_endpoint, api_key is the same as api_endpoint.
+ORIGIN_PREFIX = "loadtest"
+
+
+def get_title(rng):
+    """
+    Composes a random resource title.
+    :param rng: random.Random instance.
+    :return: str
+    """
+    return "{} {}{}".format(rng.choice(TOPICS), rng.choice(SUBJECTS), rng.choice(ASPECTS))
+
+
+def get_origin(index):
+    """
+    Returns a synthetic origin, it is created if it does not exist yet.
+    :param index: Number of the origin.
+    :return: Origin object.
+    """
+    name = "{}{}".format(ORIGIN_PREFIX, index)
+    return models.Origin.objects.get_or_create(
+        api_endpoint=name, defaults={"name": name, "api_key": name, "type": "Stud.IP"},
+    )[0]
+
+
+def get_user_origin_id(index):
+    """
+    Returns the user_origin_id of a synthetic user.
+    :param index: Number of the user within its origin.
+    :return: str
+    """
+    return "user{}".format(index)
+
+
+def get_course_entities(rng, start, count, institute_origin_ids):
+    """
+    Creates Course JSON objects as sent by the course cronjob of the Stud.IP plugin.
+    :param rng: random.Random instance.
+    :param start: Number of the first course, courses with the same number get the same studip_id.
+    :param count: Number of courses.
+    :param institute_origin_ids: List of institute_origin_id strings the courses are assigned to.
+    :return: List of dicts.
+    """
+    semester_start = int(datetime.datetime(datetime.date.today().year, 4, 1, tzinfo=datetime.timezone.utc).timestamp())
+    entities = []
+    for number in range(start, start + count):
+        relationships = {}
+        if institute_origin_ids:
+            relationships["institute"] = {"data": [{"type": "Institute", "id": rng.choice(institute_origin_ids)}]}
+        entities.append({
+            "type": "Course",
+            "attributes": {
+                "studip_id": "course{}".format(number),
+                "name": get_title(rng),
+                "description": "Synthetischer Kurs {}".format(number),
+                "place": "Raum {}".format(rng.randint(1, 300)),
+                "start_time": semester_start + rng.randint(0, 90) * 86400,
+                "end_time": semester_start + rng.randint(91, 180) * 86400,
+                "start_semester": "SoSe",
+                "end_semester": "SoSe",
+                "url": "https://studip.example.org/course{}".format(number),
+            },
+            "relationships": relationships,
+        })
+    return entities
+
+
+def create_institutes(origin, count):
+    """
+    Creates the institutes of an origin.
+    :param origin: Origin object.
+    :param count: Number of institutes.
+    :return: List of institute_origin_id strings.
+    """
+    institute_origin_ids = ["institute{}".format(i) for i in range(count)]
+    existing = set(models.Institute.objects.filter(origin=origin).values_list("institute_origin_id", flat=True))
+    models.Institute.objects.bulk_create([
+        models.Institute(origin=origin, institute_origin_id=institute_origin_id,
+                         name="Institut für {}".format(SUBJECTS[i % len(SUBJECTS)]))
+        for i, institute_origin_id in enumerate(institute_origin_ids) if institute_origin_id not in existing
+    ])
+    return institute_origin_ids
+
+
+def create_courses(origin, rng, count, institute_origin_ids, batch_size=1000):
+    """
+    Creates Stud.IP courses through the ingestion code of the course route.
+    :param origin: Origin object.
+    :param rng: random.Random instance.
+    :param count: Number of courses.
+    :param institute_origin_ids: List of institute_origin_id strings the courses are assigned to.
+    :param batch_size: Number of courses per transaction.
+    :return: Number of created courses.
+    """
+    created = 0
+    for start in range(0, count, batch_size):
+        entities = get_course_entities(rng, start, min(batch_size, count - start), institute_origin_ids)
+        with transaction.atomic():
+            created += api_views.upsert_studip_courses(origin, entities, logger)["created"]
+    return created
+
+
+def create_events(origin, rng, count):
+    """
+    Creates Stud.IP events of randomly chosen courses of an origin.
+    :param origin: Origin object.
+    :param rng: random.Random instance.
+    :param count: Number of events.
+    :return: Number of created events.
+    """
+    courses = list(models.StudipCourse.objects.filter(origin=origin).only("pk", "title", "start_time"))
+    if not courses:
+        return 0
+    existing = set(models.StudipEvent.objects.filter(origin=origin).values_list("event_origin_id", flat=True))
+    events = []
+    for number in range(count):
+        event_origin_id = "event{}".format(number)
+        course = rng.choice(courses)
+        if event_origin_id in existing:
+            continue
+        start_time = (course.start_time or datetime.datetime.now(datetime.timezone.utc)) + \
+            datetime.timedelta(weeks=rng.randint(0, 12))
+        events.append(models.StudipEvent(
+            origin=origin,
+            course=course,
+            event_origin_id=event_origin_id,
+            title="{} (Termin {})".format(course.title, number),
+            start_time=start_time,
+            end_time=start_time + datetime.timedelta(hours=2),
+            place="Raum {}".format(rng.randint(1, 300)),
+            type=["SIP"],
+        ))
+    bulk.bulk_create_inherited(events)
+    return len(events)
+
+
+def create_oers(origin, rng, count):
+    """
+    Creates open educational resources of an origin.
+    :param origin: Origin object.
+    :param rng: random.Random instance.
+    :param count: Number of resources.
+    :return: Number of created resources.
+    """
+    existing = set(models.EducationalResource.objects.filter(
+        origin=origin, identifier__startswith="{}-oer".format(origin.api_endpoint)).values_list("identifier", flat=True))
+    oers = []
+    for number in range(count):
+        identifier = "{}-oer{}".format(origin.api_endpoint, number)
+        title = get_title(rng)
+        if identifier in existing:
+            continue
+        oers.append(models.EducationalResource(
+            origin=origin,
+            identifier=identifier,
+            title=title,
+            description="Synthetische OER {}".format(number),
+            source="https://oer.example.org/{}".format(number),
+            format=[rng.choice(["PDF", "VID", "WEB", "TXT"])],
+            type=["OER"],
+        ))
+    models.EducationalResource.objects.bulk_create(oers, batch_size=1000)
+    return len(oers)
+
+
+def label_resources(origin, predictor=None, batch_size=1000):
+    """
+    Assigns DDC codes to the unlabeled resources of an origin.
+    :param origin: Origin object.
+    :param predictor: Object with the prediction interface of SidBERT, by default a FakeSidBERT.
+    :param batch_size: Number of resources per update.
+    :return: Number of labeled resources.
+    """
+    predictor = predictor or FakeSidBERT()
+    unlabeled = models.EducationalResource.objects.filter(origin=origin, ddc_code__isnull=True).only("pk", "title")
+    labeled = 0
+    batch = []
+    for resource in unlabeled.iterator(chunk_size=batch_size):
+        mapping = predictor.predict_single_example(resource.title)
+        # stored like ProfessionsRecommenderBackbone.update_resources_bert does
+        resource.ddc_code = json.dumps(max(mapping.items(), key=lambda item: float(item[1]))[0])
+        resource.ddc_labeled = timezone.now()
+        batch.append(resource)
+        if len(batch) >= batch_size:
+            models.EducationalResource.objects.bulk_update(batch, ["ddc_code", "ddc_labeled"])
+            labeled += len(batch)
+            batch = []
+    models.EducationalResource.objects.bulk_update(batch, ["ddc_code", "ddc_labeled"])
+    return labeled + len(batch)
+
+
+def create_users(origin, count, batch_size=100):
+    """
+    Creates users with their initial data like the provisioning route.
+    :param origin: Origin object.
+    :param count: Number of users.
+    :param batch_size: Number of users per transaction.
+    :return: Number of created users.
+    """
+    user_origin_ids = [get_user_origin_id(i) for i in range(count)]
+    created = 0
+    for start in range(0, count, batch_size):
+        created += recommender_functions.provision_users(origin.id, user_origin_ids[start:start + batch_size])
+        logger.info("{} users created".format(created))
+    return created
+
+
+def create_memberships(origin, rng, courses_per_user):
+    """
+    Makes each user of an origin member of random courses of the origin, unless the user already has memberships.
+    :param origin: Origin object.
+    :param rng: random.Random instance.
+    :param courses_per_user: Number of courses per user.
+    :return: Number of created memberships.
+    """
+    course_ids = list(models.StudipCourse.objects.filter(origin=origin).values_list("pk", flat=True))
+    if not course_ids:
+        return 0
+    user_ids = models.SiddataUser.objects.filter(origin=origin).exclude(
+        coursemembership__isnull=False).values_list("id", flat=True)
+    memberships = [
+        models.CourseMembership(user_id=user_id, course_id=course_id, share_brain=True, share_social=rng.random() < 0.5)
+        for user_id in user_ids for course_id in rng.sample(course_ids, min(courses_per_user, len(course_ids)))
+    ]
+    models.CourseMembership.objects.bulk_create(memberships, batch_size=1000)
+    return len(memberships)
+
+
+def enable_recommenders(origin, rng, share):
+    """
+    Enables randomly chosen recommenders for the users of an origin, as the recommender PATCH route does when users
+    select recommenders in the plugin. Recommenders which were used by a user before are not initialized again.
+    :param origin: Origin object.
+    :param rng: random.Random instance.
+    :param share: Probability of a recommender being enabled by a user.
+    :return: Number of initialized recommenders.
+    """
+    recommenders = {rm.get_class_name(): rm for rm in recommender_functions.get_active_recommenders()}
+    userrecommenders = models.SiddataUserRecommender.objects.filter(
+        user__origin=origin, enabled=False, recommender__classname__in=recommenders.keys(),
+    ).exclude(goal__isnull=False).select_related("user", "recommender").order_by("user__user_origin_id",
+                                                                               "recommender__order")
+    initialized = 0
+    for userrecommender in userrecommenders:
+        if rng.random() >= share:
+            continue
+        try:
+            with transaction.atomic():
+                userrecommender.enabled = True
+                userrecommender.save()
+                recommenders[userrecommender.recommender.classname].initialize(userrecommender.user)
+            initialized += 1
+        except Exception:
+            logger.exception("Error while initializing {} for {}".format(userrecommender.recommender.classname,
+                                                                         userrecommender.user.user_origin_id))
+    return initialized
+
+
+def get_vcard(name):
+    """
+    Returns a vCard as found in the contribute elements of LOM records.
+    :param name: Full name.
+    :return: str
+    """
+    first, _, last = name.partition(" ")
+    return "BEGIN:VCARD\nVERSION:3.0\nN:{};{}\nFN:{}\nEND:VCARD".format(last, first, name)
+
+
+def get_lom_page(rng, start, count, n_creators, resumption_token=None):
+    """
+    Creates a ListRecords page of an OAI-PMH repository with LOM metadata as served by edu-sharing, e.g. to benchmark
+    the harvester without a recorded harvest. Every 20th record is deleted.
+    :param rng: random.Random instance.
+    :param start: Number of the first record.
+    :param count: Number of records.
+    :param n_creators: Number of distinct creators and publishers the records are assigned to.
+    :param resumption_token: Token of the next page, None for the last page.
+    :return: XML of the page as str.
+    """
+    records = []
+    for number in range(start, start + count):
+        datestamp = "2022-{:02d}-{:02d}T12:00:00Z".format(1 + number % 12, 1 + number % 28)
+        header = "<identifier>oai:synthetic:{}</identifier><datestamp>{}</datestamp>".format(number, datestamp)
+        if number % 20 == 19:
+            records.append('<record><header status="deleted">{}</header></record>'.format(header))
+            continue
+        creator, publisher, author = ("Person {}".format(rng.randrange(n_creators)) for _ in range(3))
+        title = escape(get_title(rng))
+        records.append("""<record><header>{header}</header><metadata>
+<lom:lom xmlns:lom="http://ltsc.ieee.org/xsd/LOM" xmlns="">
+  <lom:general>
+    <lom:identifier><lom:catalog>synthetic</lom:catalog><lom:entry>synthetic-{number}</lom:entry></lom:identifier>
+    <lom:title><string language="de">{title}</string></lom:title>
+    <lom:language>de</lom:language>
+    <lom:description><string language="de">Material zu {title}</string></lom:description>
+    <lom:keyword><string language="de">{subject}</string></lom:keyword>
+  </lom:general>
+  <lom:lifeCycle>
+    <lom:contribute>
+      <lom:role><lom:value>publisher</lom:value></lom:role>
+      <lom:entity><![CDATA[{publisher}]]></lom:entity>
+      <lom:date><lom:dateTime>{datestamp}</lom:dateTime></lom:date>
+    </lom:contribute>
+    <lom:contribute>
+      <lom:role><lom:value>author</lom:value></lom:role>
+      <lom:entity><![CDATA[{author}]]></lom:entity>
+    </lom:contribute>
+  </lom:lifeCycle>
+  <lom:metaMetadata>
+    <lom:contribute>
+      <lom:role><lom:value>creator</lom:value></lom:role>
+      <lom:entity><![CDATA[{creator}]]></lom:entity>
+    </lom:contribute>
+  </lom:metaMetadata>
+  <lom:technical>
+    <lom:format>application/pdf</lom:format>
+    <lom:location>https://oer.example.org/{number}</lom:location>
+  </lom:technical>
+  <lom:educational><lom:learningResourceType><lom:value>text</lom:value></lom:learningResourceType></lom:educational>
+  <lom:rights><lom:description><string language="de">CC BY 4.0</string></lom:description></lom:rights>
+  <lom:classification>
+    <lom:taxonPath><lom:taxon><lom:entry><string language="de">{subject}</string></lom:entry></lom:taxon></lom:taxonPath>
+  </lom:classification>
+</lom:lom></metadata></record>""".format(
+            header=header, number=number, title=title, subject=rng.choice(SUBJECTS), datestamp=datestamp,
+            publisher=get_vcard(publisher), author=get_vcard(author), creator=get_vcard(creator)))
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            '<responseDate>2022-05-10T00:00:00Z</responseDate><request verb="ListRecords">synthetic</request>'
+            '<ListRecords>{}<resumptionToken>{}</resumptionToken></ListRecords></OAI-PMH>').format(
+        "".join(records), resumption_token or "")
+
+
+def percentile(values, p):
+    """
+    Returns a percentile of measured values by the nearest-rank method.
+    :param values: Sorted list of numbers.
+    :param p: Percentile between 0 and 100.
+    :return: Number or None if there are no values.
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
@@ -0,0 +1,224 @@
+"""
+A small database-backed task queue for work which should not be executed within an HTTP request or the scheduler.
+
+Tasks are stored as `backend.models.BackgroundTask` objects. They are enqueued with `enqueue()` and executed by a
+worker process started via `python manage.py runworker`. As the queue lives in the database, enqueued tasks survive
+restarts of both the web server and the worker.
+
+Tasks with a higher priority are started first. A failed task is retried after TASK_RETRY_DELAY seconds, doubled with
+every attempt, until max_attempts is reached. A worker claims a task for TASK_VISIBILITY_TIMEOUT seconds and extends
+the claim while the task runs, so the task of a crashed worker is started again by another worker once its claim
+expired.
+"""
+import datetime
+import importlib
+import logging
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q
+from django.utils import timezone
+
+from backend import models
+
+#: Priority of tasks a user waits for, e.g. deferred side effects of requests.
+PRIORITY_HIGH = 10
+#: Default priority.
+PRIORITY_NORMAL = 0
+#: Priority of long-running maintenance tasks, e.g. scheduled jobs.
+PRIORITY_LOW = -10
+
+logger = logging.getLogger("backend.task_queue")
+
+
+def enqueue(function, label=None, priority=PRIORITY_NORMAL, max_attempts=None, delay=None, unique=False, **kwargs):
+    """
+    Adds a task to the queue.
+    :param function: Dotted path of the function to be executed, e.g. "recommenders.recommender_functions.process_activity_task"
+    :param label: Label used to aggregate metrics, e.g. the class name of a recommender.
+    :param priority: Tasks with higher priority are started first.
+    :param max_attempts: Number of times the task is started before it is marked as failed, by default
+    TASK_MAX_ATTEMPTS. Only tasks which can safely be repeated should be retried.
+    :param delay: Optional timedelta the task is not started before.
+    :param unique: If True, no task is added if the same function with the same arguments is already queued or
+    running. A running task only counts as long as its claim is valid, as its worker may have got lost otherwise.
+    :param kwargs: JSON-serializable keyword arguments the function is called with.
+    :return: The created BackgroundTask instance, or the queued or running one if unique is set.
+    """
+    # fail early, not in the worker, if the function does not exist
+    resolve_function(function)
+    if unique:
+        pending = models.BackgroundTask.objects.filter(function=function, kwargs=kwargs).filter(
+            Q(status=models.BackgroundTask.STATUSES.queued)
+            | Q(status=models.BackgroundTask.STATUSES.running, visible_until__gte=timezone.now())
+        ).first()
+        if pending is not None:
+            return pending
+    return models.BackgroundTask.objects.create(
+        function=function,
+        label=label,
+        kwargs=kwargs,
+        priority=priority,
+        max_attempts=max_attempts or getattr(settings, "TASK_MAX_ATTEMPTS", 3),
+        run_after=timezone.now() + delay if delay else None,
+    )
+
+
+def resolve_function(function):
+    """
+    Imports the function identified by a dotted path.
+    :param function: Dotted path of the function.
+    :return: The function object.
+    """
+    module_path, _, function_name = function.rpartition('.')
+    module = importlib.import_module(module_path)
+    return getattr(module, function_name)
+
+
+def get_visibility_timeout():
+    """
+    :return: timedelta for which a claimed task is hidden from other workers, see TASK_VISIBILITY_TIMEOUT.
+    """
+    return datetime.timedelta(seconds=getattr(settings, "TASK_VISIBILITY_TIMEOUT", 300))
+
+
+def claim_next_task():
+    """
+    Fetches the queued task with the highest priority, or a running task whose worker got lost, and marks it as
+    running. Concurrent workers skip rows locked by each other.
+    :return: BackgroundTask instance or None if the queue is empty.
+    """
+    while True:
+        with transaction.atomic():
+            now = timezone.now()
+            task = models.BackgroundTask.objects.select_for_update(skip_locked=True).filter(
+                Q(status=models.BackgroundTask.STATUSES.queued, run_after__isnull=True)
+                | Q(status=models.BackgroundTask.STATUSES.queued, run_after__lte=now)
+                | Q(status=models.BackgroundTask.STATUSES.running, visible_until__lt=now)
+            ).order_by("-priority", "created").first()
+            if task is None:
+                return None
+
+            if task.status == models.BackgroundTask.STATUSES.running:
+                logger.warning("Worker of task {} ({}) got lost".format(task.id, task.function))
+                if task.attempts >= task.max_attempts:
+                    task.status = models.BackgroundTask.STATUSES.failed
+                    task.error = "The worker got lost in attempt {}.".format(task.attempts)
+                    task.finished = now
+                    task.save(update_fields=["status", "error", "finished"])
+                    continue
+
+            task.status = models.BackgroundTask.STATUSES.running
+            task.attempts += 1
+            task.started = now
+            task.run_after = None
+            task.visible_until = now + get_visibility_timeout()
+            task.save(update_fields=["status", "attempts", "started", "run_after", "visible_until"])
+        return task
+
+
+def extend_visibility(task_ids):
+    """
+    Extends the claim of running tasks by TASK_VISIBILITY_TIMEOUT. Called by the worker while the tasks are executed.
+    :param task_ids: IDs of the tasks.
+    :return: Number of extended tasks.
+    """
+    return models.BackgroundTask.objects.filter(
+        id__in=task_ids, status=models.BackgroundTask.STATUSES.running,
+    ).update(visible_until=timezone.now() + get_visibility_timeout())
+
+
+def run_task(task):
+    """
+    Executes a claimed task and stores its result or error. A failed task is queued again with a delay if it has
+    attempts left.
+    :param task: BackgroundTask instance.
+    :return: True if the task succeeded, else False.
+    """
+    try:
+        result = resolve_function(task.function)(**task.kwargs)
+        task.result = result if result is None or isinstance(result, (str, int, float, bool, list, dict)) else str(result)
+        task.error = None
+        task.status = models.BackgroundTask.STATUSES.done
+        task.finished = timezone.now()
+    except Exception as e:
+        logger.error("Task {} ({}) failed in attempt {}: {}".format(task.id, task.function, task.attempts, e))
+        task.error = traceback.format_exc()
+        if task.attempts < task.max_attempts:
+            delay = getattr(settings, "TASK_RETRY_DELAY", 60) * 2 ** (task.attempts - 1)
+            task.status = models.BackgroundTask.STATUSES.queued
+            task.run_after = timezone.now() + datetime.timedelta(seconds=delay)
+        else:
+            task.status = models.BackgroundTask.STATUSES.failed
+            task.finished = timezone.now()
+
+    # a task whose claim expired may have been started by another worker meanwhile, which then owns the result
+    updated = models.BackgroundTask.objects.filter(
+        id=task.id, status=models.BackgroundTask.STATUSES.running, attempts=task.attempts,
+    ).update(result=task.result, error=task.error, status=task.status, finished=task.finished,
+             run_after=task.run_after, visible_until=None)
+    if not updated:
+        logger.warning("Task {} ({}) was claimed by another worker, attempt {} is discarded".format(
+            task.id, task.function, task.attempts))
+        return False
+    return task.status == models.BackgroundTask.STATUSES.done
+
+
+def get_queue_depth():
+    """
+    Counts the tasks which are waiting to be started, per label and priority.
+    :return: List of dicts with label, priority, number of queued tasks, number of tasks waiting for a retry and the
+    age of the oldest queued task in seconds, ordered by descending priority.
+    """
+    now = timezone.now()
+    depth = []
+    for entry in models.BackgroundTask.objects.filter(status=models.BackgroundTask.STATUSES.queued).values(
+            "label", "priority").annotate(
+            queued=Count("id"),
+            retrying=Count("id", filter=Q(attempts__gt=0)),
+            oldest=Min("created"),
+    ).order_by("-priority", "label"):
+        entry["age"] = (now - entry.pop("oldest")).total_seconds()
+        depth.append(entry)
+    return depth
+
+
+def get_task_metrics(since=None):
+    """
+    Aggregates queue latency (time between enqueueing and start) and processing time of finished tasks per label.
+    :param since: Only tasks created after this datetime are taken into account. Defaults to the last 24 hours.
+    :return: dict mapping labels to metric dicts, durations are given in seconds.
+    """
+    if since is None:
+        since = timezone.now() - datetime.timedelta(days=1)
+
+    tasks = models.BackgroundTask.objects.filter(created__gte=since)
+    metrics = {}
+    for entry in tasks.values("label").annotate(
+            queued=Count("id", filter=Q(status=models.BackgroundTask.STATUSES.queued)),
+            running=Count("id", filter=Q(status=models.BackgroundTask.STATUSES.running)),
+            failed=Count("id", filter=Q(status=models.BackgroundTask.STATUSES.failed)),
+            retried=Count("id", filter=Q(attempts__gt=1)),
+            total=Count("id"),
+    ):
+        metrics[entry["label"]] = {
+            "total": entry["total"],
+            "queued": entry["queued"],
+            "running": entry["running"],
+            "failed": entry["failed"],
+            "retried": entry["retried"],
+        }
+
+    queue_latency = ExpressionWrapper(F("started") - F("created"), output_field=DurationField())
+    processing_time = ExpressionWrapper(F("finished") - F("started"), output_field=DurationField())
+    for entry in tasks.filter(finished__isnull=False).values("label").annotate(
+            avg_queue_latency=Avg(queue_latency),
+            max_queue_latency=Max(queue_latency),
+            avg_processing_time=Avg(processing_time),
+            max_processing_time=Max(processing_time),
+    ):
+        for key in ["avg_queue_latency", "max_queue_latency", "avg_processing_time", "max_processing_time"]:
+            metrics[entry["label"]][key] = entry[key].total_seconds() if entry[key] is not None else None
+
+    return metrics
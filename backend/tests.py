@@ -1,14 +1,70 @@
-BackendConfig
-from django.test import TestCase
+import base64
+import collections
+import datetime
+import difflib
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 #logging.info(os.getcwd())
+from PIL import Image
+
+from recommenders import recommender_functions
+from scheduled_tasks import db_tasks
+from scheduled_tasks import educational_resource_functions
+from scheduled_tasks import leader
 from recommenders.RM_gettogether import RM_gettogether
-from .models import Degree, Subject, SiddataUser, SiddataUserStudy, Goal, Category, Origin, GoalCategory
+from recommenders.RM_professions import COURSE_MAX, RM_professions
+from backend import fragment_cache
+from backend import images
+from backend import request_metrics
+from backend import streaming
+from backend import synthetic
+from backend import task_queue
+from backend.management.commands import benchmarkharvest
+from backend.management.commands import loadtest
+from bert_app.fake_predictor import FakeSidBERT
+from .models import Degree, Subject, SiddataUser, SiddataUserStudy, Goal, Category, Origin, GoalCategory, \
+    StudipCourse, CourseMembership, Institute, Lecturer, CourseLecturer, Person, \
+    Recommender, SiddataUserRecommender, Activity, RequestLog, GoalProperty, EducationalResource, Question, \
+    StudipEvent, Lease, BackgroundTask, WebResource, HarvestState, InheritingCourse, InterestState, Tombstone, \
+    Announcement
 
 # Global constants
 DEBUG = False
 ROUND = 2
 
 
+def failing_task(message):
+    """Task function for the task queue tests."""
+    raise ValueError(message)
+
+
+def crashing_task():
+    """Task function for the task queue tests, which ends its process like the out-of-memory killer would."""
+    os._exit(1)
+
+
 def create_test_database_fixed_size(config, goal_comparison=False):
     """
     Creates a database with a fixed size suitable for the unit testing for user-similarity functions.
@@ -124,6 +180,7 @@ def create_test_database_fixed_size(config, goal_comparison=False):
         "goal_categories": goal_categories,
     }
 
+@unittest.skip("RM_gettogether no longer provides compare_users and compare_subject_strings")
 class TestSimilarityFunctions(TestCase):
     """
     A test class to test the similarity functions of the RM Gettogether
@@ -241,6 +298,7 @@ class TestSimilarityFunctions(TestCase):
         self.assertEqual(similarity, 1)
 
 
+@unittest.skip("RM_gettogether no longer provides get_similar_users")
 class TestUserRecommendationFunctions(TestCase):
     """
     A test class to test get_similar_user functions
@@ -343,3 +401,1317 @@ class TestUserRecommendationFunctions(TestCase):
     #     users = data["users"]
     #     # Create an instance of RM_gettogether
     #     my_RM = RM_gettogether()
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class TestMembershipSync(TestCase):
+    """
+    Benchmarks the synchronization of course memberships in the student PATCH route with a student who has 200 course
+    memberships.
+    """
+
+    N_COURSES = 200
+
+    def setUp(self):
+        self.origin = Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        self.user = SiddataUser.objects.create(origin=self.origin, user_origin_id="student")
+        self.courses = [
+            StudipCourse.objects.create(origin=self.origin, course_origin_id="course{}".format(i), title="Kurs {}".format(i))
+            for i in range(self.N_COURSES)
+        ]
+        CourseMembership.objects.bulk_create([
+            CourseMembership(user=self.user, course=course, share_brain=True, share_social=True)
+            for course in self.courses
+        ])
+
+    def patch_student(self, courses_brain, courses_social):
+        payload = {
+            "data": {
+                "id": "student",
+                "attributes": {"data_donation": True},
+                "relationships": {
+                    "institutes_brain": {"data": []},
+                    "institutes_social": {"data": []},
+                    "courses_brain": {"data": [{"id": c.course_origin_id, "type": "Course"} for c in courses_brain]},
+                    "courses_social": {"data": [{"id": c.course_origin_id, "type": "Course"} for c in courses_social]},
+                },
+            }
+        }
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = Client().patch("/api/student?origin=abc&api_key=key", json.dumps(payload),
+                                      content_type="application/json")
+            duration = time.perf_counter() - start
+        logging.info("student PATCH with {} memberships: {:.3f}s, {} queries".format(
+            self.N_COURSES, duration, len(queries)))
+        self.assertEqual(response.status_code, 200)
+        return queries
+
+    def test_membership_sync(self):
+        # keep 100 memberships unchanged, revoke social sharing of 50, revoke all sharing of 50 and add 50 new ones
+        new_courses = [
+            StudipCourse.objects.create(origin=self.origin, course_origin_id="new{}".format(i), title="Neu {}".format(i))
+            for i in range(50)
+        ]
+        courses_brain = self.courses[:150] + new_courses
+        courses_social = self.courses[:100] + new_courses
+        queries = self.patch_student(courses_brain, courses_social)
+
+        memberships = CourseMembership.objects.filter(user=self.user)
+        self.assertEqual(memberships.count(), 200)
+        self.assertEqual(memberships.filter(share_brain=True).count(), 200)
+        self.assertEqual(memberships.filter(share_social=True).count(), 150)
+        self.assertFalse(memberships.filter(course__in=self.courses[150:]).exists())
+
+        # the number of queries does not depend on the number of memberships
+        self.assertLess(len(queries), 25)
+
+    def test_unchanged_memberships(self):
+        queries = self.patch_student(self.courses, self.courses)
+        self.assertEqual(CourseMembership.objects.filter(user=self.user, share_brain=True, share_social=True).count(),
+                         self.N_COURSES)
+        self.assertFalse(any(query["sql"].startswith(("INSERT", "DELETE")) for query in queries))
+
+    def test_other_course_types(self):
+        # memberships refer to Stud.IP courses, other courses like MOOCs are skipped
+        mooc = InheritingCourse.objects.create(origin=self.origin, course_origin_id="mooc", title="MOOC", type=["MOOC"])
+        self.patch_student(self.courses, self.courses + [mooc])
+        self.assertEqual(CourseMembership.objects.filter(user=self.user, share_brain=True, share_social=True).count(),
+                         self.N_COURSES)
+
+
+class TestDeltaSync(TransactionTestCase):
+    """
+    Tests the delta sync of the goal and activity routes with the since parameter. Changes are numbered by transaction,
+    so the tests commit them instead of running in a single transaction.
+    """
+
+    def setUp(self):
+        self.origin = Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        self.user = SiddataUser.objects.create(origin=self.origin, user_origin_id="student")
+        recommender = Recommender.objects.create(name="Test", classname="RM_test", order=1)
+        userrecommender = SiddataUserRecommender.objects.create(user=self.user, recommender=recommender, enabled=True)
+        self.goal = Goal.objects.create(title="Ziel", userrecommender=userrecommender)
+        self.activities = [
+            Activity.objects.create(goal=self.goal, title="Aktivität {}".format(i), type="todo", order=i)
+            for i in range(100)
+        ]
+
+    def get(self, route, since=None):
+        url = "/api/{}?origin=abc&api_key=key&user_origin_id=student".format(route)
+        if since is not None:
+            url += "&since={}".format(since)
+        response = Client().get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_activity_changes(self):
+        token = self.get("activity")["meta"]["token"]
+
+        changes = self.get("activity", token)
+        self.assertEqual(changes["data"], [])
+        self.assertEqual(changes["meta"]["deleted"], [])
+
+        self.activities[0].status = "done"
+        self.activities[0].save()
+        deleted_id = str(self.activities[1].id)
+        self.activities[1].delete()
+
+        changes = self.get("activity", token)
+        self.assertEqual([activity["id"] for activity in changes["data"]], [str(self.activities[0].id)])
+        self.assertEqual(changes["meta"]["deleted"], [{"type": "Activity", "id": deleted_id}])
+
+        # the new token only returns later changes
+        self.assertEqual(self.get("activity", changes["meta"]["token"])["data"], [])
+
+    def test_goal_changes(self):
+        token = self.get("goal")["meta"]["token"]
+        self.activities[0].title = "Geändert"
+        self.activities[0].save()
+
+        changes = self.get("goal", token)
+        self.assertEqual([goal["id"] for goal in changes["data"]], [str(self.goal.id)])
+        self.assertEqual([entry["id"] for entry in changes["included"] if entry["type"] == "Activity"],
+                         [str(self.activities[0].id)])
+
+        goal_id = str(self.goal.id)
+        self.goal.delete()
+        deleted = self.get("goal", changes["meta"]["token"])["meta"]["deleted"]
+        self.assertIn({"type": "Goal", "id": goal_id}, deleted)
+        self.assertEqual(len([entry for entry in deleted if entry["type"] == "Activity"]), 100)
+
+    def test_bulk_updates(self):
+        token = self.get("goal")["meta"]["token"]
+        version = Goal.objects.get(id=self.goal.id).version
+        with CaptureQueriesContext(connection) as queries:
+            self.activities[0].title = "Geändert"
+            self.activities[0].save()
+        # the versions are incremented by the UPDATE statements and only loaded when they are accessed
+        self.assertEqual(len([query for query in queries if query["sql"].startswith("SELECT")]), 0)
+        self.assertEqual(self.activities[0].version, 2)
+
+        updated = [str(activity.id) for activity in self.activities[1:3]]
+        Activity.objects.filter(id__in=updated).exclude(status="done").update(status="done")
+        changes = self.get("activity", token)
+        self.assertEqual(sorted(activity["id"] for activity in changes["data"]),
+                         sorted(updated + [str(self.activities[0].id)]))
+        self.assertEqual(Activity.objects.get(id=updated[0]).version, 2)
+        self.assertEqual(Goal.objects.get(id=self.goal.id).version, version + 2)
+
+    def test_invalid_token(self):
+        response = Client().get("/api/activity?origin=abc&api_key=key&user_origin_id=student&since=abc")
+        self.assertEqual(response.status_code, 400)
+
+    def test_uncommitted_changes(self):
+        token = self.get("activity")["meta"]["token"]
+        changed = threading.Event()
+        commit = threading.Event()
+
+        def change_activity():
+            with transaction.atomic():
+                activity = Activity.objects.get(id=self.activities[0].id)
+                activity.status = "done"
+                activity.save()
+                changed.set()
+                commit.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=change_activity)
+        thread.start()
+        self.assertTrue(changed.wait(10))
+        # the token issued while the change is uncommitted still returns it once it is committed
+        later_token = self.get("activity", token)["meta"]["token"]
+        commit.set()
+        thread.join()
+        changes = self.get("activity", later_token)
+        self.assertEqual([activity["id"] for activity in changes["data"]], [str(self.activities[0].id)])
+
+    def test_bulk_deletions(self):
+        token = self.get("goal")["meta"]["token"]
+        deleted_ids = [str(activity.id) for activity in self.activities[:10]]
+        Activity.objects.filter(id__in=deleted_ids).delete()
+        deleted = self.get("activity", token)["meta"]["deleted"]
+        self.assertEqual(sorted(entry["id"] for entry in deleted), sorted(deleted_ids))
+
+        # goals deleted by cascade leave tombstones of their activities and properties
+        GoalProperty.objects.create(goal=self.goal, key="k", value="v")
+        with CaptureQueriesContext(connection) as queries:
+            self.goal.userrecommender.delete()
+        # tombstones are written set-wise, not per deleted object
+        self.assertLess(len(queries), 20)
+        deleted = self.get("goal", token)["meta"]["deleted"]
+        self.assertIn({"type": "Goal", "id": str(self.goal.id)}, deleted)
+        self.assertEqual(len([entry for entry in deleted if entry["type"] == "Activity"]), 100)
+        self.assertEqual(len([entry for entry in deleted if entry["type"] == "GoalProperty"]), 1)
+
+        # tombstones are removed with their user
+        self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class TestUserBootstrap(TestCase):
+    """
+    Measures the creation of the initial data of a new user.
+    """
+
+    def setUp(self):
+        self.origin = Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        recommender_functions.reload_recommenders()
+        self.recommenders = recommender_functions.get_active_recommenders()
+        for rm in self.recommenders:
+            rm.initialize_templates()
+
+    def test_bootstrap(self):
+        # warm up the process-wide caches of templates and p2 IDs
+        recommender_functions.create_initial_data_for_user(
+            SiddataUser.objects.create(origin=self.origin, user_origin_id="warmup"))
+
+        user = SiddataUser.objects.create(origin=self.origin, user_origin_id="student")
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            self.assertTrue(recommender_functions.create_initial_data_for_user(user))
+            duration = time.perf_counter() - start
+        logging.info("Bootstrap of a user: {:.3f}s, {} queries".format(duration, len(queries)))
+
+        userrecommenders = SiddataUserRecommender.objects.filter(user=user)
+        self.assertEqual(userrecommenders.count(), len(self.recommenders))
+        self.assertEqual([ur.recommender.classname for ur in userrecommenders.filter(enabled=True)], ["RM_start"])
+        goal = Goal.objects.get(userrecommender__user=user)
+        n_teasers = Activity.objects.filter(goal=goal, template_ref__template_id__endswith="_AC_teaser").count()
+        self.assertEqual(n_teasers, len(self.recommenders) - 1)
+        # the number of queries does not depend on the number of recommenders
+        self.assertLess(len(queries), 20)
+
+        # a repeated call does not duplicate anything
+        n_activities = Activity.objects.filter(goal=goal).count()
+        self.assertTrue(recommender_functions.create_initial_data_for_user(user))
+        self.assertEqual(Activity.objects.filter(goal=goal).count(), n_activities)
+
+    def test_provisioning(self):
+        SiddataUser.objects.create(origin=self.origin, user_origin_id="student0")
+        user_origin_ids = ["student{}".format(i) for i in range(20)]
+
+        created = recommender_functions.provision_users(self.origin.id, user_origin_ids)
+        self.assertEqual(created, 19)
+        self.assertEqual(SiddataUser.objects.filter(origin=self.origin).count(), 20)
+        self.assertEqual(Goal.objects.filter(userrecommender__user__origin=self.origin).count(), 19)
+        self.assertEqual(recommender_functions.provision_users(self.origin.id, user_origin_ids), 0)
+
+    def test_provisioning_with_failing_user(self):
+        Announcement.objects.create(title="Neu", description="Beschreibung", active=True)
+        start = recommender_functions.get_recommender_by_classname("RM_start")
+        push_announcements = start.push_announcements
+
+        def failing_push_announcements(user=None):
+            if user is not None and user.user_origin_id == "student1":
+                # a failing statement aborts the transaction up to the last savepoint
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 / 0")
+            return push_announcements(user)
+
+        start.push_announcements = failing_push_announcements
+        try:
+            created = recommender_functions.provision_users(self.origin.id, ["student0", "student1", "student2"])
+        finally:
+            start.push_announcements = push_announcements
+        # the failing user is removed, the others of the batch keep their initial data and announcements
+        self.assertEqual(created, 2)
+        self.assertEqual(sorted(SiddataUser.objects.filter(origin=self.origin).values_list("user_origin_id", flat=True)),
+                         ["student0", "student2"])
+        self.assertEqual(Activity.objects.filter(title="Neu").count(), 2)
+
+    def test_provisioning_route(self):
+        payload = {"data": [{"type": "SiddataUser", "id": "student{}".format(i)} for i in range(250)]}
+        response = Client().post("/api/provisioning?origin=abc&api_key=key", json.dumps(payload),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(response.json()["data"]), 3)
+
+
+def create_course_payload(n_courses, institutes, lecturers):
+    """
+    Creates a synthetic payload of the Stud.IP course cronjob.
+    :param n_courses: Number of courses.
+    :param institutes: List of Institute objects the courses are assigned to.
+    :param lecturers: List of Lecturer objects, each course gets two of them.
+    :return: JSON-ready dict
+    """
+    return {"data": [{
+        "type": "Course",
+        "attributes": {
+            "studip_id": "course{}".format(i),
+            "name": "Kurs {}".format(i),
+            "description": "Beschreibung von Kurs {}".format(i),
+            "place": "Raum {}".format(i % 50),
+            "start_time": 1633039200 + i,
+            "end_time": 1643670000 + i,
+            "start_semester": "WiSe 21/22",
+            "end_semester": "WiSe 21/22",
+            "url": "https://studip.example.org/course{}".format(i),
+        },
+        "relationships": {
+            "institute": {"data": [{"type": "Institute", "id": institutes[i % len(institutes)].institute_origin_id}]},
+            "lecturers": {"data": [
+                {"type": "Lecturer", "id": lecturers[i % len(lecturers)].person_origin_id},
+                {"type": "Lecturer", "id": lecturers[(i + 1) % len(lecturers)].person_origin_id},
+            ]},
+        },
+    } for i in range(n_courses)]}
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class TestCourseIngestion(TestCase):
+    """
+    Measures the course route with a synthetic catalogue push.
+    """
+
+    N_COURSES = 2000
+
+    def setUp(self):
+        self.origin = Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        self.institutes = [
+            Institute.objects.create(name="Institut {}".format(i), origin=self.origin, institute_origin_id="inst{}".format(i))
+            for i in range(10)
+        ]
+        self.lecturers = [
+            Lecturer.objects.create(origin=self.origin, person_origin_id="lecturer{}".format(i))
+            for i in range(100)
+        ]
+
+    def post_courses(self, payload):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = Client().post("/api/course?origin=abc&api_key=key", json.dumps(payload),
+                                     content_type="application/json")
+            duration = time.perf_counter() - start
+        logging.info("course POST with {} courses: {:.3f}s, {} queries".format(
+            len(payload["data"]), duration, len(queries)))
+        self.assertEqual(response.status_code, 200)
+        return queries, response.json()["meta"]
+
+    def test_course_ingestion(self):
+        payload = create_course_payload(self.N_COURSES, self.institutes, self.lecturers)
+        queries, counts = self.post_courses(payload)
+        self.assertEqual(counts["created"], self.N_COURSES)
+        self.assertEqual(StudipCourse.objects.filter(origin=self.origin).count(), self.N_COURSES)
+        self.assertEqual(CourseLecturer.objects.count(), 2 * self.N_COURSES)
+        self.assertLess(len(queries), 50)
+
+        # a second push updates the changed courses without creating duplicates
+        for entity in payload["data"][:self.N_COURSES // 2]:
+            entity["attributes"]["name"] += " (aktualisiert)"
+        queries, counts = self.post_courses(payload)
+        self.assertEqual(counts, {"message": "Kurs wurde gespeichert", "created": 0, "updated": self.N_COURSES // 2,
+                                  "skipped": self.N_COURSES // 2})
+        self.assertEqual(StudipCourse.objects.filter(origin=self.origin).count(), self.N_COURSES)
+        self.assertEqual(StudipCourse.objects.filter(title__endswith="(aktualisiert)").count(), self.N_COURSES // 2)
+        self.assertEqual(CourseLecturer.objects.count(), 2 * self.N_COURSES)
+        self.assertLess(len(queries), 50)
+
+        # an unchanged push only costs the hash lookup
+        queries, counts = self.post_courses(payload)
+        self.assertEqual(counts["skipped"], self.N_COURSES)
+        self.assertFalse(any(query["sql"].startswith(("INSERT", "UPDATE")) for query in queries))
+
+    def test_ndjson_course_ingestion(self):
+        payload = create_course_payload(100, self.institutes, self.lecturers)
+        body = "\n".join(json.dumps(entity) for entity in payload["data"])
+        response = Client().post("/api/course?origin=abc&api_key=key", body,
+                                 content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["meta"]["created"], 100)
+
+        # the same courses sent as JSON:API document are recognized as unchanged
+        _, counts = self.post_courses(payload)
+        self.assertEqual(counts["skipped"], 100)
+
+    def test_course_listing(self):
+        self.post_courses(create_course_payload(250, self.institutes, self.lecturers))
+
+        # walking the pages returns every course exactly once
+        ids = []
+        url = "/api/course?origin=abc&api_key=key&page[size]=100"
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = Client().get(url)
+            self.assertEqual(response.status_code, 200)
+            # origin lookups and one query for the page, independent of the page size
+            self.assertLessEqual(len(queries), 3)
+            ids += [course["id"] for course in response.json()["data"]]
+            url = response.json()["links"]["next"]
+        self.assertEqual(len(ids), 250)
+        self.assertEqual(len(set(ids)), 250)
+
+        response = Client().get("/api/course?origin=abc&api_key=key&stream=true")
+        self.assertTrue(response.streaming)
+        streamed = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(sorted(course["id"] for course in streamed["data"]), sorted(ids))
+
+        response = Client().get("/api/course?origin=abc&api_key=key&page[size]=0")
+        self.assertEqual(response.status_code, 400)
+
+    def test_member_order(self):
+        relationships = {"activity": {"data": [{"id": "x"}]}}
+        items = [{"type": "Person", "id": "p1"}, {"type": "Person", "id": "p2"}]
+
+        top_level = {}
+        document = json.dumps({"relationships": relationships, "data": items}).encode()
+        self.assertEqual(list(streaming.iter_json_document(io.BytesIO(document), top_level)), items)
+        self.assertEqual(top_level, {"relationships": relationships})
+
+        # members following data cannot apply to the items already yielded
+        document = json.dumps({"data": items, "relationships": relationships}).encode()
+        self.assertEqual(list(streaming.iter_json_document(io.BytesIO(document), None)), items)
+        with self.assertRaises(streaming.MemberOrderError):
+            list(streaming.iter_json_document(io.BytesIO(document), {}))
+
+        payload = {"data": [{"type": "Person", "id": "p1", "attributes": {
+            "first_name": "Ada", "surname": "Lovelace", "email": "ada@example.org"}}],
+            "relationships": relationships}
+        response = Client().post("/api/person?origin=abc&api_key=key", json.dumps(payload),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Person.objects.filter(email="ada@example.org").exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class TestPersonImages(TestCase):
+    """Tests the content-addressed storage of person images."""
+
+    def create_image(self, size=(800, 600)):
+        buffer = io.BytesIO()
+        Image.new("RGBA", size, (255, 0, 0, 128)).save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def test_identical_images_are_stored_once(self):
+        data = self.create_image()
+        name, image_hash = images.store_image(data)
+        self.assertEqual(images.store_image(data), (name, image_hash))
+        self.assertEqual(name, images.get_image_name(image_hash, ".png"))
+
+        with images.default_storage.open(images.get_thumbnail_name(image_hash)) as thumbnail_file:
+            thumbnail = Image.open(thumbnail_file)
+            self.assertEqual(thumbnail.format, "JPEG")
+            self.assertLessEqual(max(thumbnail.size), 240)
+
+    def test_person_image_route(self):
+        Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        payload = {"data": [{"type": "Person", "id": "p1", "attributes": {
+            "first_name": "Ada", "surname": "Lovelace", "email": "ada@example.org",
+            "image": base64.b64encode(self.create_image()).decode(),
+        }}]}
+        Client().post("/api/person?origin=abc&api_key=key", json.dumps(payload), content_type="application/json")
+        image_hash = Person.objects.exclude(image_hash=None).values_list("image_hash", flat=True).first()
+        self.assertIsNotNone(image_hash)
+
+        response = Client().get("/api/image/{}".format(image_hash))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = Client().get("/api/image/{}".format(image_hash), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        person = Person.objects.get(image_hash=image_hash)
+        self.assertEqual(person.serialize()["data"][0]["attributes"]["image"],
+                         "{}/api/image/{}".format(settings.BASE_URL, image_hash))
+
+    @override_settings(PERSON_IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_invalid_images_are_rejected(self):
+        with self.assertRaises(images.InvalidImageError):
+            images.store_image(b"no image")
+        with self.assertRaises(images.InvalidImageError):
+            images.store_image(self.create_image()[:100])
+        # the pixel count is checked before the image is decoded
+        with self.assertRaises(images.InvalidImageError):
+            images.store_image(self.create_image((2000, 1000)))
+
+        Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        valid_image = self.create_image((300, 200))
+        payload = {"data": [
+            {"type": "Person", "id": "p0", "attributes": {
+                "first_name": "Charles", "surname": "Babbage", "email": "charles@example.org",
+                "image": base64.b64encode(valid_image).decode(),
+            }},
+            {"type": "Person", "id": "p1", "attributes": {
+                "first_name": "Ada", "surname": "Lovelace", "email": "ada@example.org",
+                "image": base64.b64encode(b"no image").decode(),
+            }},
+        ]}
+        response = Client().post("/api/person?origin=abc&api_key=key", json.dumps(payload),
+                                 content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Person.objects.filter(email__in=["ada@example.org", "charles@example.org"]).exists())
+        # the images of a chunk are validated before any of them is stored
+        image_name = images.get_image_name(hashlib.sha256(valid_image).hexdigest(), ".png")
+        self.assertFalse(images.default_storage.exists(image_name))
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0, REQUEST_LOG_BUFFER_SIZE=5, METRICS_TOKEN="secret")
+class TestRequestMetrics(TestCase):
+    """Tests the request instrumentation and the metrics route."""
+
+    def setUp(self):
+        Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        # discard measurements of requests of other tests
+        request_metrics.flush()
+        RequestLog.objects.all().delete()
+
+    def test_request_metrics(self):
+        for _ in range(5):
+            Client().get("/api/course?origin=abc&api_key=key")
+
+        # the buffer is written with one insert once it is full
+        logs = RequestLog.objects.filter(route="api/course")
+        self.assertEqual(logs.count(), 5)
+        self.assertTrue(all(log.status == 200 and log.origin == "abc" and log.query_count > 0 for log in logs))
+
+        self.assertEqual(Client().get("/api/metrics").status_code, 401)
+        response = Client().get("/api/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('siddata_request_duration_seconds_count{route="api/course",method="GET",status="200"}',
+                      response.content.decode())
+
+        # unmeasured requests write the buffer as well once the flush interval has passed
+        Client().get("/api/course?origin=abc&api_key=key")
+        self.assertEqual(RequestLog.objects.filter(route="api/course").count(), 5)
+        with override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0, REQUEST_LOG_FLUSH_INTERVAL=0):
+            Client().get("/api/course?origin=abc&api_key=key")
+        self.assertEqual(RequestLog.objects.filter(route="api/course").count(), 6)
+
+
+def create_synthetic_user(origin, user_origin_id, n_goals, n_activities, n_resources):
+    """
+    Creates a user with one recommender, n_goals goals with two properties each and n_activities activities per goal.
+    The activities refer round-robin to n_resources resources, questions and persons.
+    :param origin: Origin of the user and the resources.
+    :param user_origin_id: ID of the user in the origin system.
+    :param n_goals: Number of goals.
+    :param n_activities: Number of activities per goal.
+    :param n_resources: Number of resources, questions and persons each.
+    :return: The SiddataUser.
+    """
+    user = SiddataUser.objects.create(origin=origin, user_origin_id=user_origin_id)
+    degree = Degree.objects.create(name="Bachelor", origin=origin, degree_origin_id=user_origin_id)
+    subject = Subject.objects.create(name="Informatik", origin=origin, subject_origin_id=user_origin_id)
+    SiddataUserStudy.objects.create(user=user, degree=degree, subject=subject, semester=3)
+    recommender = Recommender.objects.get_or_create(name="Harness", classname="RM_harness", order=1)[0]
+    userrecommender = SiddataUserRecommender.objects.create(user=user, recommender=recommender, enabled=True)
+
+    resources = EducationalResource.objects.bulk_create([
+        EducationalResource(origin=origin, title="Ressource {}".format(i), source="https://example.org/{}".format(i))
+        for i in range(n_resources)
+    ])
+    questions = Question.objects.bulk_create([
+        Question(question_text="Frage {}".format(i), answer_type="text") for i in range(n_resources)
+    ])
+    persons = Person.objects.bulk_create([
+        Person(first_name="Person", surname=str(i)) for i in range(n_resources)
+    ])
+
+    goals = Goal.objects.bulk_create([
+        Goal(title="Ziel {}".format(i), userrecommender=userrecommender, order=i) for i in range(n_goals)
+    ])
+    GoalProperty.objects.bulk_create([
+        GoalProperty(goal=goal, key=key, value=key) for goal in goals for key in ["a", "b"]
+    ])
+    Activity.objects.bulk_create([
+        Activity(goal=goal, title="Aktivität {}".format(i), type="todo", order=i,
+                 resource=resources[i % n_resources], question=questions[i % n_resources],
+                 person=persons[i % n_resources])
+        for goal in goals for i in range(n_activities)
+    ])
+    return user
+
+
+def normalize_sql(sql):
+    """
+    Replaces the literals of an SQL statement by ?, so statements which only differ in their parameters are equal.
+    :param sql: SQL statement.
+    :return: Normalized statement.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    return re.sub(r"\((?:\?, )+\?\)", "(?, ...)", sql)
+
+
+def summarize_queries(queries):
+    """
+    Groups captured queries by their normalized statement.
+    :param queries: Queries captured by CaptureQueriesContext.
+    :return: List of lines "<count>x <statement>", most frequent first.
+    """
+    counts = collections.Counter(normalize_sql(query["sql"]) for query in queries)
+    return ["{}x {}".format(count, sql) for sql, count in counts.most_common()]
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+class TestQueryBudgets(TestCase):
+    """
+    Regression harness for the number of queries and the wall time of the API routes. Every route is called for
+    synthetic users of several scales with an empty fragment cache. The number of queries may only grow with the
+    number of goals, never with the number of activities or resources, and must stay within the route's budget.
+    Exceeded budgets are reported with the issued SQL, diffed against the smallest scale.
+    """
+
+    #: (goals, activities per goal, resources) of the synthetic users.
+    SCALES = [(1, 5, 5), (1, 50, 50), (4, 5, 5), (4, 50, 50)]
+    #: Wall time budget of a single request in seconds.
+    TIME_BUDGET = 2.0
+    #: Number of objects sent to the ingestion routes.
+    N_ENTITIES = 10
+    #: Routes by (method, route) with their query budget as (fixed queries, queries per goal). The routes are called in
+    #: this order, so courses exist before their events are sent and users are deleted last.
+    ROUTES = {
+        ("GET", "student?include=recommenders"): (15, 12),
+        ("GET", "recommender"): (10, 12),
+        ("GET", "recommender/{recommender_id}"): (10, 12),
+        ("GET", "goal"): (10, 12),
+        ("GET", "goal/{goal_id}"): (15, 0),
+        ("GET", "activity"): (10, 4),
+        ("GET", "activity/{activity_id}"): (10, 0),
+        ("GET", "studycourse"): (10, 0),
+        ("GET", "course"): (10, 0),
+        ("GET", "job"): (5, 0),
+        ("GET", "cache"): (5, 0),
+        ("PATCH", "student"): (10, 0),
+        ("PATCH", "activity/{activity_id}"): (10, 0),
+        ("POST", "institute"): (70, 0),
+        ("POST", "course"): (15, 0),
+        ("POST", "event"): (100, 0),
+        ("POST", "person"): (100, 0),
+        ("POST", "subject"): (70, 0),
+        ("POST", "degree"): (70, 0),
+        ("DELETE", "activity/{activity_id}"): (15, 0),
+        ("DELETE", "goal/{goal_id}"): (20, 0),
+        ("DELETE", "student"): (15, 3),
+    }
+
+    def setUp(self):
+        self.origin = Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        self.users = {
+            scale: create_synthetic_user(self.origin, "student{}x{}x{}".format(*scale), *scale) for scale in self.SCALES
+        }
+
+    def get_url(self, route, user):
+        if "{" in route:
+            goal = Goal.objects.filter(userrecommender__user=user).order_by("order").first()
+            route = route.format(
+                recommender_id=goal.userrecommender_id,
+                goal_id=goal.id,
+                activity_id=Activity.objects.filter(goal=goal).order_by("order").first().id,
+            )
+        separator = "&" if "?" in route else "?"
+        return "/api/{}{}origin=abc&api_key=key&user_origin_id={}".format(route, separator, user.user_origin_id)
+
+    def get_payload(self, method, route, url, user):
+        """
+        Builds the JSON document sent to a write route. The ingestion routes receive new objects for every user, so that
+        none of them is skipped as known.
+        """
+        key = user.user_origin_id
+        start = int(datetime.datetime(2022, 4, 1, tzinfo=datetime.timezone.utc).timestamp())
+        numbers = range(self.N_ENTITIES)
+        if method == "PATCH" and route == "student":
+            relationships = ["institutes_brain", "institutes_social", "courses_brain", "courses_social"]
+            return {"data": {"type": "SiddataUser", "id": key, "attributes": {"data_donation": True},
+                             "relationships": {name: {"data": []} for name in relationships}}}
+        if method == "PATCH":
+            activity_id = url.split("?")[0].rsplit("/", 1)[1]
+            return {"data": {"type": "Activity", "id": activity_id, "attributes": {"feedback_value": 3}}}
+        if route == "institute":
+            return {"data": [{"type": "Institute", "attributes": {
+                "studip_id": "{}-institute{}".format(key, i), "name": "Institut {}".format(i), "url": None}}
+                for i in numbers]}
+        if route == "course":
+            entities = synthetic.get_course_entities(random.Random(0), 0, self.N_ENTITIES, [])
+            for entity in entities:
+                entity["attributes"]["studip_id"] = "{}-{}".format(key, entity["attributes"]["studip_id"])
+            return {"data": entities}
+        if route == "event":
+            return {"data": [{"type": "Event", "attributes": {
+                "studip_id": "{}-event{}".format(key, i), "topic_title": "Termin {}".format(i), "place": "Raum 1",
+                "start_time": start + i * 86400, "end_time": start + i * 86400 + 5400},
+                "relationships": {"course": {"data": [{"type": "Course", "id": "{}-course{}".format(key, i)}]}}}
+                for i in numbers]}
+        if route == "person":
+            return {"data": [{"type": "Lecturer", "attributes": {
+                "person_origin_id": "{}-lecturer{}".format(key, i), "first_name": "Ada", "surname": str(i),
+                "email": "{}-{}@example.org".format(key, i)}} for i in numbers]}
+        if route == "subject":
+            return {"data": [{"type": "Subject", "attributes": {
+                "studip_id": "{}-subject{}".format(key, i), "name": "Fach {}".format(i), "description": "",
+                "keywords": []}} for i in numbers]}
+        if route == "degree":
+            return {"data": [{"type": "Degree", "attributes": {
+                "studip_id": "{}-degree{}".format(key, i), "name": "Abschluss {}".format(i), "description": ""}}
+                for i in numbers]}
+        return None
+
+    def measure(self, method, route, user):
+        url = self.get_url(route, user)
+        payload = self.get_payload(method, route, url, user)
+        fragment_cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            if payload is None:
+                response = Client().generic(method, url)
+            else:
+                response = Client().generic(method, url, json.dumps(payload), content_type="application/json")
+            duration = time.perf_counter() - start
+        self.assertEqual(response.status_code, 200, "{} {}".format(method, url))
+        if method == "POST":
+            # every object sent is stored
+            self.assertEqual(response.json()["meta"]["created"], self.N_ENTITIES, "{} {}".format(method, url))
+        return list(queries), duration
+
+    def get_report(self, route, scale, queries, reference_scale, reference_queries):
+        diff = difflib.unified_diff(summarize_queries(reference_queries), summarize_queries(queries),
+                                    fromfile="{} at {}".format(route, reference_scale),
+                                    tofile="{} at {}".format(route, scale), lineterm="")
+        return "\n".join(diff)
+
+    def test_query_budgets(self):
+        for (method, route), (fixed, per_goal) in self.ROUTES.items():
+            name = "{} {}".format(method, route)
+            measurements = {scale: self.measure(method, route, user) for scale, user in self.users.items()}
+            for scale, (queries, duration) in measurements.items():
+                n_goals = scale[0]
+                logging.info("{} at {}: {:.3f}s, {} queries".format(name, scale, duration, len(queries)))
+                with self.subTest(route=name, scale=scale):
+                    budget = fixed + per_goal * n_goals
+                    self.assertLessEqual(len(queries), budget, "{} queries exceed the budget of {}:\n{}".format(
+                        len(queries), budget,
+                        self.get_report(name, scale, queries, self.SCALES[0], measurements[self.SCALES[0]][0])))
+                    # more activities and resources must not cost more queries, except for the batches of Django's
+                    # deletion collector, which deletes GET_ITERATOR_CHUNK_SIZE rows per statement
+                    reference_scale = [s for s in self.SCALES if s[0] == n_goals][0]
+                    reference = measurements[reference_scale][0]
+                    allowed = len(reference)
+                    if method == "DELETE":
+                        allowed += n_goals * scale[1] // GET_ITERATOR_CHUNK_SIZE
+                    self.assertLessEqual(len(queries), allowed, "Queries depend on the number of activities:\n{}".format(
+                        self.get_report(name, scale, queries, reference_scale, reference)))
+                    self.assertLess(duration, self.TIME_BUDGET)
+
+
+class TestSyntheticData(TestCase):
+    """Tests the generator of synthetic data and the evaluation of the load driver."""
+
+    def setUp(self):
+        recommender_functions.reload_recommenders()
+        for rm in recommender_functions.get_active_recommenders():
+            rm.initialize_templates()
+
+    def generate(self):
+        call_command("generatedata", users=5, courses=20, events=10, oers=10, institutes=2, memberships=3,
+                     recommender_share=0, stdout=io.StringIO())
+
+    def test_generatedata(self):
+        self.generate()
+        origin = Origin.objects.get(api_endpoint="loadtest0")
+        self.assertEqual(SiddataUser.objects.filter(origin=origin).count(), 5)
+        self.assertEqual(Goal.objects.filter(userrecommender__user__origin=origin).count(), 5)
+        self.assertEqual(StudipCourse.objects.filter(origin=origin).count(), 20)
+        self.assertEqual(StudipEvent.objects.filter(origin=origin).count(), 10)
+        self.assertEqual(CourseMembership.objects.filter(user__origin=origin).count(), 15)
+        self.assertFalse(EducationalResource.objects.filter(origin=origin, ddc_code__isnull=True).exists())
+
+        # a second run only adds what is missing
+        self.generate()
+        self.assertEqual(EducationalResource.objects.filter(origin=origin).count(), 40)
+        self.assertEqual(CourseMembership.objects.filter(user__origin=origin).count(), 15)
+
+    def test_fake_predictor(self):
+        predictor = FakeSidBERT()
+        labels = predictor.predict_single_example("Einführung in die Informatik", top_n=3)
+        self.assertEqual(len(labels), 3)
+        self.assertEqual(labels, FakeSidBERT().predict_single_example("Einführung in die Informatik", top_n=3))
+        self.assertTrue(set(labels) <= set(predictor.classes))
+
+    def test_load_report(self):
+        driver = loadtest.LoadDriver("http://localhost", None, {"user0": ["a"]}, loadtest.parse_mix("student=1,course=1"),
+                                     course_count=0, course_batch_size=1, seed=0)
+        driver.results = [("student", 200, i / 1000) for i in range(1, 101)] + [("course", 500, 0.5)]
+        report = driver.get_report(elapsed=10.0)
+        self.assertEqual(report["student"]["count"], 100)
+        self.assertAlmostEqual(report["student"]["p50"], 50)
+        self.assertAlmostEqual(report["student"]["p99"], 99)
+        self.assertEqual(report["course"]["errors"], 1)
+        self.assertAlmostEqual(report["all"]["throughput"], 10.1)
+
+
+class TestLeaderElection(TestCase):
+    """Tests the election of the process running the scheduled tasks."""
+
+    def test_lease(self):
+        self.assertTrue(leader.try_acquire("test", "a", 60))
+        self.assertFalse(leader.try_acquire("test", "b", 60))
+        # the holder renews its lease
+        self.assertTrue(leader.try_acquire("test", "a", 60))
+
+        # an expired lease is taken over, Now() is constant within the transaction of the test
+        Lease.objects.filter(name="test").update(expires=F("renewed") - datetime.timedelta(seconds=1))
+        self.assertTrue(leader.try_acquire("test", "b", 60))
+        self.assertFalse(leader.try_acquire("test", "a", 60))
+
+        self.assertFalse(leader.release("test", "a"))
+        self.assertTrue(leader.release("test", "b"))
+        self.assertTrue(leader.try_acquire("test", "a", 60))
+
+    def test_election(self):
+        events = []
+        first = leader.LeaderElection("test", lambda: events.append("first elected"),
+                                      lambda: events.append("first deposed"), duration=60, interval=1)
+        second = leader.LeaderElection("test", lambda: events.append("second elected"),
+                                       lambda: events.append("second deposed"), duration=60, interval=1)
+        second.holder = "second"
+
+        self.assertTrue(first.step())
+        self.assertFalse(second.step())
+        self.assertTrue(first.step())
+
+        # the leader exits and releases the lease, the standby process takes over
+        first.stop()
+        self.assertTrue(second.step())
+        self.assertEqual(events, ["first elected", "first deposed", "second elected"])
+
+
+class TestTaskQueue(TestCase):
+    """Tests priorities, retries and the visibility timeout of the background task queue."""
+
+    def test_priority(self):
+        low = task_queue.enqueue("backend.synthetic.percentile", priority=task_queue.PRIORITY_LOW, values=[1], p=50)
+        normal = task_queue.enqueue("backend.synthetic.percentile", values=[1], p=50)
+        high = task_queue.enqueue("backend.synthetic.percentile", priority=task_queue.PRIORITY_HIGH, values=[1], p=50)
+        self.assertEqual([task_queue.claim_next_task().id for _ in range(3)], [high.id, normal.id, low.id])
+        self.assertIsNone(task_queue.claim_next_task())
+
+        # a task which is still queued or running is not enqueued twice
+        first = task_queue.enqueue("backend.synthetic.percentile", unique=True, values=[1, 2], p=50)
+        second = task_queue.enqueue("backend.synthetic.percentile", unique=True, values=[1, 2], p=50)
+        self.assertEqual(first.id, second.id)
+        task_queue.claim_next_task()
+        self.assertEqual(task_queue.enqueue("backend.synthetic.percentile", unique=True, values=[1, 2], p=50).id,
+                         first.id)
+        # unless the claim of the running task expired
+        BackgroundTask.objects.filter(id=first.id).update(visible_until=F("created"))
+        self.assertNotEqual(task_queue.enqueue("backend.synthetic.percentile", unique=True, values=[1, 2], p=50).id,
+                            first.id)
+
+    @override_settings(TASK_RETRY_DELAY=60)
+    def test_retries(self):
+        task = task_queue.enqueue("backend.tests.failing_task", max_attempts=2, message="error")
+        self.assertFalse(task_queue.run_task(task_queue.claim_next_task()))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("queued", 1))
+        self.assertIn("ValueError: error", task.error)
+        # the retry waits for the delay
+        self.assertIsNone(task_queue.claim_next_task())
+
+        BackgroundTask.objects.filter(id=task.id).update(run_after=F("created"))
+        self.assertFalse(task_queue.run_task(task_queue.claim_next_task()))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), ("failed", 2))
+        self.assertIsNotNone(task.finished)
+
+    def test_visibility_timeout(self):
+        task = task_queue.enqueue("backend.synthetic.percentile", max_attempts=2, values=[1, 2, 3], p=50)
+        lost = task_queue.claim_next_task()
+        self.assertIsNone(task_queue.claim_next_task())
+
+        # the worker does not extend its claim, so another worker starts the task again
+        BackgroundTask.objects.filter(id=task.id).update(visible_until=F("created"))
+        claimed = task_queue.claim_next_task()
+        self.assertEqual((claimed.id, claimed.attempts), (task.id, 2))
+        self.assertEqual(task_queue.extend_visibility([task.id]), 1)
+
+        # the result of the lost worker is discarded
+        self.assertFalse(task_queue.run_task(lost))
+        self.assertTrue(task_queue.run_task(claimed))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.result), ("done", 2))
+
+        # a task which used up its attempts fails once its worker gets lost
+        task = task_queue.enqueue("backend.synthetic.percentile", max_attempts=1, values=[1], p=50)
+        task_queue.claim_next_task()
+        BackgroundTask.objects.filter(id=task.id).update(visible_until=F("created"))
+        self.assertIsNone(task_queue.claim_next_task())
+        task.refresh_from_db()
+        self.assertEqual(task.status, "failed")
+
+    def test_dashboard(self):
+        task_queue.enqueue("backend.synthetic.percentile", label="percentile", values=[1], p=50)
+        task_queue.run_task(task_queue.claim_next_task())
+        task_queue.enqueue("backend.synthetic.percentile", label="percentile", values=[1], p=50)
+
+        depth = task_queue.get_queue_depth()
+        self.assertEqual([(entry["label"], entry["queued"]) for entry in depth], [("percentile", 1)])
+        metrics = task_queue.get_task_metrics()["percentile"]
+        self.assertEqual((metrics["total"], metrics["queued"], metrics["failed"]), (2, 1, 0))
+
+        user = User.objects.create_user("staff", "staff@example.org", "password")
+        user.user_permissions.add(Permission.objects.get_or_create(
+            codename="view_dashboard", content_type=ContentType.objects.get_for_model(User),
+            defaults={"name": "Can view dashboard"})[0])
+        client = Client()
+        client.force_login(user)
+        response = client.get("/taskqueue")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "percentile")
+
+
+@override_settings(TASK_VISIBILITY_TIMEOUT=1)
+class TestWorker(TransactionTestCase):
+    """Tests the pool of the runworker command, whose processes need committed tasks."""
+
+    def test_dead_process(self):
+        task = task_queue.enqueue("backend.tests.crashing_task", max_attempts=1)
+        done = task_queue.enqueue("backend.synthetic.percentile", values=[1, 2, 3], p=50)
+        # the worker stops extending the claim of the task of the dead process, so it exits with --once
+        call_command("runworker", processes=1, once=True, sleep=0.1)
+        done.refresh_from_db()
+        self.assertEqual(done.status, "done")
+
+        time.sleep(1.1)
+        self.assertIsNone(task_queue.claim_next_task())
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.error), ("failed", "The worker got lost in attempt 1."))
+
+
+class TestResourceImport(TestCase):
+    """Tests the deduplication of web resources imported from csv files."""
+
+    def test_import(self):
+        WebResource(title="Known", description="Imported before", source="https://example.org/known").save()
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as csv_file:
+            csv_file.write("\n".join([
+                "Known;Imported before;https://example.org/known",
+                "First;Description;https://example.org/first",
+                "Invalid;Description;no url",
+                "First;Description;https://example.org/first",
+                "Short;Description",
+                "Second;Description;https://example.org/second",
+            ]))
+            csv_file.flush()
+
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(db_tasks.import_backend_resources(csv_file.name, chunk_size=2), (4, 2))
+            # per chunk one lookup by hash, one of resources without hash and the inserts of both tables
+            self.assertLessEqual(len(queries), 2 * 4)
+            self.assertEqual(sorted(WebResource.objects.values_list("title", flat=True)), ["First", "Known", "Second"])
+
+            # importing the file again adds nothing
+            self.assertEqual(db_tasks.import_backend_resources(csv_file.name), (4, 0))
+            self.assertEqual(WebResource.objects.count(), 3)
+
+
+OAI_RECORD = """<record><header><identifier>oai:stub:{id}</identifier><datestamp>{datestamp}</datestamp></header>
+<metadata><lom:lom xmlns:lom="http://ltsc.ieee.org/xsd/LOM" xmlns="">
+<lom:general><lom:identifier><lom:entry>{id}</lom:entry></lom:identifier><lom:title><string>{title}</string></lom:title>
+<lom:keyword><string>keyword</string></lom:keyword></lom:general>
+<lom:technical><lom:format>application/pdf</lom:format><lom:location>https://example.org/{id}</lom:location></lom:technical>
+<lom:educational><lom:learningResourceType><string>text</string></lom:learningResourceType></lom:educational>
+</lom:lom></metadata></record>"""
+
+OAI_DELETED_RECORD = """<record><header status="deleted"><identifier>oai:stub:{id}</identifier>
+<datestamp>{datestamp}</datestamp></header></record>"""
+
+
+class StubServer:
+    """
+    Local HTTP server answering GET requests by a function, e.g. a fake repository or provider API. The requests are
+    recorded as dicts of their URL parameters.
+    """
+
+    def __init__(self, respond):
+        """
+        :param respond: Function called with the path and the dict of URL parameters of a request, returns a tuple of
+        the HTTP status, the content type and the body.
+        """
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                arguments = dict(urllib.parse.parse_qsl(url.query))
+                stub.requests.append(arguments)
+                status, content_type, body = respond(url.path, arguments)
+                body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OAIStubServer(StubServer):
+    """
+    Local OAI-PMH repository serving ListRecords pages. A page is selected by the resumption token, or by the `from`
+    argument for the first page.
+    """
+
+    def __init__(self, pages):
+        """
+        :param pages: dict mapping resumption tokens, or ("from", datestamp) for first pages, to tuples of the XML
+        records and the resumption token of the next page. A page whose value is an int is answered with this HTTP
+        status once, then by the page stored under ("retry", token).
+        """
+        self.pages = pages
+        super().__init__(self.respond)
+
+    def respond(self, path, arguments):
+        key = arguments.get("resumptionToken", ("from", arguments.get("from")))
+        page = self.pages.get(key)
+        if isinstance(page, int):
+            self.pages[key] = self.pages.pop(("retry", key))
+            return page, "text/plain", "error"
+        if page is None:
+            body = '<error code="noRecordsMatch"/>'
+        else:
+            records, token = page
+            body = "<ListRecords>{}<resumptionToken>{}</resumptionToken></ListRecords>".format(
+                "".join(records), token or "")
+        return 200, "text/xml; charset=utf-8", (
+            '<?xml version="1.0" encoding="UTF-8"?><OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            '<responseDate>2022-05-10T00:00:00Z</responseDate><request verb="ListRecords">stub</request>'
+            '{}</OAI-PMH>').format(body)
+
+
+class TestOAIHarvesting(TestCase):
+    """Tests the incremental harvesting of an edu-sharing repository against a local OAI-PMH stub."""
+
+    def test_harvest(self):
+        pages = {
+            ("from", None): ([OAI_RECORD.format(id=1, title="First", datestamp="2022-05-01"),
+                              OAI_RECORD.format(id=2, title="Second", datestamp="2022-05-03")], "page2"),
+            # the second page fails once, which interrupts the harvest
+            "page2": 500,
+            ("retry", "page2"): ([OAI_RECORD.format(id=3, title="Third", datestamp="2022-05-02")], None),
+            ("from", "2022-05-03"): ([OAI_RECORD.format(id=2, title="Second changed", datestamp="2022-05-04"),
+                                      OAI_DELETED_RECORD.format(id=1, datestamp="2022-05-05")], None),
+        }
+        with OAIStubServer(pages) as stub:
+            with self.assertRaises(Exception):
+                educational_resource_functions.collect_edu_sharing_resources(stub.url)
+            state = HarvestState.objects.get(origin__name=stub.url)
+            self.assertEqual(state.resumption_token, "page2")
+            self.assertEqual(EducationalResource.objects.filter(origin=state.origin).count(), 2)
+
+            # the harvest continues with the stored token instead of restarting
+            self.assertEqual(educational_resource_functions.collect_edu_sharing_resources(stub.url), 1)
+            self.assertEqual(stub.requests[-1].get("resumptionToken"), "page2")
+            state.refresh_from_db()
+            self.assertEqual((state.datestamp, state.resumption_token), ("2022-05-03", None))
+            self.assertEqual(EducationalResource.objects.filter(origin=state.origin).count(), 3)
+
+            # the next harvest only requests changes, one record is changed and one deleted
+            educational_resource_functions.collect_edu_sharing_resources(stub.url)
+            self.assertEqual(stub.requests[-1].get("from"), "2022-05-03")
+            self.assertEqual(sorted(EducationalResource.objects.filter(origin=state.origin).values_list(
+                "title", flat=True)), ["Second changed", "Third"])
+            state.refresh_from_db()
+            self.assertEqual(state.datestamp, "2022-05-05")
+
+            # nothing changed since
+            self.assertEqual(educational_resource_functions.collect_edu_sharing_resources(stub.url), 0)
+            self.assertEqual(stub.requests[-1].get("from"), "2022-05-05")
+
+
+class FakeUdemyServer(StubServer):
+    """Local fake of the udemy course list API. Every page fails once with a transient error."""
+
+    def __init__(self, courses):
+        self.courses = courses
+        self.failed_pages = set()
+        super().__init__(self.respond)
+
+    def respond(self, path, arguments):
+        page, page_size = int(arguments["page"]), int(arguments["page_size"])
+        if page not in self.failed_pages:
+            self.failed_pages.add(page)
+            return 503, "text/plain", "unavailable"
+        return 200, "application/json", json.dumps({
+            "count": len(self.courses),
+            "results": self.courses[(page - 1) * page_size:page * page_size],
+        })
+
+
+class TestMoocCollection(TestCase):
+    """Tests the concurrent collection of udemy courses against a local fake provider."""
+
+    @override_settings(MOOC_FETCH_BACKOFF=0, MOOC_FETCH_CONCURRENCY=3, MOOC_PAGE_SIZE=2)
+    def test_udemy(self):
+        courses = [{"id": i, "title": "Course {}".format(i), "url": "/course-{}/".format(i), "headline": "Headline",
+                    "visible_instructors": []} for i in range(7)]
+        with FakeUdemyServer(courses) as server:
+            client = {"BASE_URL": "https://www.udemy.com/", "API_URL": server.url + "/api-2.0/", "USER": "user",
+                      "PASSWORD": "password"}
+            with override_settings(MOOC_CLIENTS={"UDEMY": client}):
+                self.assertEqual(educational_resource_functions.collect_udemy_courses(), 7)
+                # four pages, each requested twice
+                self.assertEqual(len(server.requests), 8)
+                self.assertEqual(sorted(InheritingCourse.objects.values_list("course_origin_id", flat=True)),
+                                 [str(i) for i in range(7)])
+
+                # unchanged courses are skipped, changed ones updated
+                courses[3]["title"] = "Changed"
+                server.failed_pages = {1, 2, 3, 4}
+                self.assertEqual(educational_resource_functions.collect_udemy_courses(), 1)
+                self.assertEqual(InheritingCourse.objects.get(course_origin_id="3").title, "Changed")
+                self.assertEqual(InheritingCourse.objects.count(), 7)
+
+
+class TestLomParsing(TestCase):
+    """Tests that the streaming LOM parser maps records like map_lom_to_dc."""
+
+    def test_parser(self):
+        page = synthetic.get_lom_page(random.Random(0), 0, 40, 5, resumption_token="next")
+        records = benchmarkharvest.parse_stream(page)
+        self.assertEqual(records, benchmarkharvest.parse_tree(page))
+        self.assertEqual(len([record for record in records if record[2]]), 2)
+        self.assertIn(records[0][3]["creator"], records[0][3]["contributor"])
+        parser = educational_resource_functions.ListRecordsParser(page.encode("utf-8"))
+        self.assertEqual(len(list(parser)), 40)
+        self.assertEqual(parser.resumption_token, "next")
+
+        # the same vCards are only parsed once
+        educational_resource_functions.get_name_from_vcard.cache_clear()
+        benchmarkharvest.parse_stream(page)
+        self.assertLessEqual(educational_resource_functions.get_name_from_vcard.cache_info().misses, 5)
+
+    def test_benchmark(self):
+        output = io.StringIO()
+        call_command("benchmarkharvest", records=100, page_size=20, repeat=1, stdout=output)
+        self.assertIn("100 records", output.getvalue())
+        self.assertIn("0 mismatching records", output.getvalue())
+
+
+class BlockingRecommender:
+    def __init__(self):
+        self.release = threading.Event()
+        self.thread = None
+
+    def execute_cron_functions(self):
+        self.thread = threading.current_thread()
+        self.release.wait(10)
+        return 1
+
+
+class FailingRecommender:
+    def execute_cron_functions(self):
+        raise ValueError("cron error")
+
+
+class CountingRecommender:
+    def execute_cron_functions(self):
+        return 3
+
+
+class TestRecommenderCron(TestCase):
+    """Tests the concurrent execution of the cron functions of recommenders."""
+
+    def test_cron_functions(self):
+        blocking = BlockingRecommender()
+        recommenders = [blocking, FailingRecommender(), CountingRecommender()]
+        try:
+            start_time = time.perf_counter()
+            report = recommender_functions.execute_recommender_cron_functions(
+                concurrency=2, timeout=0.3, recommenders=recommenders)
+            # the blocking recommender delays neither the others nor the job
+            self.assertLess(time.perf_counter() - start_time, 1)
+            self.assertEqual({classname: entry["status"] for classname, entry in report.items()}, {
+                "BlockingRecommender": "timeout", "FailingRecommender": "failed", "CountingRecommender": "done"})
+            self.assertEqual(report["CountingRecommender"]["items"], 3)
+            self.assertGreaterEqual(report["BlockingRecommender"]["duration"], 0.3)
+
+            # the blocking recommender is skipped as long as it is still running
+            report = recommender_functions.execute_recommender_cron_functions(
+                concurrency=2, timeout=0.3, recommenders=recommenders[:1])
+            self.assertEqual(report["BlockingRecommender"]["status"], "skipped")
+        finally:
+            blocking.release.set()
+            if blocking.thread is not None:
+                blocking.thread.join(10)
+
+        report = recommender_functions.execute_recommender_cron_functions(recommenders=recommenders[:1])
+        self.assertEqual(report["BlockingRecommender"]["status"], "done")
+
+    def test_cron_functions_in_other_process(self):
+        # a session holding the lock of a recommender stands in for another process executing its cron functions
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            leader.try_advisory_lock("cron:CountingRecommender")
+            locked.set()
+            release.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(10))
+            report = recommender_functions.execute_recommender_cron_functions(recommenders=[CountingRecommender()])
+            self.assertEqual(report["CountingRecommender"]["status"], "skipped")
+        finally:
+            release.set()
+            thread.join(10)
+        # closing the session released the lock
+        report = recommender_functions.execute_recommender_cron_functions(recommenders=[CountingRecommender()])
+        self.assertEqual(report["CountingRecommender"]["status"], "done")
+
+
+class TestProfessionsCron(TestCase):
+    """Tests the incremental matching of newly labeled resources against the interests of RM_professions."""
+
+    def setUp(self):
+        self.origin = Origin.objects.create(name="uos", api_endpoint="abc", api_key="key")
+        self.rm = RM_professions()
+        self.rm.backbone.predictor = FakeSidBERT()
+        self.label = self.rm.backbone.generate_ddc_label("Informatik")
+        self.other_label = next(label for label in self.rm.backbone.predictor.classes if label != self.label)
+        user = SiddataUser.objects.create(origin=self.origin, user_origin_id="student")
+        userrecommender = SiddataUserRecommender.objects.create(user=user, recommender=self.rm.recommender)
+        self.goal = Goal.objects.create(title="Informatik", userrecommender=userrecommender)
+
+    def create_course(self, number, label, labeled=None):
+        if labeled is None:
+            # labeled before the lag of the cron function
+            labeled = timezone.now() - datetime.timedelta(hours=1)
+        course = StudipCourse(origin=self.origin, course_origin_id="course{}".format(number),
+                              title="Kurs {}".format(number), type=["SIP"], start_semester="SoSe", end_semester="SoSe",
+                              start_time=timezone.now() + datetime.timedelta(days=30),
+                              ddc_code=json.dumps(label), ddc_labeled=labeled)
+        course.save()
+        return course
+
+    def get_recommended(self):
+        return set(Activity.objects.filter(goal=self.goal, type="resource").values_list("resource__title", flat=True))
+
+    def test_recommend_new_resources(self):
+        self.create_course(0, self.label)
+        topic = Activity.objects.create(goal=self.goal, type="todo", title="Informatik", answers=["Informatik"])
+        self.rm.generate_new_recommendations(topic, filtered_tags=["local_course"])
+        self.assertEqual(self.get_recommended(), {"Kurs 0"})
+        state = InterestState.objects.get(goal=self.goal)
+        self.assertEqual(state.ddc_label, self.label)
+
+        no_recommendations = Activity.objects.create(goal=self.goal, type="todo",
+                                                     title="Momentan sind keine Empfehlungen verfügbar für Chemie")
+        self.create_course(1, self.label)
+        newest = self.create_course(2, self.other_label)
+        # the interest is not classified again
+        self.rm.backbone.predictor = None
+        self.assertEqual(self.rm.execute_cron_functions(), 1)
+        self.assertEqual(self.get_recommended(), {"Kurs 0", "Kurs 1"})
+        no_recommendations.refresh_from_db()
+        self.assertEqual(no_recommendations.status, "done")
+        # resolving the notification is a change like any save
+        self.assertEqual(no_recommendations.version, 2)
+        state.refresh_from_db()
+        self.assertEqual(state.watermark, StudipCourse.objects.get(pk=newest.pk).ddc_labeled)
+
+        # nothing was labeled since, so nothing is recommended twice
+        self.assertEqual(self.rm.execute_cron_functions(), 0)
+        self.assertEqual(Activity.objects.filter(goal=self.goal, type="resource").count(), 2)
+
+        # a resource labeled within the lag may still be invisible to the cron function in favor of a resource labeled
+        # later, so it is left for a later run
+        self.create_course(3, self.label, labeled=timezone.now())
+        self.assertEqual(self.rm.execute_cron_functions(), 0)
+        with override_settings(PROFESSIONS_LABEL_LAG=0):
+            self.assertEqual(self.rm.execute_cron_functions(), 1)
+        self.assertIn("Kurs 3", self.get_recommended())
+
+    def test_recommendation_limit(self):
+        InterestState.objects.create(goal=self.goal, interest="Informatik", ddc_label=self.label,
+                                     filter_tags=["local_course"], watermark=timezone.now() - datetime.timedelta(days=1))
+        labeled = timezone.now() - datetime.timedelta(hours=1)
+        for number in range(COURSE_MAX + 2):
+            # the last three resources are labeled at the same time
+            self.create_course(number, self.label,
+                               labeled=labeled + datetime.timedelta(seconds=min(number, COURSE_MAX - 1)))
+        self.assertEqual(self.rm.execute_cron_functions(), COURSE_MAX)
+        state = InterestState.objects.get(goal=self.goal)
+        self.assertEqual(state.watermark, labeled + datetime.timedelta(seconds=COURSE_MAX - 2))
+        # the resources left out by the limit are recommended by the next run
+        self.assertEqual(self.rm.execute_cron_functions(), 2)
+        self.assertEqual(len(self.get_recommended()), COURSE_MAX + 2)
+        self.assertEqual(self.rm.execute_cron_functions(), 0)
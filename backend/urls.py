@@ -38,6 +38,7 @@ urlpatterns = [
     path('export_single', permission_required('auth.view_dashboard')(views.export_single), name="export_single"),
     path('export_raw', permission_required('auth.view_dashboard')(views.export_raw), name="export_raw"),
     path('dashboard', permission_required('auth.view_dashboard')(views.DashboardView.as_view()), name="dashboard"),
+    path('taskqueue', permission_required('auth.view_dashboard')(views.TaskQueueView.as_view()), name="taskqueue"),
 
     # simple integrated client
     path('backdoor', views.backdoor, name="backdoor"),
@@ -60,6 +61,11 @@ urlpatterns = [
     path('api/goal/<str:goal_id>', api_views.goal),
     path('api/activity', api_views.activity),
     path('api/activity/<str:activity_id>', api_views.activity),
+    path('api/job', api_views.job),
+    path('api/job/<str:job_id>', api_views.job),
+    path('api/cache', api_views.cache),
+    path('api/metrics', api_views.metrics),
+    path('api/provisioning', api_views.provisioning),
 
 
     path('api/coursemembership', api_views.coursemembership),
@@ -73,6 +79,7 @@ urlpatterns = [
     path('api/event', api_views.event),
     path('api/institute', api_views.institute),
     path('api/person', api_views.person),
+    path('api/image/<str:image_hash>', api_views.person_image, name="person_image"),
 
     path('api-auth/', include('rest_framework.urls')),
 
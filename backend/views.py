@@ -16,7 +16,8 @@ import xml.etree.ElementTree as ET
 
 import requests
 
-from backend.models import Goal, SiddataUser, SiddataUserStudy, Degree, Subject, Activity
+from backend import task_queue
+from backend.models import Goal, SiddataUser, SiddataUserStudy, Degree, Subject, Activity, BackgroundTask
 from recommenders.recommender_functions import get_active_recommenders
 # from dashboard.create_chart import build_eval_df
 from dashboard import create_plots
@@ -326,3 +327,19 @@ class DashboardView(generic.TemplateView):
             chart.downloadlink = f'<a href="export_single?plot={slugify(chart.title)}">download</a>'
         context['charts_and_titles'] = charts
         return context
+
+
+class TaskQueueView(generic.TemplateView):
+    """Queue depth of the background task queue and latencies of the tasks of the last 24 hours per label."""
+    template_name = "backend/taskqueue.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['queue_depth'] = task_queue.get_queue_depth()
+        context['task_metrics'] = sorted(task_queue.get_task_metrics().items(), key=lambda item: str(item[0]))
+        context['failed_tasks'] = BackgroundTask.objects.filter(
+            status=BackgroundTask.STATUSES.failed).order_by("-finished")[:20]
+        context['cron_reports'] = BackgroundTask.objects.filter(
+            function="scheduled_tasks.db_tasks.task_execute_recommender_cron_functions",
+            status=BackgroundTask.STATUSES.done).order_by("-finished")[:5]
+        return context
@@ -16,7 +16,11 @@ class BertAppConfig(AppConfig):
 
     #see https://stackoverflow.com/a/65072601/5122790
     def ready(self, *args, **kwargs):
-        if 'bert_app.apps.BertAppConfig' in settings.INSTALLED_APPS:
+        if getattr(settings, 'SIDBERT_FAKE', False):
+            from .fake_predictor import FakeSidBERT
+            self.predictor = FakeSidBERT()
+            logger.info('Fake SidBERT predictor initialized, DDC labels are not meaningful')
+        elif 'bert_app.apps.BertAppConfig' in settings.INSTALLED_APPS:
             from .bert_utils import SidBERT
             self.predictor = SidBERT()
             logger.info('BERT model was successfully initialized')
@@ -0,0 +1,68 @@
+"""
+Deterministic stand-in for SidBERT, e.g. for load tests and benchmarks on machines without the model checkpoint.
+
+The labels of a text are derived from a hash of the text, so equal texts always get the same labels and the labels are
+spread evenly over the DDC classes known to the real model. The predictions carry no meaning, but they exercise the
+same code paths as the real model at a fraction of the cost. It replaces the real model if SIDBERT_FAKE is set.
+"""
+import hashlib
+import logging
+from os.path import join
+
+from django.conf import settings
+
+#: DDC classes used if the class list of the model is not available.
+DEFAULT_CLASSES = ["000", "004", "006", "100", "150", "200", "300", "330", "340", "370", "400", "500", "510", "530",
+                   "540", "570", "600", "610", "620", "650", "700", "780", "800", "900"]
+
+
+class FakeSidBERT:
+    """
+    Offers the prediction interface of bert_utils.SidBERT without loading a model.
+    """
+
+    def __init__(self, classes=None):
+        """
+        :param classes: Optional list of DDC labels, by default the classes of the model in data/SidBERT are used.
+        """
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.classes = classes or self.load_classes()
+
+    def load_classes(self):
+        """
+        Reads the DDC labels from the classes.tsv file of the model, which is small and part of the repository.
+        :return: List of DDC label strings.
+        """
+        path = join(settings.BASE_DIR, 'data', 'SidBERT', 'bert_data', 'classes.tsv')
+        try:
+            with open(path) as class_file:
+                classes = [line.strip() for line in class_file if line.strip()]
+        except OSError:
+            self.logger.info("No class file at {}, using default DDC classes".format(path))
+            classes = []
+        return classes or DEFAULT_CLASSES
+
+    def predict_single_example(self, sequence, top_n=1):
+        """
+        Assigns DDC labels to a text, the same text always gets the same labels.
+        :param sequence: String input that is to be classified.
+        :param top_n: Number of DDC labels to be returned.
+        :return: dictionary with structure: key: DDC code value: probability
+        """
+        digest = hashlib.sha256(str(sequence).encode('utf-8')).digest()
+        start = int.from_bytes(digest[:8], 'big') % len(self.classes)
+        probability = 0.5 + digest[8] / 512
+        label_probability_assoc = {}
+        for rank in range(min(top_n, len(self.classes))):
+            label = self.classes[(start + rank) % len(self.classes)]
+            label_probability_assoc[label] = str(probability / (rank + 1))
+        return label_probability_assoc
+
+    def predict(self, data, top_n=1):
+        """
+        Assigns DDC labels to a number of texts.
+        :param data: Iterable of strings.
+        :param top_n: Number of DDC labels per text.
+        :return: dictionary mapping each text to its labels, see predict_single_example.
+        """
+        return {course: self.predict_single_example(sequence=course, top_n=top_n) for course in data}
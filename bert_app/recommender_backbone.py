@@ -5,7 +5,8 @@ import logging
 import numpy as np
 
 from django.apps import apps
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Max, Q
 from django.utils import timezone
 
 from backend import models
@@ -48,6 +49,7 @@ class ProfessionsRecommenderBackbone:
                 except query_object.title is None:
                     continue
                 query_object.ddc_code = json.dumps(ddc_code)
+                query_object.ddc_labeled = timezone.now()
                 query_object.save()
                 update_n += 1
         return update_n
@@ -256,11 +258,12 @@ class ProfessionsRecommenderBackbone:
         matching_moocs = models.InheritingCourse.objects.filter(query)
         return list(matching_moocs)
 
-    def fetch_resources_sidbert(self, goal, origin, filter_tags=None):
+    def fetch_resources_sidbert(self, goal, origin, filter_tags=None, label=None):
         """
         Wrapper function that generates DDC label from interest input text and searches for matching resources
+        :param label: DDC label of the input text if it was already classified.
         """
-        res = self.generate_ddc_label(goal)
+        res = label or self.generate_ddc_label(goal)
         logging.info("goal: "+goal+" was classified as: "+res)
         logging.info('Received filtered tags: '+str(filter_tags))
         sidbert_resources = self.generate_sidbert_resources(res, origin=origin, filter_tags=filter_tags)
@@ -268,6 +271,87 @@ class ProfessionsRecommenderBackbone:
         logging.info(sidbert_resources)
         return sidbert_resources
 
+    #################### Incremental matching start ###############################
+    def get_label_cutoff(self):
+        """
+        Returns the time up to which labeled resources are matched against interests. Labels are timestamped before
+        their transaction commits, so a resource may become visible after a resource labeled later. Resources labeled
+        within the last PROFESSIONS_LABEL_LAG seconds are therefore left for a later run.
+        :return: datetime
+        """
+        return timezone.now() - datetime.timedelta(seconds=getattr(settings, "PROFESSIONS_LABEL_LAG", 300))
+
+    def get_label_watermark(self, until):
+        """
+        Returns the time the newest resource up to a cutoff was labeled, resources labeled later are new to an interest
+        classified now.
+        :param until: Cutoff, see get_label_cutoff.
+        :return: datetime or None if no resource is labeled.
+        """
+        return models.EducationalResource.objects.filter(ddc_labeled__lte=until)\
+            .aggregate(watermark=Max('ddc_labeled'))['watermark']
+
+    def get_labeled_resources(self, since, until):
+        """
+        Collects the resources labeled after a point in time which the type filters of generate_sidbert_resources can
+        select, grouped by their DDC label.
+        :param since: Resources labeled at this time or earlier are skipped, None collects all labeled resources.
+        :param until: Resources labeled after this time are skipped, see get_label_cutoff.
+        :return: dict mapping DDC labels to lists of (kind, resource) tuples ordered by labeling time, with kind being
+        'course', 'Event', 'MOOC' or 'OER', and the time the newest of them was labeled.
+        """
+        self.set_new_semester()
+        labeled = Q(ddc_code__isnull=False, ddc_labeled__isnull=False, ddc_labeled__lte=until)
+        if since is not None:
+            labeled &= Q(ddc_labeled__gt=since)
+        query_sets = [
+            ('course', models.StudipCourse.objects.filter(labeled, start_time__gte=self.current_semester)),
+            ('Event', models.StudipEvent.objects.filter(labeled, start_time__gte=timezone.now())),
+            ('MOOC', models.InheritingCourse.objects.filter(labeled, type__icontains='MOOC',
+                                                            origin__type='mooc_provider')),
+            ('OER', models.EducationalResource.objects.filter(labeled, type__icontains='OER',
+                                                              origin__type='edu-sharing_provider')),
+        ]
+        resources = {}
+        newest = since
+        for kind, query_set in query_sets:
+            for resource in query_set.order_by('ddc_labeled'):
+                # a resource is only collected as its most specific kind, e.g. a Stud.IP course not as MOOC
+                resources.setdefault(resource.pk, (kind, resource))
+                newest = resource.ddc_labeled if newest is None else max(newest, resource.ddc_labeled)
+
+        grouped = {}
+        for kind, resource in sorted(resources.values(), key=lambda item: item[1].ddc_labeled):
+            grouped.setdefault(self.get_label(resource.ddc_code), []).append((kind, resource))
+        return grouped, newest
+
+    @staticmethod
+    def get_label(ddc_code):
+        """
+        Returns the DDC label of the ddc_code of a resource, which update_resources_bert stores as quoted string.
+        :param ddc_code: ddc_code attribute of a resource.
+        :return: str
+        """
+        return str(ddc_code).strip('\"')
+
+    def resource_matches(self, kind, resource, filter_tags, origin):
+        """
+        Checks whether a resource collected by get_labeled_resources passes the type filters of an interest like in
+        generate_sidbert_resources.
+        :param kind: Kind of the resource, see get_labeled_resources.
+        :param resource: The resource.
+        :param filter_tags: Resource types chosen by the user.
+        :param origin: Origin of the user.
+        :return: True if the resource may be recommended.
+        """
+        if kind == 'course':
+            if resource.origin_id == origin.id:
+                return 'local_course' in filter_tags
+            return 'external_course' in filter_tags
+        if kind == 'Event':
+            return 'Event' in filter_tags and resource.origin_id == origin.id
+        return kind in filter_tags
+
     def compare_strings_by_ddc(self, str1, str2, is_same = False):
         """
         This function compares the relative semantic distance between two strings regarding their DDC distance.
@@ -1,5 +1,6 @@
 from backend import models
 from django.core.mail import send_mail
+from django.db.models import Max
 
 
 class RM_BASE():
@@ -67,6 +68,13 @@ class RM_BASE():
             }
         )
 
+    def get_teaser_template_id(self):
+        """
+        Returns the ID of the template of the teaser activity, which is placed on the start page of new users.
+        :return: Template ID or None if the recommender has no teaser.
+        """
+        return self.get_class_name() + "_AC_teaser"
+
     def create_teaser_activity(self, goal):
         """
         Creates an activity instance, related to the given goal (indirect user association),
@@ -74,10 +82,11 @@ class RM_BASE():
         :param goal: Goal instance.
         :return: True
         """
-        models.Activity.create_activity_from_template(
-            template_id=self.get_class_name() + "_AC_teaser",
-            goal=goal,
-        )
+        if self.get_teaser_template_id() is not None:
+            models.Activity.create_activity_from_template(
+                template_id=self.get_teaser_template_id(),
+                goal=goal,
+            )
         return True
 
     def get_teaser_activity(self, goal):
@@ -134,7 +143,8 @@ class RM_BASE():
         :param goal: Goal instance.
         :return: Next activity order number.
         """
-        new_activity_order = models.Activity.objects.filter(goal=goal).order_by('-order')[0].order
+        # PostgreSQL sorts activities without order first in descending order, Max ignores them
+        new_activity_order = models.Activity.objects.filter(goal=goal).aggregate(Max('order'))['order__max']
         if new_activity_order is None:
             new_activity_order = 1
         else:
@@ -144,6 +154,9 @@ class RM_BASE():
     def execute_cron_functions(self):
         """
         This function provides an access point for interval-based executions triggered by a cron job function.
+        The cron functions of all recommenders run concurrently, see
+        recommender_functions.execute_recommender_cron_functions.
+        :return: Number of processed items, e.g. goals, which is recorded with the duration, or None.
         """
         pass
 
@@ -716,11 +716,14 @@ class RM_abroad(RM_BASE):
         This function provides an access point for interval-based executions triggered by a cron job function.
         """
 
+        sent = 0
         if datetime.datetime.today().weekday() == 7:
             goals = models.Goal.objects.filter(userrecommender__recommender__name=self.NAME)
             for goal in goals:
                 if self.open_todos(goal):
                     self.send_nudging_email(goal)
+                    sent += 1
+        return sent
 
 
     def send_nudging_email(self, goal):
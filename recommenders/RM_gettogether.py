@@ -868,6 +868,7 @@ class RM_gettogether(RM_BASE):
                     "surname": person_activity.person.surname,
                     "role_description": person_activity.person.role_description,
                     "image": person_activity.person.image,
+                    "image_hash": person_activity.person.image_hash,
                     "location": goal.userrecommender.user.origin.location,
                     "sus": sus_activity.answers,
                     "courses": courses_activity.answers,
@@ -949,6 +950,7 @@ class RM_gettogether(RM_BASE):
             person.surname = data["surname"]
             person.email = data["email"]
             person.image = data["image"]
+            person.image_hash = data.get("image_hash")
             person.role_description = data["role_description"]
             person.save()
 
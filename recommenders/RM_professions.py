@@ -1,6 +1,9 @@
 import logging
 import re
 
+from django.db import transaction
+from django.db.models import Min, Q
+
 from backend import models
 from recommenders.RM_BASE import RM_BASE
 from bert_app.recommender_backbone import ProfessionsRecommenderBackbone
@@ -652,9 +655,9 @@ class RM_professions(RM_BASE):
     def generate_new_recommendations(self, activity, filtered_tags=None):
         """
         This function interfaces with the recommender backbone to generate and retreive new recommendations for courses
-        :param new_check: Set true if the scheduled tasks function checks if new courses have been added to the database
+        that could potentially be relevant for this activity. The DDC label of the interest is stored in an
+        InterestState, so that the cron function only has to match resources labeled later against it.
         :param filtered_tags: List of tags to be used for filtering resources.
-        that could potentially be relevant for this activity.
         :param activity: activity type object
         """
 
@@ -662,50 +665,66 @@ class RM_professions(RM_BASE):
         interest = activity.answers[0]
         if filtered_tags is None:
             filtered_tags = []
-        sidbert_resources = self.backbone.fetch_resources_sidbert(interest, user.origin, filtered_tags)
+        label = self.backbone.generate_ddc_label(interest)
+        # taken before the retrieval, a resource labeled meanwhile is considered again by the cron function
+        watermark = self.backbone.get_label_watermark(until=self.backbone.get_label_cutoff())
+        models.InterestState.objects.update_or_create(goal=activity.goal, defaults={
+            "interest": interest,
+            "ddc_label": label,
+            "filter_tags": filtered_tags,
+            "watermark": watermark,
+        })
+        sidbert_resources = self.backbone.fetch_resources_sidbert(interest, user.origin, filtered_tags, label=label)
 
         if len(sidbert_resources) == 0:
             self.generate_empty_feedback(activity=activity)
         else:
-            for i, resource in enumerate(sidbert_resources):
-                description = resource.description
-                img = None
-                title = 'Neue Empfehlung'
-                if 'SIP' in resource.type:
-                    description = resource.description
-                    if resource.origin != user.origin:
-                        title = f'Kursempfehlung an einer anderen Universität: {resource.title}'
-                    else:
-                        title = f'Kursempfehlung: {resource.title}'
-                elif 'mooc' in resource.type:
-                    description, img = self.build_resource_description(resource, type='mooc')
-                    title = f'MOOC-Empfehlung: {resource.title}'
-                elif 'oer' in resource.type:
-                    description, img = self.build_resource_description(resource, type='oer')
-                    title = f'OER-Empfehlung: {resource.title}'
-                elif 'event' in resource.type:
-                    if resource.title:
-                        title = f'Einzeltermin-Empfehlung: {resource.title}'
-                    else:
-                        title = 'Einzeltermin-Empfehlung'
-                    if resource.description:
-                        description = resource.description
-                    else:
-                        description = 'Dieser Einzeltermin gehört zu einem Kurs, der zu deinen Interessen passt.'
-                new_resource_order = self.get_next_activity_order(activity.goal)
-                new_resource_recommendation = models.Activity.objects.create(
-                    description=description,
-                    type='resource',
-                    resource=resource,
-                    status='active',
-                    goal=activity.goal,
-                    title=title,
-                    order=new_resource_order,
-                    image=img
-                )
-                new_resource_recommendation.save()
+            for resource in sidbert_resources:
+                self.create_recommendation(goal=activity.goal, resource=resource, user=user)
         return True
 
+    def create_recommendation(self, goal, resource, user):
+        """
+        Creates an activity recommending a resource.
+        :param goal: Goal of the interest.
+        :param resource: Subclass instance of EducationalResource.
+        :param user: SiddataUser the resource is recommended to.
+        :return: The created activity.
+        """
+        description = resource.description
+        img = None
+        title = 'Neue Empfehlung'
+        if 'SIP' in resource.type:
+            description = resource.description
+            if resource.origin != user.origin:
+                title = f'Kursempfehlung an einer anderen Universität: {resource.title}'
+            else:
+                title = f'Kursempfehlung: {resource.title}'
+        elif 'mooc' in resource.type:
+            description, img = self.build_resource_description(resource, type='mooc')
+            title = f'MOOC-Empfehlung: {resource.title}'
+        elif 'oer' in resource.type:
+            description, img = self.build_resource_description(resource, type='oer')
+            title = f'OER-Empfehlung: {resource.title}'
+        elif 'event' in resource.type:
+            if resource.title:
+                title = f'Einzeltermin-Empfehlung: {resource.title}'
+            else:
+                title = 'Einzeltermin-Empfehlung'
+            if resource.description:
+                description = resource.description
+            else:
+                description = 'Dieser Einzeltermin gehört zu einem Kurs, der zu deinen Interessen passt.'
+        return models.Activity.objects.create(
+            description=description,
+            type='resource',
+            resource=resource,
+            status='active',
+            goal=goal,
+            title=title,
+            order=self.get_next_activity_order(goal),
+            image=img
+        )
 
     def generate_empty_feedback(self, activity):
         """
@@ -724,48 +743,144 @@ class RM_professions(RM_BASE):
 
 
     ### Cron functions
-    def check_for_new(self, activity):
+    def notify_new_resources(self, goal, interest):
         """
-        This activity checks if there are new resources that match to requests that previously yielded no results.
+        Resolves the notifications about missing resources of an interest for which new resources were recommended and
+        informs the user by mail if they left their address for this interest.
+        :param goal: Goal of the interest.
+        :param interest: The interest as entered by the user.
         """
-        successfully_generated = False
-        if self.generate_new_recommendations(activity=activity):
-            successfully_generated = True
-            goal = activity.goal
-            # Sends mail if users provided their address for this interest.
-            if models.Activity.objects.filter(goal=goal, title__startswith='E-mail gespeichert!')\
-                    .exclude(status='done').exists():
-                # if the user has left an e-mail address, they are notified about new resources being available
-                requested_interest = activity.answers[0]
-
-                mail_text = 'Siddata hat neue Bildungsressourcen für dein Interesse '+str(requested_interest)+\
-                            " gefunden!\n" \
-                            " Besuche das Recommender Modul 'Fachliche Interessen' im Stud.IP Siddata" \
-                            " Studierendenassistenten um diese Ressourcen anzusehen.\n" \
-                            " Herzliche Grüße" \
-                            " \n dein Siddata Studienassistent"
-
-                mail_activity = models.Activity.objects.filter(goal=goal, title__startswith='E-mail gespeichert!')\
-                    .exclude(status='done')
-                mail_address = mail_activity.answers[0]
-                self.send_push_email(address=mail_address,
-                                     title='Neue Materialien für dein Interesse '+str(requested_interest),
-                                     content=mail_text)
-        return successfully_generated
-
+        # the update increments the versions of the notifications and the goal, see ChangeQuerySet, so clients receive
+        # the resolved notifications with their next delta sync
+        models.Activity.objects.filter(goal=goal, type='todo',
+                                       title__startswith='Momentan sind keine Empfehlungen verfügbar')\
+            .exclude(status='done').update(status='done')
+        mail_activity = models.Activity.objects.filter(goal=goal, title__startswith='E-mail gespeichert!')\
+            .exclude(status='done').first()
+        if mail_activity is not None and mail_activity.answers:
+            # if the user has left an e-mail address, they are notified about new resources being available
+            mail_text = 'Siddata hat neue Bildungsressourcen für dein Interesse '+str(interest)+\
+                        " gefunden!\n" \
+                        " Besuche das Recommender Modul 'Fachliche Interessen' im Stud.IP Siddata" \
+                        " Studierendenassistenten um diese Ressourcen anzusehen.\n" \
+                        " Herzliche Grüße" \
+                        " \n dein Siddata Studienassistent"
+            self.send_push_email(address=mail_activity.answers[0],
+                                 title='Neue Materialien für dein Interesse '+str(interest),
+                                 content=mail_text)
+
+    def classify_interests(self):
+        """
+        Creates the missing InterestStates of interests, e.g. of those entered before they were stored or after the
+        labels were reset for a new SidBERT model. This classifies each of these interests once.
+        :return: Number of classified interests.
+        """
+        watermark = self.backbone.get_label_watermark(until=self.backbone.get_label_cutoff())
+        classified = 0
+        topic_activities = models.Activity.objects.filter(
+            template_ref_id=self.get_template_id('my_topic'),
+            goal__userrecommender__recommender=self.recommender,
+        ).filter(Q(goal__interest_state__isnull=True) | Q(goal__interest_state__ddc_label__isnull=True))\
+            .exclude(status='done').select_related('goal')
+        for activity in topic_activities:
+            if not activity.answers:
+                continue
+            filter_activity = models.Activity.objects.filter(
+                goal=activity.goal, template_ref_id=self.get_template_id('my_topic_filter')).first()
+            filter_tags = self.get_filter_tags(filter_activity.answers or []) if filter_activity else []
+            models.InterestState.objects.update_or_create(goal=activity.goal, defaults={
+                "interest": activity.answers[0],
+                "ddc_label": self.backbone.generate_ddc_label(activity.answers[0]),
+                "filter_tags": filter_tags,
+                "watermark": watermark,
+            })
+            classified += 1
+        return classified
+
+    def select_new_resources(self, state, resources, origin, recommended):
+        """
+        Selects up to COURSE_MAX resources of the label group of an interest which are new to it and pass its filters.
+        :param state: InterestState of the interest.
+        :param resources: (kind, resource) tuples ordered by labeling time, see get_labeled_resources.
+        :param origin: Origin of the user.
+        :param recommended: Set of (goal_id, resource_id) tuples of the existing recommendations.
+        :return: List of the selected resources and, if the limit left resources unconsidered, the labeling time up to
+        which all resources were considered, else None.
+        """
+        new_resources = []
+        considered = state.watermark
+        last = None
+        for kind, resource in resources:
+            if state.watermark is not None and resource.ddc_labeled <= state.watermark:
+                continue
+            if last is not None and resource.ddc_labeled > last:
+                # all resources labeled up to the previous one have been considered
+                considered = last
+            if len(new_resources) == COURSE_MAX:
+                # resources labeled at the same time as the last selected one are considered again by the next run
+                return new_resources, considered
+            last = resource.ddc_labeled
+            if (state.goal_id, resource.pk) not in recommended \
+                    and self.backbone.resource_matches(kind, resource, state.filter_tags, origin):
+                new_resources.append(resource)
+        return new_resources, None
+
+    def recommend_new_resources(self):
+        """
+        Recommends the resources labeled since the last run to the interests with the same DDC label. The resources are
+        grouped by label, so a run only loads the interests of labels with new resources and its cost grows with the
+        number of newly labeled resources rather than with the number of interests. Resources which were already
+        recommended for an interest are skipped. An interest gets at most COURSE_MAX recommendations per run, the
+        remaining resources are left for the next runs.
+        :return: Number of created recommendations.
+        """
+        states = models.InterestState.objects.filter(goal__userrecommender__recommender=self.recommender,
+                                                     ddc_label__isnull=False)
+        if not states.exists():
+            return 0
+        if states.filter(watermark__isnull=True).exists():
+            # interests classified before any resource was labeled consider all labeled resources
+            oldest = None
+        else:
+            oldest = states.aggregate(oldest=Min('watermark'))['oldest']
+        grouped, newest = self.backbone.get_labeled_resources(since=oldest, until=self.backbone.get_label_cutoff())
+        if not grouped:
+            return 0
+
+        matching_states = list(states.filter(ddc_label__in=list(grouped))
+                               .select_related('goal__userrecommender__user__origin'))
+        resource_ids = [resource.pk for resources in grouped.values() for _, resource in resources]
+        recommended = set(models.Activity.objects.filter(
+            goal__in=[state.goal_id for state in matching_states], resource__in=resource_ids,
+        ).values_list('goal_id', 'resource_id'))
+
+        created = 0
+        limited = {}
+        for state in matching_states:
+            user = state.goal.userrecommender.user
+            new_resources, considered = self.select_new_resources(state, grouped[state.ddc_label], user.origin,
+                                                                  recommended)
+            if considered is not None:
+                limited[state.pk] = considered
+            if not new_resources:
+                continue
+            with transaction.atomic():
+                for resource in new_resources:
+                    self.create_recommendation(goal=state.goal, resource=resource, user=user)
+            created += len(new_resources)
+            self.notify_new_resources(goal=state.goal, interest=state.interest)
+
+        # the other interests have considered the resources up to the newest one now
+        states.filter(Q(watermark__isnull=True) | Q(watermark__lt=newest)).exclude(pk__in=list(limited))\
+            .update(watermark=newest)
+        for pk, considered in limited.items():
+            models.InterestState.objects.filter(pk=pk).update(watermark=considered)
+        return created
 
     def execute_cron_functions(self):
-        empty_professions_activities = models.Activity.objects.filter(type='todo',
-                                                               title__startswith=
-                                                               'Momentan sind keine Empfehlungen verfügbar')\
-                                                                      .exclude(status='done')
-        for activity in empty_professions_activities:
-            self.check_for_new(activity=activity)
-
-        goal_associated_interests = models.Goal.objects.filter(userrecommender__recommender=self.recommender)\
-            .exclude(title='interest_associated_goal')
-        for goal in goal_associated_interests:
-            root_activity = models.Activity.objects.filter(goal=goal, template_ref_id=self.get_template_id('my_topic')).exclude(status='done')
-            if not root_activity:
-                root_activity = models.Activity.objects.filter(goal=goal,type='todo',title__startswith='Momentan sind keine Empfehlungen verfügbar').exclude(status='done')
-            self.check_for_new(activity=root_activity)
+        """
+        Classifies the interests without DDC label and recommends the resources labeled since the last run.
+        :return: Number of created recommendations.
+        """
+        self.classify_interests()
+        return self.recommend_new_resources()
@@ -1,3 +1,5 @@
+from django.db.models import Max
+
 from backend import models
 from recommenders import recommender_functions
 from recommenders.RM_BASE import RM_BASE
@@ -157,6 +159,13 @@ class RM_start(RM_BASE):
 
         return True
 
+    def get_teaser_template_id(self):
+        """
+        The Startpage has no teaser. Reason: The Startpage is active by default.
+        :return: None
+        """
+        return None
+
     def create_teaser_activity(self, goal):
         """
         This method is overridden without content. Reason: The Startpage is active by default.
@@ -165,6 +174,19 @@ class RM_start(RM_BASE):
         """
         return True
 
+    def get_initial_activities(self):
+        """
+        Returns the activities every user finds on the start page after the first login.
+        :return: List of tuples of a template ID and a dict of attributes that differ from the template.
+        """
+        return [
+            (self.get_template_id("welcome"), {}),
+            (self.get_template_id("settings"), {}),
+            (self.get_template_id("instructions_1"), {}),
+            (self.get_template_id("instructions_2"), {}),
+            (self.get_template_id("reset"), {"status": "snoozed", "color_theme": "red"}),
+        ]
+
     def initialize(self, user):
         """
         When a user logs in for the first time, initial activities are generated.
@@ -174,32 +196,12 @@ class RM_start(RM_BASE):
         # Relate recommender to user and magically create a goal that may be filled with activities
         goal = self.activate_recommender_for_user_and_create_first_goal(user)
 
-        models.Activity.create_activity_from_template(
-            template_id=self.get_template_id("welcome"),
-            goal=goal,
-        )
-
-        models.Activity.create_activity_from_template(
-            template_id=self.get_template_id("settings"),
-            goal=goal,
-        )
-
-        models.Activity.create_activity_from_template(
-            template_id=self.get_template_id("instructions_1"),
-            goal=goal,
-        )
-
-        models.Activity.create_activity_from_template(
-            template_id=self.get_template_id("instructions_2"),
-            goal=goal,
-        )
-
-        models.Activity.create_activity_from_template(
-            template_id=self.get_template_id("reset"),
-            goal=goal,
-            status="snoozed",
-            color_theme="red",
-        )
+        for template_id, attributes in self.get_initial_activities():
+            models.Activity.create_activity_from_template(
+                template_id=template_id,
+                goal=goal,
+                **attributes
+            )
 
         return True
 
@@ -237,20 +239,50 @@ class RM_start(RM_BASE):
 
         return True
 
-    def get_or_create_announcements(self, user):
+    def push_announcements(self, user=None):
         """
-        In this function announcements can be fed into the start recommender.
-        :param user: SiddataUser object
+        Delivers all active announcements to the start page of users who did not receive them yet.
+        This is executed on first login and periodically by a scheduled task, so read requests stay free of writes.
+        :param user: SiddataUser object. If None, announcements are pushed to all users.
+        :return: Number of created activities
         """
-        goal = self.get_default_goal(user)
-        evaluation_activity, created = models.Activity.objects.get_or_create(
-            goal=goal,
-            title="Evaluation-Workshop: Du bist herzlich eingeladen!",
-            description="Aktuell sucht das Siddata-Team Teilnehmende für einen virtuellen Evaluations-Workshop. Dort lernst du am Beispiel von Siddata verschiedene Evaluationsperspektiven und Methoden kennen, probierst diese selber aus und hilfst, mit deinen Ideen Siddata weiterzuentwickeln und zu verbessern. Melde dich bei Interesse bitte bei Funda Seyfeli (seyfeli@his-he.de) für unsere Evaluationsreihe an, lerne andere Studierende auch von anderen Hochschulen kennen und erlebe einen dreistündigen, anregenden und abwechslungsreichen Online-Workshop im Januar 2022 (KW 02-04).",
-            color_theme="green",
-            type="todo",
-            image="sid.png",
-            feedback_size=0,
+        announcements = models.Announcement.objects.filter(active=True)
+        if not announcements.exists():
+            return 0
+
+        goals = models.Goal.objects.filter(
+            title=self.get_name(),
+            userrecommender__recommender=self.recommender,
         )
-        evaluation_activity.order = goal.get_max_order() + 1
-        evaluation_activity.save()
+        if user is not None:
+            goals = goals.filter(userrecommender__user=user)
+        goals = list(goals.annotate(max_order=Max("activity__order")))
+
+        created = 0
+        for announcement in announcements:
+            delivered = models.Activity.objects.filter(
+                goal__title=self.get_name(),
+                goal__userrecommender__recommender=self.recommender,
+                title=announcement.title,
+            )
+            if user is not None:
+                delivered = delivered.filter(goal__userrecommender__user=user)
+            delivered = set(delivered.values_list("goal_id", flat=True))
+
+            new_activities = []
+            for goal in goals:
+                if goal.id in delivered:
+                    continue
+                goal.max_order = (goal.max_order or 0) + 1
+                new_activities.append(announcement.build_activity(goal, goal.max_order))
+
+            # an activity added to a goal meanwhile may hold the computed order, such a goal is skipped instead of
+            # failing the whole batch and receives the announcement with the next push
+            models.Activity.objects.bulk_create(new_activities, batch_size=1000, ignore_conflicts=True)
+            inserted = list(models.Activity.objects.filter(
+                id__in=[activity.id for activity in new_activities]).values_list("goal_id", flat=True))
+            # bulk_create does not call save(), so cached fragments of the goals are invalidated explicitly
+            models.Goal.bump_versions(inserted)
+            created += len(inserted)
+
+        return created
@@ -2,21 +2,34 @@ import datetime
 import importlib
 import random
 import logging
+import threading
+import time
 
 from os import listdir
 from os.path import isfile, join
 
 import pandas as pd
+from django.db import IntegrityError, connection, transaction
 
 from backend import models
+from scheduled_tasks import leader
 import settings
-from recommenders.RM_start import RM_start
 
 
 RMMODULE = "recommenders"
 
 RANDOMIMAGES = ["brainbulb.png", "idea.png", "formulas.png"]
 
+# Process-wide registry of recommender instances by class name, see get_active_recommenders()
+_recommender_registry = None
+_registry_lock = threading.RLock()
+# Process-wide caches of activity templates by template ID and of the Stud.IP IDs of users of the prior version
+_template_cache = {}
+_p2_origin_ids = None
+
+#: Title of the activity which informs users of the prior version about the new start.
+P2_INFO_TITLE = "Neue Version, neuer Start!"
+
 
 def check_for_RM_existence(rm_classname):
     """
@@ -33,33 +46,54 @@ def check_for_RM_existence(rm_classname):
 def create_initial_data_for_user(user):
     """
     Initializes categories, goals and activities for a user when he first shows up.
+    All rows are written with a few bulk inserts in one transaction, as thousands of users show up at semester start.
+    Called within a transaction, e.g. by provision_users, a savepoint is used, which is rolled back on errors.
     :param user: SiddataUser instance
     :return: True if successful
     """
 
     try:
-        start = RM_start()
-        start.initialize(user)
-        generate_p2_user_info(user)
-        goal = start.get_default_goal(user)
-        active_rms = get_active_recommenders()
-        for rm in active_rms:
-            try:
-                rm.create_teaser_activity(goal)
-                if rm.get_name() != "Startseite":
-                    r = models.SiddataUserRecommender.objects.get_or_create(
-                        user=user,
-                        recommender=models.Recommender.objects.get_or_create(
-                            name=rm.get_name(),
-                            classname=rm.get_class_name(),
-                            description=rm.DESCRIPTION,
-                        )[0],
-                        enabled=False,
-                    )[0]
-                    r.save()
-            except Exception as e:
-                logging.error("Error in recommender_functions.create_initial_data_for_user: {}".format(e))
-                logging.error("RM is {}".format(rm.get_name()))
+        start_time = time.perf_counter()
+        start = get_recommender_by_classname("RM_start")
+        active_rms = [rm for rm in get_active_recommenders() if rm.get_class_name() != start.get_class_name()]
+
+        with transaction.atomic():
+            # relate all recommenders to the user, only the start page is enabled
+            recommenders = [start.recommender] + [get_recommender_object(rm) for rm in active_rms]
+            models.SiddataUserRecommender.objects.bulk_create([
+                models.SiddataUserRecommender(user=user, recommender=recommender, enabled=False)
+                for recommender in recommenders
+            ], ignore_conflicts=True)
+            models.SiddataUserRecommender.objects.filter(user=user, recommender=start.recommender).update(enabled=True)
+            userrecommender = models.SiddataUserRecommender.objects.get(user=user, recommender=start.recommender)
+            goal = models.Goal.objects.get_or_create(title=start.get_name(), userrecommender=userrecommender)[0]
+
+            # initial activities of the start page and teasers of all other recommenders
+            template_ids = [template_id for template_id, _ in start.get_initial_activities()]
+            template_ids += [rm.get_teaser_template_id() for rm in active_rms if rm.get_teaser_template_id()]
+            templates = get_activity_templates(template_ids)
+            for template_id in set(template_ids) - templates.keys():
+                logging.error("Error in recommender_functions.create_initial_data_for_user: Template {} not "
+                              "found".format(template_id))
+            existing = set(models.Activity.objects.filter(goal=goal, template_ref_id__in=template_ids).values_list(
+                "template_ref_id", flat=True))
+
+            activities = [
+                models.Activity.build_activity_from_template(templates[template_id], goal, **attributes)
+                for template_id, attributes in start.get_initial_activities() + [
+                    (rm.get_teaser_template_id(), {}) for rm in active_rms if rm.get_teaser_template_id()
+                ]
+                if template_id in templates and template_id not in existing
+            ]
+            if is_p2_user(user) and not models.Activity.objects.filter(goal=goal, title=P2_INFO_TITLE).exists():
+                activities.append(build_p2_info_activity(goal))
+            models.Activity.objects.bulk_create(activities)
+            models.Goal.bump_versions([goal.id])
+
+            # within the savepoint, so a failing push leaves no partial data and the caller's transaction usable
+            start.push_announcements(user)
+        logging.debug("Initial data for user {} created in {:.1f} ms".format(
+            user.id, (time.perf_counter() - start_time) * 1000))
 
         return True
 
@@ -68,6 +102,71 @@ def create_initial_data_for_user(user):
         return False
 
 
+def provision_users(origin_id, user_origin_ids):
+    """
+    Creates users which do not exist yet together with their initial data, e.g. for all students of a semester before
+    they first open the plugin. A batch is created in one transaction, so a user is never visible without its initial
+    data. The initial data of each user is created in a savepoint, so a failing user does not abort the batch. Entry point of the provisioning tasks in the background task queue (see backend.task_queue).
+    :param origin_id: ID of the Origin of the users
+    :param user_origin_ids: List of user_origin_id strings of one batch
+    :return: Number of created users
+    """
+    origin = models.Origin.objects.get(id=origin_id)
+    user_origin_ids = set(str(user_origin_id) for user_origin_id in user_origin_ids)
+    retry = True
+    while True:
+        try:
+            with transaction.atomic():
+                existing = set(models.SiddataUser.objects.filter(
+                    origin=origin, user_origin_id__in=user_origin_ids).values_list("user_origin_id", flat=True))
+                users = models.SiddataUser.objects.bulk_create([
+                    models.SiddataUser(origin=origin, user_origin_id=user_origin_id)
+                    for user_origin_id in sorted(user_origin_ids - existing)
+                ])
+                failed = [user.id for user in users if not create_initial_data_for_user(user)]
+                if failed:
+                    # users without initial data are created again on their first request
+                    models.SiddataUser.objects.filter(id__in=failed).delete()
+                return len(users) - len(failed)
+        except IntegrityError:
+            # a user of the batch showed up meanwhile and was created by its first request, the batch is repeated
+            if not retry:
+                raise
+            retry = False
+
+
+def get_recommender_object(rm):
+    """
+    Returns the database representation of a recommender instance.
+    :param rm: recommender class instance
+    :return: Recommender object
+    """
+    if rm.recommender is not None:
+        return rm.recommender
+    return models.Recommender.objects.get_or_create(
+        name=rm.get_name(),
+        classname=rm.get_class_name(),
+        description=rm.DESCRIPTION,
+    )[0]
+
+
+def get_activity_templates(template_ids):
+    """
+    Returns activity templates from the process-wide template cache. Missing templates are loaded with one query.
+    Templates are created at server startup, the cache is cleared by reload_recommenders().
+    :param template_ids: Iterable of template IDs
+    :return: dict mapping template IDs to ActivityTemplate objects, unknown template IDs are missing
+    """
+    template_ids = set(template_ids)
+    with _registry_lock:
+        missing = template_ids - _template_cache.keys()
+        if missing:
+            for template in models.ActivityTemplate.objects.filter(template_id__in=missing):
+                _template_cache[template.template_id] = template
+        return {template_id: _template_cache[template_id] for template_id in template_ids
+                if template_id in _template_cache}
+
+
 def create_recommender_by_classname(rm):
     """
     Create a class instance by constructor call in a string.
@@ -95,38 +194,212 @@ def create_recommender_by_classname(rm):
         return False
 
 
+def discover_recommenders():
+    """
+    Searches the recommender directory for files and classes and instantiates all activated recommenders.
+    This is expensive, as every recommender constructor touches the database. Use get_active_recommenders() to get
+    the cached instances instead.
+    :return: list with recommender class instances
+    """
+    # path with recommender modules
+    RM_path = settings.BASE_DIR + "/recommenders"
+
+    # only files
+    files = [f for f in listdir(RM_path) if isfile(join(RM_path, f))]
+    # only files starting with RM
+
+    files = [f for f in files if f[:3] == "RM_"]
+
+    active = []
+    for file in files:
+        try:
+            # remove .py ending
+            name = file[:-3]
+
+            rm = create_recommender_by_classname(name)
+            if rm.activated():
+                active.append(rm)
+
+        except Exception as e:
+            logging.error("class instantiation failed for {}".format(name))
+            logging.error("Error in recommender_functions.discover_recommenders() {}".format(e))
+    return active
+
+
+def reload_recommenders():
+    """
+    Rediscovers and reinstantiates all recommenders of the process-wide registry. Call this hook whenever recommender
+    modules or their database representation changed.
+    :return: list with recommender class instances
+    """
+    global _recommender_registry
+
+    with _registry_lock:
+        start_time = time.perf_counter()
+        registry = {}
+        for rm in discover_recommenders():
+            registry[rm.get_class_name()] = rm
+        _recommender_registry = registry
+        _template_cache.clear()
+        logging.info("Recommender registry with {} recommenders built in {:.1f} ms".format(
+            len(registry), (time.perf_counter() - start_time) * 1000))
+        return list(registry.values())
+
+
 def get_active_recommenders():
     """
     Returns a list of recommender instances which are activated.
-    Searches the recommender directory for files and classes.
+    The recommenders are discovered and instantiated once per process and cached afterwards.
     :return: list with recommender class instances
     """
     try:
-        # path with recommender modules
-        RM_path = settings.BASE_DIR + "/recommenders"
+        registry = _recommender_registry
+        if registry is None:
+            return reload_recommenders()
+        return list(registry.values())
+    except Exception:
+        logging.exception("Error in recommender_functions.get_active_recommenders()")
+
+
+def get_recommender_by_classname(rm_classname):
+    """
+    Returns the cached instance of a recommender. Recommenders which are not active are instantiated on demand and
+    added to the registry.
+    :param rm_classname: class name of the recommender
+    :return: recommender class instance or False if instantiation failed
+    """
+    with _registry_lock:
+        if _recommender_registry is None:
+            reload_recommenders()
+        rm = _recommender_registry.get(rm_classname)
+        if rm is None:
+            rm = create_recommender_by_classname(rm_classname)
+            if rm:
+                _recommender_registry[rm_classname] = rm
+        return rm
+
+
+def process_activity(activity):
+    """
+    Executes the side effects of a changed activity: The activity is processed by its recommender, afterwards all
+    recommenders are refreshed.
+    :param activity: Activity object that was modified by the user
+    :return: Feedback string for the user
+    """
+    logger = logging.getLogger("recommender_functions.process_activity")
 
-        # only files
-        files = [f for f in listdir(RM_path) if isfile(join(RM_path, f))]
-        # only files starting with RM
+    rm_classname = activity.goal.userrecommender.recommender.classname
+    start_time = time.perf_counter()
+    rm = get_recommender_by_classname(rm_classname)
+    lookup_time = time.perf_counter()
 
-        files = [f for f in files if f[:3] == "RM_"]
+    feedback = rm.process_activity(activity=activity)
+    process_time = time.perf_counter()
 
-        active = []
-        for file in files:
-            try:
-                # remove .py ending
-                name = file[:-3]
+    refresh_all_recommenders()
+    refresh_time = time.perf_counter()
+    logger.debug("Activity {} ({}): recommender lookup {:.1f} ms, process_activity {:.1f} ms, refresh {:.1f} ms".format(
+        activity.id,
+        rm_classname,
+        (lookup_time - start_time) * 1000,
+        (process_time - lookup_time) * 1000,
+        (refresh_time - process_time) * 1000,
+    ))
 
-                rm = create_recommender_by_classname(name)
-                if rm.activated():
-                    active.append(rm)
+    if feedback == None or feedback == True:
+        feedback = activity.respond()
+    return feedback
+
+
+def process_activity_task(activity_id):
+    """
+    Entry point for processing an activity in the background task queue (see backend.task_queue).
+    :param activity_id: ID of the modified activity
+    :return: Feedback string for the user
+    """
+    activity = models.Activity.objects.get(id=activity_id)
+    return process_activity(activity)
 
-            except Exception as e:
-                logging.error("class instantiation failed for {}".format(name))
-                logging.error("Error in recommender_functions.get_active_recommenders() {}".format(e))
-        return active
+
+def run_cron_function(recommender, results, finished):
+    """
+    Executes the cron functions of a recommender in a thread of execute_recommender_cron_functions. They are skipped
+    if they are still running, in this or any other process, which is told by an advisory lock per class name.
+    :param recommender: Recommender instance.
+    :param results: dict the status, the number of processed items and the duration are stored in by class name.
+    :param finished: threading.Event which is set when the cron functions returned.
+    """
+    logger = logging.getLogger("recommender_functions.run_cron_function")
+    classname = recommender.__class__.__name__
+    lock_name = "cron:{}".format(classname)
+    start_time = time.perf_counter()
+    entry = {"status": "failed", "items": None}
+    try:
+        if not leader.try_advisory_lock(lock_name):
+            logger.warning("Cron functions of {} are still running, skipped".format(classname))
+            entry = {"status": "skipped", "items": None}
+            return
+        try:
+            entry = {"status": "done", "items": recommender.execute_cron_functions()}
+        finally:
+            leader.advisory_unlock(lock_name)
     except Exception:
-        logging.exception("Error in recommender_functions.get_active_recommenders()")
+        logger.exception("Cron functions of {} failed".format(classname))
+    finally:
+        entry["duration"] = None if entry["status"] == "skipped" else time.perf_counter() - start_time
+        # every thread opens its own database connection, closing it releases the lock in any case
+        connection.close()
+        results[classname] = entry
+        finished.set()
+
+
+def execute_recommender_cron_functions(concurrency=None, timeout=None, recommenders=None):
+    """
+    Executes the cron functions of all active recommenders concurrently, so that a slow recommender does not delay the
+    others. At most `concurrency` recommenders run at once. A recommender which does not finish within the timeout is
+    no longer waited for and frees its slot, but keeps running in its thread; it is skipped by the following
+    executions, in any process, until it finished.
+    :param concurrency: Number of recommenders executed at once, by default RECOMMENDER_CRON_CONCURRENCY.
+    :param timeout: Seconds a recommender may take, by default RECOMMENDER_CRON_TIMEOUT.
+    :param recommenders: Recommender instances, by default all active recommenders.
+    :return: dict mapping class names of recommenders to dicts with the status (done, failed, timeout or skipped), the
+    duration in seconds and the number of processed items returned by execute_cron_functions.
+    """
+    logger = logging.getLogger("recommender_functions.execute_recommender_cron_functions")
+    concurrency = concurrency or getattr(settings, "RECOMMENDER_CRON_CONCURRENCY", 4)
+    timeout = timeout or getattr(settings, "RECOMMENDER_CRON_TIMEOUT", 3600)
+
+    report = {}
+    pending = list(get_active_recommenders() if recommenders is None else recommenders)
+    results = {}
+    finished = threading.Event()
+    running = {}  # start times of the threads waited for by class name
+    while pending or running:
+        while pending and len(running) < concurrency:
+            recommender = pending.pop(0)
+            classname = recommender.__class__.__name__
+            thread = threading.Thread(target=run_cron_function, args=(recommender, results, finished),
+                                      name="RecommenderCron-{}".format(classname), daemon=True)
+            running[classname] = time.perf_counter()
+            thread.start()
+
+        finished.wait(max(0.0, min(running.values()) + timeout - time.perf_counter()))
+        finished.clear()
+        for classname, start_time in list(running.items()):
+            if classname in results:
+                report[classname] = results[classname]
+            elif time.perf_counter() - start_time >= timeout:
+                logger.error("Cron functions of {} did not finish within {}s".format(classname, timeout))
+                report[classname] = {"status": "timeout", "duration": time.perf_counter() - start_time, "items": None}
+            else:
+                continue
+            del running[classname]
+
+    for classname, entry in sorted(report.items(), key=lambda item: -(item[1]["duration"] or 0)):
+        logger.info("{}: {} in {}s, {} items".format(
+            classname, entry["status"], "-" if entry["duration"] is None else round(entry["duration"], 1),
+            entry["items"]))
+    return report
 
 
 def get_active_recommender_names():
@@ -315,7 +588,6 @@ def refresh_all_recommenders():
     :return:
     """
     try:
-        rms = get_active_recommenders()
         for rm in get_active_recommenders():
             rm.refresh()
         return True
@@ -374,6 +646,56 @@ def recommender_activated(user, rm_classname):
     return False
 
 
+def get_p2_origin_ids():
+    """
+    Returns the Stud.IP IDs of the users of the prior version (p2). The list is read once per process, if it cannot
+    be read, no user is treated as p2 user.
+    :return: set of user_origin_id strings
+    """
+    global _p2_origin_ids
+
+    with _registry_lock:
+        if _p2_origin_ids is None:
+            try:
+                p2_users = pd.read_csv(filepath_or_buffer="{}/p2_data/p2_origin_ids.csv".format(settings.BASE_DIR),
+                                       sep=";",
+                                       )
+                _p2_origin_ids = set(str(user_origin_id) for user_origin_id in p2_users["user_origin_id"])
+            except Exception:
+                logging.exception("Error in recommender_functions.get_p2_origin_ids()")
+                _p2_origin_ids = set()
+        return _p2_origin_ids
+
+
+def is_p2_user(user):
+    """
+    Checks if a user's origin_id is known from prior p2 usage.
+    :param user: SiddataUser instance
+    :return: Boolean
+    """
+    return str(user.user_origin_id) in get_p2_origin_ids()
+
+
+def build_p2_info_activity(goal):
+    """
+    Builds the activity which informs users of the prior version about the new start.
+    :param goal: Default goal of the start recommender
+    :return: Activity instance, not yet saved
+    """
+    return models.Activity(
+        type="todo",
+        title=P2_INFO_TITLE,
+        description="Siddata wurde grundlegend erneuert. Daher wurden alle Einstellungen und Daten alter "
+                    "Versionen archiviert. Du kannst deine Rohdaten bei Bedarf bei uns anfragen und in "
+                    "maschinenlesbarer Form erhalten. <br><br>Viel Spaß beim Erkunden der neuen Funktionen!",
+        goal=goal,
+        order=1,
+        status="new",
+        feedback_size=0,
+        image="sid.png",
+    )
+
+
 def generate_p2_user_info(user):
     """
     Checks if a user's origin_id is known from prior p2 usage and generates an info activity if so.
@@ -381,25 +703,12 @@ def generate_p2_user_info(user):
     :return: True, if user is known and activity was generated, False otherwise.
     """
     try:
-        p2_users = pd.read_csv(filepath_or_buffer="{}/p2_data/p2_origin_ids.csv".format(settings.BASE_DIR),
-                               sep=";",
-                               )
-        if str(user.user_origin_id) in set(p2_users["user_origin_id"]):
-            rm_start = RM_start()
+        if is_p2_user(user):
+            rm_start = get_recommender_by_classname("RM_start")
             goal = rm_start.get_default_goal(user)
 
-            activity_data_info = models.Activity.objects.get_or_create(
-                type="todo",
-                title="Neue Version, neuer Start!",
-                description="Siddata wurde grundlegend erneuert. Daher wurden alle Einstellungen und Daten alter "
-                            "Versionen archiviert. Du kannst deine Rohdaten bei Bedarf bei uns anfragen und in "
-                            "maschinenlesbarer Form erhalten. <br><br>Viel Spaß beim Erkunden der neuen Funktionen!",
-                goal=goal,
-                order=1,
-                status="new",
-                feedback_size=0,
-                image="sid.png",
-            )[0]
+            if not models.Activity.objects.filter(goal=goal, title=P2_INFO_TITLE).exists():
+                build_p2_info_activity(goal).save()
             return True
         else:
             return False
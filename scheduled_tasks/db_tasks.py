@@ -12,6 +12,8 @@ decoupled from the task scheduler, i.e. it should only do the task required. e.g
 All tasks should follow the naming convention as `task_<name of task>`.
 
 To execute (schedule) any task, the task should be added as a job in the `add_jobs` function of this module, which schedules and starts these tasks.
+Long-running tasks should be added with `add_heavy_job`, then the scheduler only enqueues them and a worker of the task queue executes them
+(see backend.task_queue and the runworker-command).
 The add_jobs function either gets automatically executed by the AppConfig with the start of Django (see scheduled_tasks.scheduler.start, backend.apps.BackendConfig), or
 executed using the runapscheduler-command (backend.management.commands.runapscheduler.Command), which make sure these tasks will be scheduled with start of django application.
 Further, the tasks will be added to a database-entry which can be managed through the Django-Management-Interface.
@@ -32,6 +34,9 @@ import inspect
 from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 import backend.models
+from backend import bulk
+from backend import streaming
+from backend import task_queue
 from backend.models import WebResource
 from settings import BASE_DIR
 
@@ -59,18 +64,47 @@ def add_jobs(scheduler):
     scheduler.add_job(delete_old_job_executions, trigger=CronTrigger(day_of_week="mon", hour="00", minute="00"),
                       id="delete_old_job_executions", max_instances=1, replace_existing=True, )
 
-    scheduler.add_job(task_add_backend_resources, 'interval', minutes=10, id="add_backend_resources", replace_existing=True)
-    scheduler.add_job(task_classify_new_resources_bert, 'cron', start_date=today, hour=20, id="classify_new_resources_bert", replace_existing=True)
-    scheduler.add_job(task_execute_recommender_cron_functions,'interval',hours=6, id="execute_recommender_cron_functions", replace_existing=True)
+    # heavy jobs are executed by the workers of the task queue, see add_heavy_job
+    add_heavy_job(scheduler, task_add_backend_resources, 'interval', minutes=10, id="add_backend_resources", replace_existing=True)
+    add_heavy_job(scheduler, task_classify_new_resources_bert, 'cron', start_date=today, hour=20, id="classify_new_resources_bert", replace_existing=True)
+    add_heavy_job(scheduler, task_execute_recommender_cron_functions,'interval',hours=6, id="execute_recommender_cron_functions", replace_existing=True)
     scheduler.add_job(task_initialize_templates, id="initialize_templates", replace_existing=True)
-    scheduler.add_job(task_collect_educational_resources, 'cron', start_date=today, hour=20, replace_existing=True)
+    add_heavy_job(scheduler, task_push_announcements, 'interval', hours=1, id="push_announcements", replace_existing=True)
+    add_heavy_job(scheduler, task_collect_educational_resources, 'cron', start_date=today, hour=20, replace_existing=True)
 
-    scheduler.add_job(task_create_rawdataexportcsv, 'cron', start_date=today, hour=23, id="create_rawdataexportcsv", replace_existing=True)
-    scheduler.add_job(task_create_rawdataexportcsv, next_run_time=datetime.now() + timedelta(minutes=1), id="create_rawdataexportcsv", replace_existing=True)
+    add_heavy_job(scheduler, task_create_rawdataexportcsv, 'cron', start_date=today, hour=23, id="create_rawdataexportcsv", replace_existing=True)
+    add_heavy_job(scheduler, task_create_rawdataexportcsv, next_run_time=datetime.now() + timedelta(minutes=1), id="create_rawdataexportcsv", replace_existing=True)
 
     scheduler.add_job(task_send_admin_report, 'cron', start_date=tomorrow, hour=0, id="send_admin_report", replace_existing=True)
 
 
+def add_heavy_job(scheduler, function, *args, **kwargs):
+    """
+    Schedules a job which enqueues the task function in the task queue (see backend.task_queue) instead of running it
+    in the scheduler thread of a web server process, if SCHEDULER_ENQUEUE_TASKS is set. Otherwise, the function is
+    scheduled directly.
+    :param scheduler: The scheduler.
+    :param function: Task function of this module.
+    :param args: Positional arguments of scheduler.add_job, e.g. the trigger.
+    :param kwargs: Keyword arguments of scheduler.add_job.
+    """
+    if getattr(settings, "SCHEDULER_ENQUEUE_TASKS", False):
+        scheduler.add_job(enqueue_task, *args, args=[function.__name__], **kwargs)
+    else:
+        scheduler.add_job(function, *args, **kwargs)
+
+
+def enqueue_task(name):
+    """
+    Adds a task function of this module to the task queue with low priority, unless it is still queued or running from
+    an earlier run.
+    :param name: Name of the task function, e.g. "task_classify_new_resources_bert".
+    :return: The BackgroundTask instance.
+    """
+    return task_queue.enqueue("scheduled_tasks.db_tasks." + name, label=name, priority=task_queue.PRIORITY_LOW,
+                              max_attempts=1, unique=True)
+
+
 def task_dummy():
     """
     Create the dummy task which you want to accomplish here.
@@ -117,49 +151,80 @@ def task_add_backend_resources():
     csv_files = glob.glob(str(data_dir) + "/*.csv")
     for file in csv_files:
         logger.debug(f"processing file: {file}")
-        resource_objs = []  # database objects for resource model
-        with open(file, mode='r') as current_file:
-            csv_reader = csv.reader(current_file, delimiter=';')
-            line_count = 0
-            for row in csv_reader:
-                # if line_count == 0:
-                #     logger.debug(f"Headers/column names are: {', '.join(row)}")
-                #     line_count += 1
-                #     continue
-                # # check for validity of values:
-                if row[0] == '':  # if there is no title skip the row
-                    continue
-                if row[1] == '':  # if there is no description, skip the row
-                    continue
-                # check for validity of url field:
-                validate = URLValidator()
-                try:  # if url is not valid skip the row
-                    validate(row[2])
-                except ValidationError:
-                    logger.debug(f"url field is not valid for this row {', '.join(row)}")
-                    continue
-
-                # add row to the database in backend_resources if it is already not there
-                if not WebResource.objects.filter(
-                        title=row[0],
-                        description=row[1],
-                        source=row[2]
-                ).exists():
-                    resource_objs.append(
-                        WebResource(
-                            title=row[0],
-                            description=row[1],
-                            source=row[2]
-                        ))
-
-                line_count += 1
-        logger.debug("Adding rows in backend_resources model")
-        WebResource.objects.bulk_create(resource_objs)  # use of bulk create is used for faster execution
+        import_backend_resources(file, logger=logger)
 
         logger.debug("moving file to old dir")
         os.rename(file, str(data_dir / 'old' / Path(file).stem) + datetime.now().strftime("%d%m%Y%H%M%S") + ".csv")
 
 
+def get_resource_hash(title, description, source):
+    """
+    Computes the content hash of a web resource imported from a csv file.
+    :return: Hex digest string of length 64, stored as WebResource.content_hash.
+    """
+    return bulk.get_content_hash({"title": title, "description": description, "source": source})
+
+
+def iter_resource_rows(current_file, logger):
+    """
+    Reads the valid rows of a csv file of web resources, i.e. rows with title, description and a valid url.
+    :param current_file: Opened csv file with the columns title;description;url and no header.
+    :param logger: Logger for skipped rows.
+    :return: Generator of (title, description, source) tuples.
+    """
+    validate = URLValidator()
+    for row in csv.reader(current_file, delimiter=';'):
+        if len(row) < 3 or row[0] == '' or row[1] == '':  # if there is no title or description skip the row
+            continue
+        try:  # if url is not valid skip the row
+            validate(row[2])
+        except ValidationError:
+            logger.debug(f"url field is not valid for this row {', '.join(row)}")
+            continue
+        yield row[0], row[1], row[2]
+
+
+def import_backend_resources(file, chunk_size=None, logger=None):
+    """
+    Adds the rows of a csv file as web resources, unless a resource with the same title, description and url exists
+    or the row is repeated within the file. The file is read in chunks, and the existing resources of a chunk are
+    looked up with one query by their content hash.
+    :param file: Path of the csv file, see task_add_backend_resources.
+    :param chunk_size: Number of rows per chunk, by default INGESTION_CHUNK_SIZE.
+    :param logger: Logger for the progress.
+    :return: Tuple of the numbers of valid rows and of added resources.
+    """
+    logger = logger or logging.getLogger("scheduled_tasks.db_tasks.import_backend_resources")
+    chunk_size = chunk_size or getattr(settings, "INGESTION_CHUNK_SIZE", 500)
+    seen = set()  # content hashes of the rows read so far
+    n_rows = n_added = 0
+    with open(file, mode='r') as current_file:
+        for chunk in streaming.iter_chunks(iter_resource_rows(current_file, logger), chunk_size):
+            rows = {}
+            for row in chunk:
+                content_hash = get_resource_hash(*row)
+                if content_hash not in seen:
+                    seen.add(content_hash)
+                    rows[content_hash] = row
+
+            # resources imported before content hashes were stored are matched by their fields
+            known = bulk.get_known_hashes(WebResource.objects.all(), rows.keys())
+            for title, description, source in WebResource.objects.filter(
+                    content_hash__isnull=True, source__in={row[2] for row in rows.values()}
+            ).values_list("title", "description", "source"):
+                known.add(get_resource_hash(title, description, source))
+
+            resources = [
+                WebResource(title=title, description=description, source=source, content_hash=content_hash)
+                for content_hash, (title, description, source) in rows.items() if content_hash not in known
+            ]
+            bulk.bulk_create_inherited(resources)
+            n_rows += len(chunk)
+            n_added += len(resources)
+            logger.info(f"{file}: {n_rows} rows read, {n_added} resources added")
+    return n_rows, n_added
+
+
 def task_classify_new_resources_bert():
     """
     This function is responsible for scheduling the classification of new resources.
@@ -189,9 +254,11 @@ def task_execute_recommender_cron_functions():
     else:
         logger.setLevel(logging.WARNING)
     logger.info('Starting recommender cron job functions')
-    for recommender in recommender_functions.get_active_recommenders():
-        recommender.execute_cron_functions()
-    logger.info('Recommender cron job functions executed successfully')
+    # the report is stored as result of the background task, see the taskqueue dashboard
+    report = recommender_functions.execute_recommender_cron_functions()
+    logger.info('Recommender cron job functions executed: {}'.format(
+        ", ".join("{} {}".format(classname, entry["status"]) for classname, entry in report.items())))
+    return report
 
 
 def task_initialize_templates():
@@ -206,6 +273,17 @@ def task_initialize_templates():
     logger.info('Recommender initialize template functions executed successfully')
 
 
+def task_push_announcements():
+    logger = logging.getLogger("scheduled_tasks.task_push_announcements")
+    if "LOG_LEVEL" in os.environ and not getattr(settings, "QUIET_SCHEDULER", False):
+        logger.setLevel(int(os.environ["LOG_LEVEL"]))
+    else:
+        logger.setLevel(logging.WARNING)
+    logger.info('Pushing announcements to users')
+    created = recommender_functions.get_recommender_by_classname("RM_start").push_announcements()
+    logger.info('{} announcement activities created'.format(created))
+
+
 def task_collect_educational_resources():
     logger = logging.getLogger("scheduled_tasks.task_collect_educational_resources")
     logger.info('Collecting educational resources')
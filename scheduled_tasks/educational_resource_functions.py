@@ -1,17 +1,41 @@
 """
 Functions for collecting educational resources called by cronjob
 """
+import functools
 import hashlib
-from backend.models import Origin, InheritingCourse, WebResource, EducationalResource
+import io
+import logging
+from backend import bulk
+from backend.models import Origin, InheritingCourse, EducationalResource, HarvestState, Activity
 from sickle import Sickle
+from sickle.iterator import OAIResponseIterator
+from sickle.oaiexceptions import BadResumptionToken, NoRecordsMatch
 import xml.etree.ElementTree as ET
 import vobject
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 import requests
 from django.core.exceptions import ImproperlyConfigured
 from urllib.parse import urljoin
 import re
 
+from scheduled_tasks import fetching
+
+logger = logging.getLogger("scheduled_tasks.educational_resource_functions")
+
+# xml namespaces of OAI-PMH responses with LOM metadata
+OAI_NAMESPACES = {"oai": "http://www.openarchives.org/OAI/2.0/",
+                  "lom": "http://ltsc.ieee.org/xsd/LOM"}
+
+# fields of InheritingCourse written by the udemy collector
+UDEMY_FIELDS = ["contributor", "coverage", "creator", "date", "description", "format", "language", "publisher",
+                "source", "subject", "title", "type", "content_hash"]
+
+# fields of EducationalResource written by the OAI-PMH harvester
+HARVESTED_FIELDS = ["oai_identifier", "origin", "contributor", "coverage", "creator", "date", "description", "format",
+                    "language", "publisher", "relation", "rights", "source", "subject", "title", "type"]
+
 FORMAT_CHOICES = []
 for format_choice_index in EducationalResource.FORMAT_CHOICES:
     FORMAT_CHOICES += [format_choice_index[0].casefold()]
@@ -60,6 +84,11 @@ def collect_moocs():
 
 
 def collect_udemy_courses():
+    """
+    Collects the free udemy courses. The pages of the course list are downloaded concurrently, see
+    scheduled_tasks.fetching, while the courses of the downloaded pages are written.
+    :return: Number of created or updated courses.
+    """
     client_dict = settings.MOOC_CLIENTS['UDEMY']
 
     if client_dict['USER'] is None or client_dict['PASSWORD'] is None:
@@ -78,11 +107,13 @@ def collect_udemy_courses():
         'visible_instructors',
         'image_240x135'
     ]
+    page_size = getattr(settings, "MOOC_PAGE_SIZE", 100)
     params = {
         'price': 'price-free',
         'is_affiliate_agreed': False,
         'is_deals_agreed': False,
-        'fields[course]': ','.join(fields)
+        'fields[course]': ','.join(fields),
+        'page_size': page_size,
     }
 
     origin, origin_created = Origin.objects.get_or_create(
@@ -91,123 +122,197 @@ def collect_udemy_courses():
         api_endpoint=client_dict['API_URL']
     )
 
-    while True:
-        response = requests.get(
-            url,
-            auth=(client_dict['USER'], client_dict['PASSWORD']),
-            params=params
-        )
-
-        if response.status_code == 403:
-            raise ImproperlyConfigured("Authentication for udemy client failed. "
-                                       "Please check the configuration in settings.py.")
-
-        if response.status_code != 200:
-            print(f"Could not access udemy API. Failed with status code {response.status_code}")
-            return
-
-        data = response.json()
-
-        # break condition for simulated do-while loop
-        if 'results' not in data.keys() or not data['results']:
-            break
-
-        for c in data['results']:
-            InheritingCourse.objects.update_or_create(
-                identifier=c['id'],
+    n_saved = 0
+    with fetching.create_session(auth=(client_dict['USER'], client_dict['PASSWORD'])) as session:
+        try:
+            data = fetching.get_json(session, url, dict(params, page=1))
+            n_saved += save_udemy_courses(origin, base_url, data.get('results', []))
+            # the remaining pages are known from the number of courses and downloaded while pages are written
+            n_pages = -(-data.get('count', 0) // page_size)
+            with fetching.PageFetcher(session, url, params, range(2, n_pages + 1)) as fetcher:
+                for page, data in fetcher:
+                    n_saved += save_udemy_courses(origin, base_url, data.get('results', []))
+                    logger.debug("udemy page {} of {} saved".format(page, n_pages))
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 403:
+                raise ImproperlyConfigured("Authentication for udemy client failed. "
+                                           "Please check the configuration in settings.py.")
+            logger.error("Could not access udemy API: {}".format(e))
+        except requests.RequestException as e:
+            logger.error("Could not access udemy API: {}".format(e))
+    return n_saved
+
+
+def save_udemy_courses(origin, base_url, courses):
+    """
+    Creates or updates the courses of a page of the udemy course list with one query per table. Courses which did
+    not change since they were saved are skipped.
+    :param origin: Origin of udemy.
+    :param base_url: Base URL of the udemy website.
+    :param courses: List of course dicts returned by the API.
+    :return: Number of created or updated courses.
+    """
+    content_hashes = {bulk.get_content_hash(c): c for c in courses}
+    known_hashes = bulk.get_known_hashes(InheritingCourse.objects.filter(origin=origin), content_hashes.keys())
+    changed = {str(c['id']): (content_hash, c) for content_hash, c in content_hashes.items()
+               if content_hash not in known_hashes}
+    if not changed:
+        return 0
+
+    with transaction.atomic():
+        existing = {course.course_origin_id: course for course in InheritingCourse.objects.filter(
+            origin=origin, course_origin_id__in=changed.keys())}
+        created, updated = [], []
+        for course_origin_id, (content_hash, c) in changed.items():
+            course = existing.get(course_origin_id) or InheritingCourse(
+                identifier=course_origin_id,
                 origin=origin,
-                course_origin_id=c['id'],
-                defaults={
-                    'contributor': [],
-                    'coverage': "",
-                    'creator': c['visible_instructors'],
-                    'date': None,
-                    'description': c['headline'],
-                    'format': ['CRS'],
-                    'language': None,  # TODO
-                    'publisher': origin.name,
-                    'source': urljoin(base_url, c['url']),
-                    'subject': c['curriculum_items'] + c['curriculum_lectures'],
-                    'title': c['title'],
-                    'type': ['udemy', 'mooc']
-                }
+                course_origin_id=course_origin_id,
             )
-
-        url = data['next']
-        if not url:
-            break
-
-        # since the next url already holds the url parameters we can empty the respective variable
-        params = {}
+            course.contributor = []
+            course.coverage = ""
+            course.creator = c['visible_instructors']
+            course.date = None
+            course.description = c['headline']
+            course.format = ['CRS']
+            course.language = None  # TODO
+            course.publisher = origin.name
+            course.source = urljoin(base_url, c['url'])
+            course.subject = c.get('curriculum_items', []) + c.get('curriculum_lectures', [])
+            course.title = c['title']
+            course.type = ['udemy', 'mooc']
+            course.content_hash = content_hash
+            (updated if course_origin_id in existing else created).append(course)
+        bulk.bulk_create_inherited(created)
+        bulk.bulk_update_inherited(updated, UDEMY_FIELDS)
+    return len(changed)
 
 
 def collect_edu_sharing_resources(repository):
-    # Get all resources by using oai service
-    sickle = Sickle(repository + "/edu-sharing/eduservlet/oai/provider")
-    records = sickle.ListRecords(metadataPrefix='lom')
-
-    # xml namespaces
-    ns = {"oai": "http://www.openarchives.org/OAI/2.0/",
-          "lom": "http://ltsc.ieee.org/xsd/LOM"}
-
+    """
+    Harvests the OER of an edu-sharing repository via OAI-PMH. Only records changed since the last completed harvest
+    are requested. The records are written page by page, and the resumption token of the next page is stored with the
+    page, so an interrupted harvest continues where it stopped. Records deleted in the repository are deleted.
+    :param repository: Base URL of the repository, see OER_REPOS.
+    :return: Number of harvested pages.
+    """
     origin, origin_created = Origin.objects.get_or_create(
         name=repository,
         type='edu-sharing_provider',
     )
+    state = HarvestState.objects.get_or_create(origin=origin)[0]
+
+    # the iterator yields the pages, so that they can be written at once together with their resumption token
+    sickle = Sickle(repository + "/edu-sharing/eduservlet/oai/provider", iterator=OAIResponseIterator)
+    if state.resumption_token:
+        logger.info("Continuing harvest of {}".format(repository))
+        arguments = {"resumptionToken": state.resumption_token}
+    else:
+        state.harvest_from = state.datestamp
+        state.harvest_datestamp = None
+        arguments = {"metadataPrefix": "lom"}
+        if state.harvest_from:
+            arguments["from"] = state.harvest_from
+
+    n_pages = 0
+    try:
+        for response in sickle.ListRecords(**arguments):
+            save_edu_sharing_page(origin, state, response.raw)
+            n_pages += 1
+    except BadResumptionToken:
+        logger.warning("Resumption token of {} expired, restarting the harvest".format(repository))
+        state.resumption_token = None
+        state.save()
+        return collect_edu_sharing_resources(repository)
+    except NoRecordsMatch:
+        # nothing changed since the last harvest
+        complete_harvest(state)
+    return n_pages
+
+
+def save_edu_sharing_page(origin, state, raw):
+    """
+    Writes the records of a ListRecords page of an edu-sharing repository and the harvest progress in one transaction.
+    :param origin: Origin of the repository.
+    :param state: HarvestState of the origin.
+    :param raw: XML of the page.
+    """
+    parser = ListRecordsParser(raw)
+    resources = {}
+    deleted = set()
+    for oai_identifier, datestamp, is_deleted, dc in parser:
+        if datestamp and (state.harvest_datestamp is None or datestamp > state.harvest_datestamp):
+            state.harvest_datestamp = datestamp
 
-    for record in records:
-        # Parse LOM-XML
-        root = ET.fromstring(record.raw)
-        header = root.find("oai:header", ns)
-        lom = root.find(".//lom:lom", ns)
+        if is_deleted:
+            deleted.add(oai_identifier)
+            continue
 
-        dc = map_lom_to_dc(lom, ns)
         dc['format'] = process_format_tag(dc)
+        resources[dc["identifier"]] = EducationalResource(
+            identifier=dc["identifier"],
+            oai_identifier=oai_identifier,
+            origin=origin,
+            contributor=dc["contributor"],
+            coverage=dc["coverage"],
+            creator=dc["creator"],
+            date=dc["date"],
+            description=dc["description"],
+            format=dc["format"],
+            language=dc["language"],
+            publisher=dc["publisher"],
+            relation=dc["relation"],
+            rights=dc["rights"],
+            source=dc["source"],
+            subject=dc["subject"],
+            title=dc["title"],
+            type=['OER'],
+        )
+        deleted.discard(oai_identifier)
+
+    with transaction.atomic():
+        existing = {resource.identifier: resource.id for resource in EducationalResource.objects.filter(
+            identifier__in=resources.keys()).only("id", "identifier")}
+        for identifier, resource in resources.items():
+            if identifier in existing:
+                resource.id = existing[identifier]
+        EducationalResource.objects.bulk_update([resource for resource in resources.values() if resource.identifier
+                                                 in existing], fields=HARVESTED_FIELDS)
+        EducationalResource.objects.bulk_create([resource for resource in resources.values() if resource.identifier
+                                                 not in existing])
+        if deleted:
+            delete_resources(EducationalResource.objects.filter(origin=origin, oai_identifier__in=deleted))
+
+        state.resumption_token = parser.resumption_token
+        if state.resumption_token:
+            state.save()
+        else:
+            complete_harvest(state)
+    logger.debug("{}: {} records saved, {} deleted".format(origin.name, len(resources), len(deleted)))
+
+
+def complete_harvest(state):
+    """
+    Stores that a harvest was completed, the next one requests the records changed since its latest datestamp.
+    :param state: HarvestState of the origin.
+    """
+    if state.harvest_datestamp and (state.datestamp is None or state.harvest_datestamp > state.datestamp):
+        state.datestamp = state.harvest_datestamp
+    state.resumption_token = None
+    state.harvest_from = None
+    state.harvest_datestamp = None
+    state.completed = timezone.now()
+    state.save()
 
-        try:
-            EducationalResource.objects.update_or_create(
-                identifier=dc["identifier"],
-                origin=origin,
-                defaults={
-                    "contributor": dc["contributor"],
-                    "coverage": dc["coverage"],
-                    "creator": dc["creator"],
-                    "date": dc["date"],
-                    "description": dc["description"],
-                    "format": dc["format"],
-                    "language": dc["language"],
-                    "publisher": dc["publisher"],
-                    "relation": dc["relation"],
-                    "rights": dc["rights"],
-                    "source": dc["source"],
-                    "subject": dc["subject"],
-                    "title": dc["title"],
-                    "type": ['OER'],
-                }
-            )
-        except WebResource.MultipleObjectsReturned:
-            # Ensure database consistency
-            wrs = WebResource.objects.filter(identifier=dc["identifier"], origin=origin)
-            wr = wrs[0]
-
-            for to_delete in wrs[1:]:
-                to_delete.delete()
-
-            wr.contributor = dc["contributor"]
-            wr.coverage = dc["coverage"]
-            wr.creator = dc["creator"]
-            wr.date = dc["date"]
-            wr.description = dc["description"]
-            wr.format = dc["format"]
-            wr.language = dc["language"]
-            wr.publisher = dc["publisher"]
-            wr.relation = dc["relation"]
-            wr.rights = dc["rights"]
-            wr.source = repository
-            wr.subject = dc["subject"]
-            wr.title = dc["title"]
-            wr.type = ['OER']
-            wr.save()
+
+def delete_resources(resources):
+    """
+    Deletes resources together with the activities recommending them. The activities are deleted before the resources,
+    so that they leave tombstones for clients syncing changes and increment the versions of their goals.
+    :param resources: QuerySet of EducationalResources.
+    """
+    Activity.objects.filter(resource__in=resources).delete()
+    resources.delete()
 
 
 def map_lom_to_dc(lom, ns):
@@ -278,3 +383,185 @@ def extract_name_from_vcard(vcard):
             return v.fn.value
         except AttributeError:
             return ""
+
+
+#: Names extracted from vCards, the same creators and publishers recur in thousands of records.
+get_name_from_vcard = functools.lru_cache(maxsize=4096)(extract_name_from_vcard)
+
+OAI = "{http://www.openarchives.org/OAI/2.0/}"
+LOM = "{http://ltsc.ieee.org/xsd/LOM}"
+#: LangString elements, map_lom_to_dc expects them without namespace, but they are found in the LOM namespace as well.
+STRING = frozenset(["string", LOM + "string"])
+
+
+def first_text(element, *path):
+    """
+    Returns the text of the first descendant at a path of child tags, like findtext.
+    :param element: Element the path starts at.
+    :param path: Tags of the children, or sets of alternative tags.
+    :return: The text, "" if the element has no text, or None if there is no such element.
+    """
+    if not path:
+        return element.text or ""
+    for child in element:
+        if child.tag == path[0] or child.tag in STRING and path[0] is STRING:
+            text = first_text(child, *path[1:])
+            if text is not None:
+                return text
+    return None
+
+
+def all_texts(element, *path):
+    """
+    Returns the texts of all descendants at a path of child tags, like findall.
+    :param element: Element the path starts at.
+    :param path: Tags of the children, or sets of alternative tags.
+    :return: List of texts, which may be None.
+    """
+    if not path:
+        return [element.text]
+    texts = []
+    for child in element:
+        if child.tag == path[0] or child.tag in STRING and path[0] is STRING:
+            texts += all_texts(child, *path[1:])
+    return texts
+
+
+class ListRecordsParser:
+    """
+    Parses a ListRecords page of an OAI-PMH repository with LOM metadata in a single pass with iterparse, and maps the
+    records to Dublin Core like map_lom_to_dc. The fields are read from the sections of a LOM record (general,
+    lifeCycle, ...) as soon as a section ended, each record is released once it was read, and names are extracted
+    from vCards with an LRU cache.
+    """
+
+    def __init__(self, source):
+        """
+        :param source: XML of the page as str or bytes, or a binary file object.
+        """
+        if isinstance(source, str):
+            source = io.StringIO(source)
+        elif isinstance(source, bytes):
+            source = io.BytesIO(source)
+        self.source = source
+        #: Resumption token of the next page, set after the page was read. None or "" on the last page.
+        self.resumption_token = None
+        self.section_readers = {
+            LOM + "general": self.read_general,
+            LOM + "lifeCycle": self.read_life_cycle,
+            LOM + "metaMetadata": self.read_meta_metadata,
+            LOM + "technical": self.read_technical,
+            LOM + "educational": self.read_educational,
+            LOM + "relation": self.read_relation,
+            LOM + "rights": self.read_rights,
+            LOM + "classification": self.read_classification,
+        }
+
+    def __iter__(self):
+        """
+        Yields a tuple of OAI identifier, datestamp, whether the record is deleted and a dict of the Dublin Core fields,
+        which is None for deleted records, per record.
+        """
+        fields = {"taxons": [], "contributor_vcards": []}
+        for _, element in ET.iterparse(self.source):
+            tag = element.tag
+            reader = self.section_readers.get(tag)
+            if reader is not None:
+                reader(element, fields)
+            elif tag == OAI + "record":
+                header = element.find(OAI + "header")
+                deleted = header.get("status") == "deleted"
+                yield (first_text(header, OAI + "identifier"), first_text(header, OAI + "datestamp"), deleted,
+                       None if deleted else self.get_dc(fields))
+                fields = {"taxons": [], "contributor_vcards": []}
+                element.clear()
+            elif tag == OAI + "resumptionToken":
+                self.resumption_token = element.text
+
+    @staticmethod
+    def set_first(fields, field, value):
+        """Sets a field unless it was set by an earlier element or the value is None, like findtext."""
+        if value is not None and field not in fields:
+            fields[field] = value
+
+    def read_general(self, element, fields):
+        self.set_first(fields, "identifier", first_text(element, LOM + "identifier", LOM + "entry"))
+        self.set_first(fields, "title", first_text(element, LOM + "title", STRING))
+        self.set_first(fields, "description", first_text(element, LOM + "description", STRING))
+        self.set_first(fields, "coverage", first_text(element, LOM + "coverage", STRING))
+        self.set_first(fields, "language", first_text(element, LOM + "language"))
+        keyword = element.find(LOM + "keyword")
+        if keyword is not None:
+            self.set_first(fields, "subject", list(keyword.itertext()))
+
+    def read_life_cycle(self, element, fields):
+        for contribute in element.iterfind(LOM + "contribute"):
+            entities = all_texts(contribute, LOM + "entity")
+            fields["contributor_vcards"] += entities
+            if entities and self.has_role(contribute, "publisher"):
+                self.set_first(fields, "publisher_vcard", entities[0] or "")
+            self.set_first(fields, "date", first_text(contribute, LOM + "date"))
+
+    def read_meta_metadata(self, element, fields):
+        for contribute in element.iterfind(LOM + "contribute"):
+            entities = all_texts(contribute, LOM + "entity")
+            if entities and self.has_role(contribute, "creator"):
+                self.set_first(fields, "creator_vcard", entities[0] or "")
+
+    def read_technical(self, element, fields):
+        self.set_first(fields, "format", first_text(element, LOM + "format"))
+        self.set_first(fields, "source", first_text(element, LOM + "location"))
+
+    def read_educational(self, element, fields):
+        learning_resource_type = element.find(LOM + "learningResourceType")
+        if learning_resource_type is not None:
+            self.set_first(fields, "type", list(learning_resource_type.itertext()))
+
+    def read_relation(self, element, fields):
+        self.set_first(fields, "relation", first_text(element, LOM + "resource", LOM + "description", STRING))
+
+    def read_rights(self, element, fields):
+        self.set_first(fields, "rights", first_text(element, LOM + "description", STRING))
+
+    def read_classification(self, element, fields):
+        fields["taxons"] += all_texts(element, LOM + "taxonPath", LOM + "taxon", LOM + "entry", STRING)
+
+    @staticmethod
+    def has_role(contribute, role):
+        """Whether a contribute element has a role element whose text is the role, like [lom:role='creator']."""
+        return any("".join(child.itertext()) == role for child in contribute.iterfind(LOM + "role"))
+
+    @staticmethod
+    def get_dc(fields):
+        """Maps the fields read from a LOM record to Dublin Core, see map_lom_to_dc."""
+        creator = get_name_from_vcard(fields.get("creator_vcard"))
+        contributors = [name for name in map(get_name_from_vcard, fields["contributor_vcards"]) if name]
+        # add creator to list of contributors if not present
+        if creator and creator not in contributors:
+            contributors.append(creator)
+
+        source = fields.get("source")
+        title = fields.get("title")
+        identifier = fields.get("identifier")
+        if identifier is None:
+            identifier = hashlib.sha256((source + title).encode('utf-8')).hexdigest()
+
+        return {
+            "identifier": identifier,
+            "contributor": contributors,
+            # collect taxon if coverage doesn't exist
+            "coverage": fields.get("coverage") or fields["taxons"],
+            "creator": creator,
+            "date": fields.get("date"),
+            "description": fields.get("description"),
+            "format": fields.get("format"),
+            "language": fields.get("language"),
+            "publisher": get_name_from_vcard(fields.get("publisher_vcard")),
+            "relation": fields.get("relation"),
+            "rights": fields.get("rights"),
+            "source": source,
+            "subject": fields.get("subject", []),
+            "title": title,
+            "type": fields.get("type", []),
+        }
+
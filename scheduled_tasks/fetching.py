@@ -0,0 +1,120 @@
+"""
+HTTP helpers for collecting resources from paginated provider APIs, e.g. the udemy course list.
+
+`create_session` returns a session whose connections are pooled and which retries transient errors with exponential
+backoff. `PageFetcher` downloads pages in a thread pool ahead of the consumer, bounded by the concurrency, so the
+calling thread can write one page to the database while the next ones are downloaded.
+"""
+import collections
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger("scheduled_tasks.fetching")
+
+#: Status codes which are retried.
+TRANSIENT_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+def create_session(concurrency=None, retries=None, backoff=None, auth=None):
+    """
+    Creates a session with a connection pool and retries.
+    :param concurrency: Number of pooled connections per host, by default MOOC_FETCH_CONCURRENCY.
+    :param retries: Number of retries of a failed request, by default MOOC_FETCH_RETRIES.
+    :param backoff: Backoff factor in seconds, the n-th retry waits backoff * 2 ** (n - 1) seconds or as long as the
+    Retry-After header demands. By default MOOC_FETCH_BACKOFF.
+    :param auth: Optional authentication of all requests, e.g. a tuple of user and password.
+    :return: requests.Session
+    """
+    concurrency = concurrency or getattr(settings, "MOOC_FETCH_CONCURRENCY", 4)
+    retry = Retry(
+        total=getattr(settings, "MOOC_FETCH_RETRIES", 3) if retries is None else retries,
+        backoff_factor=getattr(settings, "MOOC_FETCH_BACKOFF", 1.0) if backoff is None else backoff,
+        status_forcelist=TRANSIENT_STATUS_CODES,
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = auth
+    return session
+
+
+def get_json(session, url, params):
+    """
+    Requests a JSON document.
+    :param session: Session, see create_session.
+    :param url: URL of the document.
+    :param params: URL parameters.
+    :return: The decoded JSON document.
+    :raises requests.RequestException: if the request failed after all retries.
+    """
+    response = session.get(url, params=params, timeout=getattr(settings, "MOOC_FETCH_TIMEOUT", 30))
+    response.raise_for_status()
+    return response.json()
+
+
+class PageFetcher:
+    """
+    Downloads numbered pages of an API concurrently and yields their JSON documents in order. At most `concurrency`
+    pages are downloaded but not yet consumed. The downloads start when the fetcher is created.
+    """
+
+    def __init__(self, session, url, params, pages, concurrency=None, page_parameter="page"):
+        """
+        :param session: Session, see create_session.
+        :param url: URL of the API route.
+        :param params: URL parameters of all pages.
+        :param pages: Iterable of page numbers.
+        :param concurrency: Number of parallel downloads, by default MOOC_FETCH_CONCURRENCY.
+        :param page_parameter: Name of the URL parameter holding the page number.
+        """
+        self.session = session
+        self.url = url
+        self.params = params
+        self.pages = iter(pages)
+        self.page_parameter = page_parameter
+        concurrency = concurrency or getattr(settings, "MOOC_FETCH_CONCURRENCY", 4)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="PageFetcher")
+        self.pending = collections.deque()
+        for page in itertools.islice(self.pages, concurrency):
+            self.submit(page)
+
+    def submit(self, page):
+        params = dict(self.params, **{self.page_parameter: page})
+        self.pending.append((page, self.executor.submit(get_json, self.session, self.url, params)))
+
+    def __iter__(self):
+        """
+        Yields tuples of page number and JSON document.
+        :raises requests.RequestException: if a page could not be downloaded.
+        """
+        try:
+            while self.pending:
+                page, future = self.pending.popleft()
+                data = future.result()
+                next_page = next(self.pages, None)
+                if next_page is not None:
+                    self.submit(next_page)
+                yield page, data
+        finally:
+            self.close()
+
+    def close(self):
+        """Cancels the downloads which have not started yet and waits for the running ones."""
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,187 @@
+"""
+Leader election between the processes of a deployment, so that the scheduled tasks run in exactly one of them.
+
+`scheduler.start()` is called in every WSGI process. Each process runs a `LeaderElection` thread, which tries to
+acquire a `backend.models.Lease` row every `SCHEDULER_HEARTBEAT_INTERVAL` seconds. The lease is granted for
+`SCHEDULER_LEASE_DURATION` seconds and is renewed by its holder with every heartbeat. All other processes stand by and
+take over once the lease expires, i.e. at most `SCHEDULER_LEASE_DURATION` seconds after the leader died. A process which
+exits regularly releases the lease, so a standby process takes over with its next heartbeat.
+
+Acquiring and renewing is a single conditional UPDATE, which PostgreSQL serializes on the row, and all times are taken
+from the database clock, so clocks of different hosts do not need to be in sync.
+
+Work which only must not run twice at once, but may run in any process, is guarded by PostgreSQL advisory locks
+instead (`try_advisory_lock`). They need no heartbeat, as they are released when the database session ends.
+"""
+import datetime
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Case, DateTimeField, ExpressionWrapper, F, Q, When
+from django.db.models.functions import Now
+
+from backend import models
+
+#: Name of the lease of the process running the scheduled tasks.
+SCHEDULER_LEASE = "scheduler"
+
+logger = logging.getLogger("scheduled_tasks.leader")
+
+_holder_id = "{}:{}:{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+
+
+def get_holder_id():
+    """
+    Returns the identifier of this process as lease holder. It is unique even if process IDs are reused.
+    :return: str
+    """
+    return _holder_id
+
+
+def try_acquire(name, holder, duration):
+    """
+    Acquires a lease if it is free or expired, or renews it if it is already held by the holder.
+    :param name: Name of the lease.
+    :param holder: Identifier of the acquiring process.
+    :param duration: Seconds until the lease expires if it is not renewed.
+    :return: True if the holder holds the lease now.
+    """
+    models.Lease.objects.get_or_create(name=name)
+    expires = ExpressionWrapper(Now() + datetime.timedelta(seconds=duration), output_field=DateTimeField())
+    updated = models.Lease.objects.filter(name=name).filter(
+        Q(holder=holder) | Q(expires__isnull=True) | Q(expires__lt=Now())
+    ).update(
+        holder=holder,
+        acquired=Case(When(holder=holder, then=F("acquired")), default=Now()),
+        renewed=Now(),
+        expires=expires,
+    )
+    return updated == 1
+
+
+def release(name, holder):
+    """
+    Releases a lease, if it is held by the holder, so that another process can acquire it immediately.
+    :param name: Name of the lease.
+    :param holder: Identifier of the releasing process.
+    :return: True if the lease was released.
+    """
+    return models.Lease.objects.filter(name=name, holder=holder).update(holder="", expires=None) == 1
+
+
+def get_advisory_lock_key(name):
+    """
+    Maps a lock name to the 64-bit key of a PostgreSQL advisory lock.
+    :param name: Name of the lock.
+    :return: Signed 64-bit int.
+    """
+    return int.from_bytes(hashlib.sha256(name.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def try_advisory_lock(name):
+    """
+    Acquires a session-level advisory lock on the database connection of the current thread without waiting. The lock
+    is held until advisory_unlock is called or the connection is closed, e.g. because the process died.
+    :param name: Name of the lock.
+    :return: True if the lock was acquired, False if another session holds it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [get_advisory_lock_key(name)])
+        return cursor.fetchone()[0]
+
+
+def advisory_unlock(name):
+    """
+    Releases an advisory lock acquired by try_advisory_lock on the database connection of the current thread.
+    :param name: Name of the lock.
+    :return: True if the lock was held.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [get_advisory_lock_key(name)])
+        return cursor.fetchone()[0]
+
+
+class LeaderElection(threading.Thread):
+    """
+    Thread which keeps trying to acquire a lease and calls on_elected when this process becomes the leader and
+    on_deposed when it loses the lease, e.g. because the database could not be reached to renew it.
+    """
+
+    def __init__(self, name, on_elected, on_deposed, duration=None, interval=None):
+        """
+        :param name: Name of the lease.
+        :param on_elected: Function called without arguments when the lease was acquired.
+        :param on_deposed: Function called without arguments when the lease was lost or released.
+        :param duration: Seconds a lease is granted for, by default SCHEDULER_LEASE_DURATION.
+        :param interval: Seconds between two attempts to acquire or renew the lease, by default
+        SCHEDULER_HEARTBEAT_INTERVAL. Has to be shorter than the duration.
+        """
+        super().__init__(name="LeaderElection-{}".format(name), daemon=True)
+        self.lease_name = name
+        self.holder = get_holder_id()
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.duration = duration or getattr(settings, "SCHEDULER_LEASE_DURATION", 60)
+        self.interval = interval or getattr(settings, "SCHEDULER_HEARTBEAT_INTERVAL", 15)
+        if self.interval >= self.duration:
+            raise ValueError("The heartbeat interval has to be shorter than the lease duration.")
+        self.leading = False
+        self.last_renewal = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def step(self):
+        """
+        Tries to acquire or renew the lease once and calls the callbacks if the leadership changed.
+        :return: True if this process is the leader.
+        """
+        with self.lock:
+            if self.stopped.is_set():
+                return False
+            try:
+                acquired = try_acquire(self.lease_name, self.holder, self.duration)
+                if acquired:
+                    self.last_renewal = time.monotonic()
+            except DatabaseError:
+                logger.exception("Could not renew lease {}".format(self.lease_name))
+                connection.close()
+                # the leader steps down before its lease can expire, as another process may take over then
+                acquired = self.leading and time.monotonic() - self.last_renewal < self.duration - self.interval
+
+            if acquired and not self.leading:
+                logger.info("{} acquired lease {}".format(self.holder, self.lease_name))
+                self.leading = True
+                self.on_elected()
+            elif not acquired and self.leading:
+                logger.warning("{} lost lease {}".format(self.holder, self.lease_name))
+                self.leading = False
+                self.on_deposed()
+            return self.leading
+
+    def run(self):
+        """Renews or acquires the lease every interval until stop() is called."""
+        while not self.stopped.is_set():
+            try:
+                self.step()
+            except Exception:
+                logger.exception("Error in leader election for lease {}".format(self.lease_name))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        """Stops the election and releases the lease if this process is the leader."""
+        self.stopped.set()
+        with self.lock:
+            if self.leading:
+                self.leading = False
+                self.on_deposed()
+                try:
+                    release(self.lease_name, self.holder)
+                except DatabaseError:
+                    logger.exception("Could not release lease {}".format(self.lease_name))
@@ -1,12 +1,15 @@
+import atexit
 import logging, os
 
 from apscheduler.schedulers.background import BackgroundScheduler
+from scheduled_tasks import leader
 from scheduled_tasks.db_tasks import add_jobs
 
 from django.conf import settings
 
 
 scheduler = BackgroundScheduler(settings.SCHEDULER_CONFIG, timezone=settings.TIME_ZONE)
+election = None
 
 
 def start():
@@ -19,6 +22,8 @@ def start():
     Note that there MAY still be issues in productive settings, because the scheduler will be multithreaded, and "if each worker process ends up running its own
     scheduler then this could result in jobs being missed or executed multiple times, as well as duplicate entries in the DjangoJobExecution tables being created."
     (see https://github.com/jcass77/django-apscheduler#quick-start, https://stackoverflow.com/questions/65989475/configure-django-apscheduler-with-apache-mod-wsgi/67160634#67160634)
+    Therefore the processes elect a leader (see scheduled_tasks.leader), only the leader runs the jobs while the others stand by
+    and take over if the leader dies. Set `SCHEDULER_LEADER_ELECTION = False` if only a single process is started anyway.
     If you DON'T want to start the scheduler automatically, make sure to set `SCHEDULER_AUTOSTART = False` in the settings.py. In that case you'd have to manually run
     the command at backend.management.commands.runapscheduler.Command.
     """
@@ -31,6 +36,35 @@ def start():
             logger.setLevel(logging.WARNING)
         logger.debug("Scheduling all tasks")
 
-    add_jobs(scheduler=scheduler)
-    logger.info("starting scheduler")
-    scheduler.start()
+    if getattr(settings, "SCHEDULER_LEADER_ELECTION", True):
+        global election
+        election = leader.LeaderElection(leader.SCHEDULER_LEASE, on_elected=run_jobs, on_deposed=pause_jobs)
+        atexit.register(election.stop)
+        logger.info("starting leader election, the scheduler runs once this process holds the lease")
+        election.start()
+    else:
+        run_jobs()
+
+
+def run_jobs(scheduler=scheduler):
+    """
+    Starts the scheduler, or resumes it if this process was the leader before.
+    :param scheduler: APScheduler scheduler instance.
+    """
+    logger = logging.getLogger("apscheduler")
+    if scheduler.running:
+        logger.info("resuming scheduler")
+        scheduler.resume()
+    else:
+        add_jobs(scheduler=scheduler)
+        logger.info("starting scheduler")
+        scheduler.start()
+
+
+def pause_jobs(scheduler=scheduler):
+    """
+    Pauses the scheduler when this process is no longer the leader. Jobs which are already running are not interrupted.
+    :param scheduler: APScheduler scheduler instance.
+    """
+    logging.getLogger("apscheduler").info("pausing scheduler")
+    scheduler.pause()
@@ -105,6 +105,7 @@ INSTALLED_APPS = [
 MIGRATION_MODULES = {'bert_app':None}
 
 MIDDLEWARE = [
+    'backend.request_metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -147,6 +148,26 @@ DATABASES = {
     }
 }
 
+# Serialized goals and activities are cached as fragments, see backend/fragment_cache.py.
+# The fragment cache is read once per goal, so its backend must not cost a database query per key. The memory cache is
+# kept per process; to share fragments between processes, configure a memcached or Redis cache instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'siddata_fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    },
+}
+FRAGMENT_CACHE = 'fragments'
+# Seconds until a cached fragment expires. Bounds staleness of included resources, persons and questions, which do
+# not have a version of their own.
+FRAGMENT_CACHE_TIMEOUT = 3600
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -183,6 +204,15 @@ MOOC_CLIENTS = {
     }
 }
 
+# Collection of MOOC providers, see scheduled_tasks/fetching.py: number of pages downloaded in parallel, retries of
+# transient errors with a backoff of MOOC_FETCH_BACKOFF * 2 ** (n - 1) seconds, request timeout in seconds and number
+# of courses per page.
+MOOC_FETCH_CONCURRENCY = 4
+MOOC_FETCH_RETRIES = 3
+MOOC_FETCH_BACKOFF = 1.0
+MOOC_FETCH_TIMEOUT = 30
+MOOC_PAGE_SIZE = 100
+
 # OER Repositories
 OER_REPOS = {
     'TWILLO': {
@@ -317,6 +347,71 @@ SCHEDULER_CONFIG = {
     },
 }
 SCHEDULER_AUTOSTART = True
+# Only the process holding the scheduler lease runs the scheduled tasks, see scheduled_tasks/leader.py. The leader renews
+# the lease every SCHEDULER_HEARTBEAT_INTERVAL seconds, another process takes over SCHEDULER_LEASE_DURATION seconds after
+# the last renewal.
+SCHEDULER_LEADER_ELECTION = True
+SCHEDULER_LEASE_DURATION = 60
+SCHEDULER_HEARTBEAT_INTERVAL = 15
+
+# If True, side effects of activity PATCH requests are executed by a worker (`python manage.py runworker`) and the
+# request returns a job reference immediately. Can be overridden per request with the URL parameter `deferred`.
+DEFER_ACTIVITY_PROCESSING = False
+
+# Background task queue, see backend/task_queue.py. A worker claims a task for TASK_VISIBILITY_TIMEOUT seconds and extends
+# the claim while it runs, the task of a crashed worker is started again after that time. Failed tasks are retried up to
+# TASK_MAX_ATTEMPTS times, after TASK_RETRY_DELAY seconds which are doubled with every attempt.
+TASK_VISIBILITY_TIMEOUT = 300
+TASK_MAX_ATTEMPTS = 3
+TASK_RETRY_DELAY = 60
+# If True, the scheduler only enqueues long-running jobs (classification, harvesting, export, ...) and a worker
+# (`python manage.py runworker`) executes them. Only enable it if a worker runs, otherwise these jobs never execute.
+SCHEDULER_ENQUEUE_TASKS = False
+
+# The cron functions of the recommenders run concurrently, at most RECOMMENDER_CRON_CONCURRENCY at once. A recommender
+# which takes longer than RECOMMENDER_CRON_TIMEOUT seconds is reported and no longer waited for.
+RECOMMENDER_CRON_CONCURRENCY = 4
+RECOMMENDER_CRON_TIMEOUT = 3600
+
+# Number of objects the ingestion routes (course, event, person, ...) parse and write at once. Bounds the memory used by
+# large uploads.
+INGESTION_CHUNK_SIZE = 500
+
+# Largest page[size] accepted by paginated GET routes, e.g. course.
+MAX_PAGE_SIZE = 1000
+
+# Number of rows fetched from the database at once when a GET route streams its response, e.g. course?stream=true.
+STREAM_CHUNK_SIZE = 500
+
+# Number of users created in one transaction by the provisioning route and the provisionusers command.
+PROVISIONING_BATCH_SIZE = 100
+
+# Share of requests measured by backend.request_metrics.RequestMetricsMiddleware, between 0.0 and 1.0.
+REQUEST_METRICS_SAMPLE_RATE = 0.1
+if sys.argv[1:2] == ["test"]:
+    # requests of the test suite are not measured, tests measuring requests enable it with override_settings
+    REQUEST_METRICS_SAMPLE_RATE = 0.0
+# Measured requests are written to RequestLog in bulk, whenever this number of requests or seconds is reached.
+REQUEST_LOG_BUFFER_SIZE = 100
+REQUEST_LOG_FLUSH_INTERVAL = 60
+# If set, the route api/metrics requires this bearer token.
+METRICS_TOKEN = None
+
+# Maximal width and height of the person image thumbnails served by the route api/image/<hash>.
+PERSON_THUMBNAIL_SIZE = (240, 240)
+
+# Uploaded person images larger than this number of bytes or pixels are rejected. The pixel count is checked before an
+# image is decoded, so compressed images which would expand to huge bitmaps are rejected as well.
+PERSON_IMAGE_MAX_BYTES = 5 * 1024 * 1024
+PERSON_IMAGE_MAX_PIXELS = 4096 * 4096
+
+# If True, SidBERT is replaced by the deterministic fake predictor in bert_app/fake_predictor.py, e.g. for load tests
+# on machines without the model checkpoint. DDC labels are meaningless then.
+SIDBERT_FAKE = False
+
+# The professions recommender matches resources against the interests only PROFESSIONS_LABEL_LAG seconds after they
+# were labeled, so that the labeling transactions have committed. Must exceed the duration of a labeling transaction.
+PROFESSIONS_LABEL_LAG = 300
 
 HAYSTACK_CONNECTIONS = {
     'default': {